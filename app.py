@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 import pandas as pd
 from PIL import Image
 import requests
@@ -6,17 +6,33 @@ from io import BytesIO
 import logging
 import os
 import torch
-from models import model, processor
-from models import model_fc, processor_fc
+from models import registry, device
 from inputs import clothing_types, occasions, seasons, materials, compatibility_prompts
 from outfit_analyzer import OutfitCompatibilityAnalyzer  # Ensure this class is correctly implemented
-from utils import classify_image_clip
+from utils import classify_images_clip
+from label_bank import label_bank, model_name, labels_hash
+from item_store import ItemStore
+from inference import RequestMemoryTracker, inference_context, memory_breakdown
+from executor import InferenceExecutor
+from image_cache import ImageCache, normalize_url
+from jobs import Job, JobManager, JobStore, image_set_key
 import traceback
-from typing import List, Dict, Union, Optional
+from typing import Callable, List, Dict, Union, Optional
 import re
-import tempfile
+import hashlib
 import asyncio
-import aiohttp
+import atexit
+import contextvars
+import functools
+import json
+import queue
+import threading
+import time
+from downloader import ImageDownloader, DownloadError
+from retrieval import WardrobeRetriever
+from compute_budget import ComputeBudget, is_fallback_score
+import telemetry
+from telemetry import observe_cache, span
 
 app = Flask(__name__)
 
@@ -31,13 +47,169 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model.to(device)
-# processor.to(device)
-model_fc.to(device)
-# processor_fc.to(device)
-image_folder = os.path.join(os.getcwd(), "Images")
+label_sets = (clothing_types, occasions, seasons, materials)
+
+# Reported by /ready; set once warm_up_models has run an inference through every warmed-up model
+readiness = {"ready": False, "models": [], "warmed_up_at": None}
+
+def warm_up_models(names: List[str]) -> None:
+    """
+    Loads the named registry models, builds (or loads from files/embeddings) their label embeddings
+    and runs one image through each CLIP model, then marks the process ready.
+    """
+    registry.preload(names)
+    for name in names:
+        if name in ("clip", "fashion_clip"):
+            model, processor = registry.get(name)
+            label_bank.get(processor, model, label_sets, device=device)
+            image_inputs = processor(images=Image.new("RGB", (224, 224), "white"), return_tensors="pt").to(device)
+            with inference_context(device):
+                model.get_image_features(**image_inputs)
+    readiness.update(ready=True, models=list(names), warmed_up_at=time.time())
+    logger.info(f"Warm-up finished for {names}")
+
+def preload_model_names(preload_models: str) -> List[str]:
+    return list(registry.report()) if preload_models == "all" else [name.strip() for name in preload_models.split(",")]
+
+# Models load lazily on first use; PRELOAD_MODELS ("all" or e.g. "clip,fashion_clip") loads them at startup
+preload_models = os.environ.get("PRELOAD_MODELS", "").strip()
+if preload_models:
+    warm_up_models(preload_model_names(preload_models))
+image_folder = os.environ.get("IMAGE_FOLDER") or os.path.join(os.getcwd(), "Images")
 csv_file = os.path.join(os.getcwd(), "files")
+# Created at import so every entry point (app.py, serve.py) has them
+os.makedirs(image_folder, exist_ok=True)
+os.makedirs(csv_file, exist_ok=True)
+classify_batch_size = int(os.environ.get("CLASSIFY_BATCH_SIZE", "16"))
+# "pairwise" (combined image per pair) or "embedding" (item and prompt embeddings computed once)
+outfit_scoring_mode = os.environ.get("OUTFIT_SCORING_MODE", "pairwise")
+# Beam width and tie-break seed of the top+bottom+footwear outfit search
+outfit_beam_width = int(os.environ.get("OUTFIT_BEAM_WIDTH", "4"))
+outfit_search_seed = int(os.environ.get("OUTFIT_SEARCH_SEED", "0"))
+# Default compute budget of outfit scoring per request (0 = unlimited); a request's "budget" object can override
+# each limit. Past it, scores come from item embeddings or color harmony and the result is flagged "partial".
+outfit_max_pair_evaluations = int(os.environ.get("OUTFIT_MAX_PAIR_EVALUATIONS", "0"))
+outfit_max_prompts = int(os.environ.get("OUTFIT_MAX_PROMPTS", "0"))
+outfit_deadline_seconds = float(os.environ.get("OUTFIT_DEADLINE_SECONDS", "0"))
+# Thread pool that model work is submitted to, so async handlers never block their event loop on inference.
+# Workers blocked on the models' micro-batchers are what lets calls from concurrent requests share a forward pass.
+inference_executor = InferenceExecutor(max_workers=int(os.environ.get("INFERENCE_WORKERS", "4")))
+# New /process_images requests get a 503 once this many jobs wait for an inference worker. This is the only
+# load-shedding signal: work queues here, in front of the INFERENCE_WORKERS threads, and the model
+# micro-batchers behind them never hold more than one job per worker
+inference_max_backlog = int(os.environ.get("INFERENCE_MAX_BACKLOG", "64"))
+# Decoded images shared by download, classification and compatibility scoring
+image_cache = ImageCache(
+    max_bytes=int(os.environ.get("IMAGE_CACHE_MB", "256")) * 1024 * 1024,
+    disk_dir=os.environ.get("IMAGE_CACHE_DIR") or None,
+    revalidate_after=int(os.environ.get("IMAGE_REVALIDATE_SECONDS", "3600"))
+)
+# One pooled HTTP client per process: bounded concurrency, streamed size limit, retries for transient errors
+image_downloader = ImageDownloader(
+    max_concurrency=int(os.environ.get("DOWNLOAD_CONCURRENCY", "16")),
+    limit_per_host=int(os.environ.get("DOWNLOAD_CONNECTIONS_PER_HOST", "8")),
+    max_bytes=int(os.environ.get("DOWNLOAD_MAX_MB", "20")) * 1024 * 1024,
+    timeout=int(os.environ.get("DOWNLOAD_TIMEOUT", "60")),
+    retries=int(os.environ.get("DOWNLOAD_RETRIES", "3"))
+)
+atexit.register(image_downloader.close)
+# Classification results keyed by image content hash, so resubmitted items skip the models
+item_store = ItemStore(os.environ.get("ITEM_STORE_PATH", os.path.join(csv_file, "items.sqlite3")))
+
+def item_model_key(model) -> str:
+    """Store key for a model's classifications; changes whenever the label lists in inputs.py change."""
+    return f"{model_name(model)}:{labels_hash(label_sets)}"
+
+def request_budget(overrides=None, deadline: bool = True) -> ComputeBudget:
+    """Compute budget for one request, started now; background jobs pass deadline=False to skip the default deadline."""
+    return ComputeBudget.from_request(
+        overrides,
+        max_pair_evaluations=outfit_max_pair_evaluations,
+        max_prompts=outfit_max_prompts,
+        deadline_seconds=outfit_deadline_seconds if deadline else None
+    )
+
+budget_error = ("'budget' must be an object whose max_pair_evaluations, max_prompts and deadline_seconds are "
+                "finite numbers >= 0; they can only lower the server's limits")
+
+def image_content_hash(url: str, image: Image.Image) -> str:
+    """Content hash of a downloaded image, taken from the image cache when available."""
+    entry = image_cache.get(normalize_firebase_url(url))
+    if entry is not None:
+        return entry.content_hash
+    return hashlib.sha256(image.tobytes()).hexdigest()
+
+def classify_with_store(images: List[Image.Image], content_hashes: List[str], names: List[str], processor, model) -> List[tuple]:
+    """Classifies images, reusing stored results for content hashes already classified by the same model and labels."""
+    model_key = item_model_key(model)
+    try:
+        stored = item_store.get_many(content_hashes, model_key)
+    except Exception as e:
+        logger.warning(f"Item store lookup failed: {str(e)}")
+        stored = {}
+
+    classifications = [None] * len(images)
+    missing = []
+    for index, content_hash in enumerate(content_hashes):
+        item = stored.get(content_hash)
+        # Rows without an embedding (imported from the legacy CSV) are classified again to get one
+        if item is None or item["embedding"] is None:
+            missing.append(index)
+            continue
+        classifications[index] = (
+            item["clothing_type"], item["category"], item["occasion"],
+            item["season"], item["material"], item["dominant_color"]
+        )
+    observe_cache("item_store", "hit", len(images) - len(missing))
+    observe_cache("item_store", "miss", len(missing))
+    logger.info(f"Item store: {len(images) - len(missing)} of {len(images)} items already classified")
+
+    if missing:
+        new_results, embeddings = classify_images_clip(
+            [images[index] for index in missing], processor, model,
+            clothing_types, occasions, seasons, materials,
+            device=device, batch_size=classify_batch_size, return_embeddings=True
+        )
+        new_items = []
+        for index, classification, embedding in zip(missing, new_results, embeddings):
+            classifications[index] = classification
+            if classification[0] is None:
+                continue
+            clothing_type, category, occasion, season, material, dominant_color = classification
+            new_items.append({
+                "content_hash": content_hashes[index],
+                "image_name": names[index],
+                "clothing_type": clothing_type,
+                "category": category,
+                "occasion": occasion,
+                "season": season,
+                "material": material,
+                "dominant_color": str(dominant_color),
+                "embedding": embedding
+            })
+        try:
+            item_store.put_many(new_items, model_key)
+        except Exception as e:
+            logger.warning(f"Item store write failed: {str(e)}")
+    return classifications
+
+# Vector indexes over the stored item embeddings (one per model), for matching items against the whole wardrobe
+vector_index_dir = os.environ.get("VECTOR_INDEX_DIR", os.path.join(csv_file, "index"))
+vector_index_ivf_min_size = int(os.environ.get("VECTOR_INDEX_IVF_MIN_SIZE", "2048"))
+vector_index_nprobe = int(os.environ.get("VECTOR_INDEX_NPROBE", "16"))
+retrieval_candidates = int(os.environ.get("RETRIEVAL_CANDIDATES", "50"))
+wardrobe_retrievers: Dict[str, WardrobeRetriever] = {}
+wardrobe_retrievers_lock = threading.Lock()
+
+def wardrobe_retriever(processor, model) -> WardrobeRetriever:
+    model_key = item_model_key(model)
+    with wardrobe_retrievers_lock:
+        if model_key not in wardrobe_retrievers:
+            wardrobe_retrievers[model_key] = WardrobeRetriever(
+                item_store, model_key, processor, model, compatibility_prompts,
+                index_dir=vector_index_dir, ivf_min_size=vector_index_ivf_min_size, nprobe=vector_index_nprobe
+            )
+        return wardrobe_retrievers[model_key]
 
 def normalize_firebase_url(url: str) -> str:
     """Normalize Firebase Storage URLs to consistent format."""
@@ -60,31 +232,105 @@ def validate_image_url(url: str) -> bool:
     return (url.startswith(('http://', 'https://')) and
             any(url.lower().endswith(ext) for ext in supported_extensions))
 
-async def download_image_async(session: aiohttp.ClientSession, url: str) -> Optional[Image.Image]:
-    """Asynchronously download and validate an image from URL."""
+def validate_image_dimensions(image: Image.Image) -> None:
+    if image.width < 50 or image.height < 50:
+        raise ValueError("Image dimensions too small")
+
+async def download_image_async(url: str) -> Optional[Image.Image]:
+    """Download and validate an image from URL through the shared image cache and pooled download client."""
     try:
         url = normalize_firebase_url(url)
         if not validate_image_url(url):
             raise ValueError(f"Invalid URL format: {url}")
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        async with session.get(url, headers=headers, timeout=60) as response:
-            response.raise_for_status()
-            content_type = response.headers.get('Content-Type', '')
-            if not (content_type.startswith('image/') or
-                    'octet-stream' in content_type or
-                    'application/octet-stream' in content_type):
-                raise ValueError(f"Invalid content type: {content_type}")
-            content = await response.read()
-            image = Image.open(BytesIO(content))
-            if image.width < 50 or image.height < 50:
-                raise ValueError("Image dimensions too small")
-            return image
+        cached = image_cache.get(url)
+        if cached is not None and image_cache.is_fresh(cached):
+            observe_cache("image", "hit")
+            validate_image_dimensions(cached.image)
+            return cached.image
+        try:
+            with span("download", items=1):
+                result = await image_downloader.fetch(
+                    url,
+                    etag=cached.etag if cached else None,
+                    last_modified=cached.last_modified if cached else None
+                )
+        except DownloadError as e:
+            if cached is None or not e.transient:
+                observe_cache("image", "miss")
+                raise
+            # Origin unreachable: serve the stale copy rather than failing the item
+            logger.warning(f"Revalidation of {url} failed, using cached copy: {str(e)}")
+            observe_cache("image", "stale")
+            validate_image_dimensions(cached.image)
+            return cached.image
+        if result.not_modified and cached is not None:
+            observe_cache("image", "revalidated")
+            image_cache.mark_validated(cached)
+            validate_image_dimensions(cached.image)
+            return cached.image
+        observe_cache("image", "miss")
+        with span("decode", items=1):
+            entry = image_cache.put(url, result.content, etag=result.etag, last_modified=result.last_modified)
+        validate_image_dimensions(entry.image)
+        return entry.image
     except Exception as e:
-        logger.error(f"Failed to download image {url}: {str(e)}", exc_info=True)
+        logger.error(f"Failed to download image {url}: {str(e)}", exc_info=not isinstance(e, (DownloadError, ValueError)))
         return None
 
-async def classify_and_analyze_url_async(image_urls: List[str], processor, model, clothing_types, occasions, seasons, materials, device, compatibility_prompts) -> Dict[str, Union[List, Dict, str, bool, None]]:
-    """Classify images from URLs and analyze outfit compatibility asynchronously."""
+def format_outfit_combinations(best_outfits: List[tuple]) -> Dict[str, list]:
+    """Maps each recommended item's image path to the image paths it is paired with."""
+    outfit_combinations = {}
+    for item, matches in best_outfits:
+        try:
+            item_url = item.get('image_path', '') if isinstance(item, dict) else getattr(item, 'image_path', '')
+            if not item_url:
+                continue
+
+            if matches is None:
+                outfit_combinations[item_url] = []
+            elif isinstance(matches[0], tuple) and len(matches[0]) == 2:
+                second_item, score = matches[0]
+                second_url = second_item.get('image_path', '') if isinstance(second_item, dict) else getattr(second_item, 'image_path', '')
+                if item.get('Category', '') in ['Dress', 'Footwear']:
+                    outfit_combinations[item_url] = [second_url] if second_url else []
+                else:
+                    outfit_combinations[item_url] = [
+                        match[0].get('image_path', '') if isinstance(match[0], dict)
+                        else getattr(match[0], 'image_path', '')
+                        for match in (matches or []) if match and match[0]
+                    ]
+            elif isinstance(matches[0], tuple) and len(matches[0]) == 3:
+                outfit_combinations[item_url] = [
+                    [
+                        match[0].get('image_path', ''),  # bottom
+                        match[1].get('image_path', '')   # footwear
+                    ] for match in matches
+                ]
+
+        except Exception as e:
+            logger.warning(f"Failed to process outfit combination: {str(e)}")
+            continue
+    return outfit_combinations
+
+def degraded_outfit_combinations(best_outfits: List[tuple]) -> Dict[str, list]:
+    """The entries of format_outfit_combinations whose scores came from a fallback signal after the budget ran out."""
+    degraded = []
+    for item, matches in best_outfits:
+        if not matches:
+            continue
+        if item.get('Category', '') in ['Dress', 'Footwear'] and len(matches[0]) == 2:
+            matches = matches[:1]  # only the best match is reported for dresses
+        matches = [match for match in matches if is_fallback_score(match[-1])]
+        if matches:
+            degraded.append((item, matches))
+    return format_outfit_combinations(degraded)
+
+async def classify_and_analyze_url_async(image_urls: List[str], processor, model, clothing_types, occasions, seasons, materials, device, compatibility_prompts, on_event: Optional[Callable[[Dict], None]] = None, budget: Optional[ComputeBudget] = None) -> Dict[str, Union[List, Dict, str, bool, None]]:
+    """
+    Classify images from URLs and analyze outfit compatibility asynchronously.
+    If on_event is given, it is called with each classification, error and per-occasion outfit event as it happens.
+    budget bounds the outfit scoring (default: request_budget() started now).
+    """
     results = []
     analyzed_items = []
     errors = []
@@ -92,73 +338,93 @@ async def classify_and_analyze_url_async(image_urls: List[str], processor, model
     if not image_urls:
         return {"error": "No image URLs provided", "success": False}
 
-    async with aiohttp.ClientSession() as session:
-        async def process_single_url(session, url):
-            try:
-                if not validate_image_url(url):
-                    raise ValueError(f"Invalid image URL format: {url}")
+    budget = budget or request_budget()
+    emit = on_event or (lambda event: None)
+    emit({"type": "start", "images": len(image_urls)})
+    # When streaming, every image is classified on its own so it can be sent as soon as it is done;
+    # the models' micro-batchers still merge the concurrent forwards
+    batch_size = 1 if on_event else classify_batch_size
 
-                image = await download_image_async(session, url)
-                if not image:
-                    raise ValueError("Failed to download image")
+    def record_error(error_msg):
+        errors.append(error_msg)
+        emit({"type": "error", "error": error_msg})
 
-                img_byte_arr = BytesIO()
-                image.save(img_byte_arr, format="JPEG", quality=85)
-                img_byte_arr.seek(0)
-                image_bytes = img_byte_arr.read() # Read the bytes here
+    async def classify_batch(batch):
+        # Runs on the inference executor while later downloads are still in flight
+        classifications = await inference_executor.run(
+            "classification", classify_with_store,
+            [image for _, _, image in batch],
+            [image_content_hash(url, image) for _, url, image in batch],
+            [url for _, url, _ in batch],
+            processor, model
+        )
+        classified = []
+        for (index, url, _), classification in zip(batch, classifications):
+            if not classification or classification[0] is None:
+                error_msg = f"Processing error for {url}: Invalid classification results"
+                logger.error(error_msg)
+                record_error(error_msg)
+                continue
 
-                tmp_file = None
-                temp_file_path = None
-                try:
-                    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tf:
-                        tmp_file = tf
-                        tmp_file.write(image_bytes) # Now writing the pre-read bytes
-                        temp_file_path = tmp_file.name
-
-                    classification = classify_image_clip(
-                        temp_file_path, processor, model,
-                        clothing_types, occasions, seasons, materials, device=device
-                    )
+            clothing_type, category, occasion, season, material, dominant_color = classification
+            item_data = {
+                "image_url": url,
+                "image_path": url,
+                "Clothing_Type": clothing_type,
+                "Category": category,
+                "Occasion": occasion or 'Casual',
+                "Season": season,
+                "Material": material,
+                "Dominant_Color": str(dominant_color)
+            }
+            emit({"type": "classification", "index": index, "item": item_data})
+            classified.append((index, item_data))
+        return classified
 
-                    if not classification or len(classification) != 6:
-                        raise ValueError("Invalid classification results")
+    batch_tasks = []
 
-                    clothing_type, category, occasion, season, material, dominant_color = classification
+    def submit_batch(batch):
+        batch_tasks.append(asyncio.ensure_future(classify_batch(batch)))
 
-                    item_data = {
-                        "image_url": url,
-                        "image_path": url,
-                        "Clothing_Type": clothing_type,
-                        "Category": category,
-                        "Occasion": occasion or 'Casual',
-                        "Season": season,
-                        "Material": material,
-                        "Dominant_Color": str(dominant_color)
-                    }
-                    return item_data, None
-                finally:
-                    if tmp_file:
-                        tmp_file.close()
-                    if temp_file_path and os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
-            except ValueError as ve:
-                error_msg = f"Processing error for {url}: {str(ve)}"
-                logger.error(error_msg)
-                return None, error_msg
-            except Exception as e:
-                error_msg = f"Failed to process {url}: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                return None, error_msg
+    # Downloads share the process-wide client, whose semaphore bounds how many run at once
+    async def download_single_url(index, url):
+        try:
+            if not validate_image_url(url):
+                raise ValueError(f"Invalid image URL format: {url}")
 
-        tasks = [process_single_url(session, url) for url in image_urls]
-        processing_results = await asyncio.gather(*tasks)
+            image = await download_image_async(url)
+            if not image:
+                raise ValueError("Failed to download image")
+            return index, url, image, None
+        except ValueError as ve:
+            error_msg = f"Processing error for {url}: {str(ve)}"
+            logger.error(error_msg)
+            return index, url, None, error_msg
+        except Exception as e:
+            error_msg = f"Failed to process {url}: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            return index, url, None, error_msg
 
-    for item_data, error in processing_results:
-        if item_data:
-            results.append(item_data)
-            analyzed_items.append(item_data)
+    tasks = [download_single_url(index, url) for index, url in enumerate(image_urls)]
+    batch = []
+    for next_download in asyncio.as_completed(tasks):
+        index, url, image, error = await next_download
         if error:
-            errors.append(error)
+            record_error(error)
+            continue
+        batch.append((index, url, image))
+        if len(batch) >= batch_size:
+            submit_batch(batch)
+            batch = []
+    if batch:
+        submit_batch(batch)
+
+    classified = []
+    for task in batch_tasks:
+        classified.extend(await task)
+    classified.sort(key=lambda entry: entry[0])  # keep the request's URL order
+    results = [item_data for _, item_data in classified]
+    analyzed_items = list(results)
 
     if not analyzed_items:
         return {
@@ -185,7 +451,13 @@ async def classify_and_analyze_url_async(image_urls: List[str], processor, model
             clip_processor=processor,
             clip_model=model,
             compatibility_prompts=compatibility_prompts,
-            image_download_function=download_image_async
+            image_download_function=download_image_async,
+            scoring_mode=outfit_scoring_mode,
+            image_cache=image_cache,
+            search_beam_width=outfit_beam_width,
+            search_seed=outfit_search_seed,
+            inference_executor=inference_executor,
+            budget=budget
         )
 
         all_occasions = current_df['Occasion'].unique().tolist()
@@ -196,6 +468,7 @@ async def classify_and_analyze_url_async(image_urls: List[str], processor, model
                 occasion_outfits = await analyzer.find_best_matches(occasion)
                 if occasion_outfits:
                     best_outfits.extend(occasion_outfits)
+                    emit({"type": "outfits", "occasion": occasion, "outfit_combinations": format_outfit_combinations(occasion_outfits)})
             except Exception as e:
                 logger.warning(f"Failed to find matches for occasion {occasion}: {str(e)}")
                 continue
@@ -203,43 +476,19 @@ async def classify_and_analyze_url_async(image_urls: List[str], processor, model
         if not best_outfits:
             logger.info("No occasion-specific outfits found, trying generic matching")
             best_outfits = await analyzer.find_best_matches(None) or []
+            if best_outfits:
+                emit({"type": "outfits", "occasion": None, "outfit_combinations": format_outfit_combinations(best_outfits)})
+        logger.info(f"Score cache: {analyzer.score_cache_stats()}")
 
-        outfit_combinations = {}
-        for item, matches in best_outfits:
-            try:
-                item_url = item.get('image_path', '') if isinstance(item, dict) else getattr(item, 'image_path', '')
-                if not item_url:
-                    continue
-
-                if matches is None:
-                    outfit_combinations[item_url] = []
-                elif isinstance(matches[0], tuple) and len(matches[0]) == 2:
-                    second_item, score = matches[0]
-                    second_url = second_item.get('image_path', '') if isinstance(second_item, dict) else getattr(second_item, 'image_path', '')
-                    if item.get('Category', '') in ['Dress', 'Footwear']:
-                        outfit_combinations[item_url] = [second_url] if second_url else []
-                    else:
-                        outfit_combinations[item_url] = [
-                            match[0].get('image_path', '') if isinstance(match[0], dict)
-                            else getattr(match[0], 'image_path', '')
-                            for match in (matches or []) if match and match[0]
-                        ]
-                elif isinstance(matches[0], tuple) and len(matches[0]) == 3:
-                    outfit_combinations[item_url] = [
-                        [
-                            match[0].get('image_path', ''),  # bottom
-                            match[1].get('image_path', '')   # footwear
-                        ] for match in matches
-                    ]
-
-            except Exception as e:
-                logger.warning(f"Failed to process outfit combination: {str(e)}")
-                continue
+        outfit_combinations = format_outfit_combinations(best_outfits)
 
         return {
             "classification": results,
             "outfit_combinations": outfit_combinations,
             "errors": errors if errors else None,
+            "partial": budget.partial,
+            "degraded_combinations": degraded_outfit_combinations(best_outfits),
+            "budget": budget.stats(),
             "success": True
         }
 
@@ -252,19 +501,22 @@ async def classify_and_analyze_url_async(image_urls: List[str], processor, model
             "success": False
         }
 
-def classify_and_analyze_local(images: List[Dict]) -> Dict:
+async def classify_and_analyze_local(images: List[Dict], budget: Optional[ComputeBudget] = None) -> Dict:
     """Classify local images and analyze outfit compatibility."""
+    budget = budget or request_budget()
     results = []
     analyzed_items = []
     errors = []
     local_image_paths = []
 
+    loaded_images = []
     for image_data in images:
         image_path = os.path.join(image_folder, image_data['filename'])
         local_image_paths.append(image_path)
         try:
-            image = Image.open(image_path)
-            image.save(image_path)
+            with open(image_path, "rb") as f:
+                entry = image_cache.put(image_path, f.read())
+            loaded_images.append((image_data, image_path, entry.image, entry.content_hash))
         except FileNotFoundError:
             logger.error(f"Image not found: {image_path}")
             errors.append(f"Image not found: {image_data['filename']}")
@@ -274,28 +526,36 @@ def classify_and_analyze_local(images: List[Dict]) -> Dict:
             errors.append(f"Error opening image {image_data['filename']}: {e}")
             continue
 
-        try:
-            clothing_type, category, occasion, season, material, dominant_color = classify_image_clip(
-                image_path, processor_fc, model_fc, clothing_types, occasions, seasons, materials, device=device
-            )
+    # Classify every new upload in a few batched forward passes; known images come from the item store
+    model_fc, processor_fc = registry.get("fashion_clip")
+    classifications = await inference_executor.run(
+        "classification", classify_with_store,
+        [image for _, _, image, _ in loaded_images],
+        [content_hash for _, _, _, content_hash in loaded_images],
+        [image_data['filename'] for image_data, _, _, _ in loaded_images],
+        processor_fc, model_fc
+    )
 
-            item_data = {
-                "image_name": image_data['filename'],
-                "image_path": image_path,
-                "Clothing_Type": clothing_type,
-                "Category": category,
-                "Occasion": occasion,
-                "Season": season,
-                "Material": material,
-                "Dominant_Color": str(dominant_color)
-            }
-            results.append(item_data)
-            analyzed_items.append(item_data)
-        except Exception as e:
-            logger.error(f"Error classifying {image_path}: {e}")
-            errors.append(f"Error classifying {image_data['filename']}: {e}")
+    for (image_data, image_path, _, _), classification in zip(loaded_images, classifications):
+        clothing_type, category, occasion, season, material, dominant_color = classification
+        if clothing_type is None:
+            logger.error(f"Error classifying {image_path}")
+            errors.append(f"Error classifying {image_data['filename']}")
             continue
 
+        item_data = {
+            "image_name": image_data['filename'],
+            "image_path": image_path,
+            "Clothing_Type": clothing_type,
+            "Category": category,
+            "Occasion": occasion,
+            "Season": season,
+            "Material": material,
+            "Dominant_Color": str(dominant_color)
+        }
+        results.append(item_data)
+        analyzed_items.append(item_data)
+
     if not analyzed_items:
         return jsonify({"error": "No images classified successfully", "details": errors}), 400
 
@@ -311,12 +571,19 @@ def classify_and_analyze_local(images: List[Dict]) -> Dict:
                 "warning": "No tops, bottoms, or dresses found"
             }), 200
 
+        model, processor = registry.get("clip")
         analyzer = OutfitCompatibilityAnalyzer(
             classified_df=current_df,
             clip_processor=processor,
             clip_model=model,
             compatibility_prompts=compatibility_prompts,
-            image_download_function=None
+            image_download_function=None,
+            scoring_mode=outfit_scoring_mode,
+            image_cache=image_cache,
+            search_beam_width=outfit_beam_width,
+            search_seed=outfit_search_seed,
+            inference_executor=inference_executor,
+            budget=budget
         )
 
         all_occasions = current_df['Occasion'].unique().tolist()
@@ -324,7 +591,7 @@ def classify_and_analyze_local(images: List[Dict]) -> Dict:
 
         for occasion in all_occasions:
             try:
-                occasion_outfits = analyzer.find_best_matches(occasion) # Assuming find_best_matches is synchronous for local analysis
+                occasion_outfits = await analyzer.find_best_matches(occasion)
                 if occasion_outfits:
                     best_outfits.extend(occasion_outfits)
             except Exception as e:
@@ -333,50 +600,129 @@ def classify_and_analyze_local(images: List[Dict]) -> Dict:
 
         if not best_outfits:
             logger.info("No occasion-specific outfits found, trying generic matching")
-            best_outfits = analyzer.find_best_matches(None) or []
-
-        outfit_combinations = {}
-        for item, matches in best_outfits:
-            try:
-                item_url = item.get('image_path', '') if isinstance(item, dict) else getattr(item, 'image_path', '')
-                if not item_url:
-                    continue
-
-                if matches is None:
-                    outfit_combinations[item_url] = []
-                elif isinstance(matches[0], tuple) and len(matches[0]) == 2:
-                    second_item, score = matches[0]
-                    second_url = second_item.get('image_path', '') if isinstance(second_item, dict) else getattr(second_item, 'image_path', '')
-                    if item.get('Category', '') in ['Dress', 'Footwear']:
-                        outfit_combinations[item_url] = [second_url] if second_url else []
-                    else:
-                        outfit_combinations[item_url] = [
-                            match[0].get('image_path', '') if isinstance(match[0], dict)
-                            else getattr(match[0], 'image_path', '')
-                            for match in (matches or []) if match and match[0]
-                        ]
-                elif isinstance(matches[0], tuple) and len(matches[0]) == 3:
-                    outfit_combinations[item_url] = [
-                        [
-                            match[0].get('image_path', ''),  # bottom
-                            match[1].get('image_path', '')   # footwear
-                        ] for match in matches
-                    ]
+            best_outfits = await analyzer.find_best_matches(None) or []
+        logger.info(f"Score cache: {analyzer.score_cache_stats()}")
 
-            except Exception as e:
-                logger.warning(f"Failed to process outfit combination: {str(e)}")
-                continue
+        outfit_combinations = format_outfit_combinations(best_outfits)
 
         return jsonify({
             "classification": results,
             "outfit_combinations": outfit_combinations,
-            "errors": errors if errors else None
+            "errors": errors if errors else None,
+            "partial": budget.partial,
+            "degraded_combinations": degraded_outfit_combinations(best_outfits),
+            "budget": budget.stats()
         })
 
     except Exception as e:
         logger.error(f"Error during outfit analysis: {e}", exc_info=True)
         return jsonify({"error": f"Error during outfit analysis: {str(e)}", "details": errors}), 500
 
+def requested_stream_format() -> Optional[str]:
+    """"ndjson" or "sse" when the client asked for a streamed response (?stream= or Accept header), else None."""
+    stream_format = request.args.get('stream', '').lower()
+    if stream_format in ('ndjson', 'sse'):
+        return stream_format
+    accept = request.headers.get('Accept', '')
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    if 'text/event-stream' in accept:
+        return 'sse'
+    return None
+
+def format_event(event: Dict, stream_format: str) -> str:
+    payload = json.dumps(event, default=str)
+    if stream_format == 'sse':
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+def stream_events(run_pipeline: Callable, stream_format: str) -> Response:
+    """
+    Streams the events a pipeline emits, ending with a "summary" event holding the usual JSON result.
+    The view's event loop is gone once the response starts, so the pipeline runs on its own thread and loop.
+    """
+    events = queue.Queue()
+
+    def run():
+        status = "200"
+        try:
+            result = asyncio.run(run_pipeline(events.put))
+        except Exception as e:
+            logger.error(f"Streaming pipeline failed: {str(e)}", exc_info=True)
+            result = {"error": f"Server error: {str(e)}", "success": False}
+            status = "500"
+        # The request's trace outlives its view when streaming, so it is finished here
+        telemetry.finish_trace(telemetry.current_trace.get(), status)
+        events.put({"type": "summary", **result})
+        events.put(None)
+
+    # Threads start with an empty context; the pipeline thread carries the request's trace
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="process-images-stream", daemon=True).start()
+
+    def generate():
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield format_event(event, stream_format)
+
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Scrape and debug endpoints are not traced themselves
+untraced_endpoints = {"metrics", "recent_traces", "ready"}
+
+@app.before_request
+def start_memory_tracking():
+    g.memory_tracker = RequestMemoryTracker()
+
+@app.before_request
+def start_trace():
+    if request.endpoint not in untraced_endpoints:
+        g.trace = telemetry.start_trace(request.endpoint or "unknown")
+
+@app.before_request
+def shed_load():
+    """Rejects new work while the inference backlog is full, instead of letting every request slow down."""
+    if request.endpoint != 'process_images':
+        return None
+    backlog = inference_executor.backlog()
+    if backlog >= inference_max_backlog:
+        logger.warning(f"Shedding request: inference backlog {backlog}")
+        response = jsonify({"error": "Server is overloaded, retry shortly", "success": False})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return None
+
+@app.after_request
+def report_request_memory(response):
+    tracker = g.get('memory_tracker')
+    if tracker is not None and request.endpoint == 'process_images':
+        memory = tracker.report()
+        logger.info(f"Request memory for {request.path}: {memory}")
+        if memory["rss_delta_mb"] is not None:
+            response.headers['X-RSS-Delta-MB'] = str(memory["rss_delta_mb"])
+        if memory["process_peak_rss_mb"] is not None:
+            response.headers['X-Process-Peak-RSS-MB'] = str(memory["process_peak_rss_mb"])
+    return response
+
+@app.after_request
+def finish_trace(response):
+    """Logs the request's trace as one JSON line and reports its stage timings in a Server-Timing header."""
+    trace = g.get('trace')
+    if trace is None:
+        return response
+    response.headers['X-Trace-Id'] = trace.trace_id
+    if response.is_streamed:
+        return response  # finished by stream_events once the pipeline is done
+    telemetry.finish_trace(trace, str(response.status_code))
+    server_timing = trace.server_timing()
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    return response
+
 @app.route('/process_images', methods=['POST'])
 async def process_images():
     try:
@@ -385,8 +731,14 @@ async def process_images():
             if isinstance(data, dict) and "images" in data and isinstance(data["images"], list) and all(isinstance(url, str) for url in data["images"]):
                 image_urls = data["images"]
                 occasion = data.get("occasion")
+                try:
+                    budget = request_budget(data.get("budget"))
+                except (TypeError, ValueError):
+                    return jsonify({"error": budget_error}), 400
                 logger.info(f"Processing {len(image_urls)} images from URLs (async)")
-                result = await classify_and_analyze_url_async(
+                model, processor = registry.get("clip")
+                pipeline = functools.partial(
+                    classify_and_analyze_url_async,
                     image_urls,
                     processor=processor,
                     model=model,
@@ -395,8 +747,13 @@ async def process_images():
                     seasons=seasons,
                     materials=materials,
                     device=device,
-                    compatibility_prompts=compatibility_prompts
+                    compatibility_prompts=compatibility_prompts,
+                    budget=budget
                 )
+                stream_format = requested_stream_format()
+                if stream_format:
+                    return stream_events(lambda emit: pipeline(on_event=emit), stream_format)
+                result = await pipeline()
                 return jsonify(result)
             else:
                 return jsonify({"error": "Input must be a JSON with an 'images' key containing a list of image URLs"}), 400
@@ -409,7 +766,7 @@ async def process_images():
                     images.append({'filename': file.filename})
             if images:
                 logger.info(f"Processing {len(images)} local images")
-                result = classify_and_analyze_local(images)
+                result = await classify_and_analyze_local(images)
                 return result
             else:
                 return jsonify({"error": "No image files uploaded"}), 400
@@ -419,9 +776,272 @@ async def process_images():
         logger.error(f"Server error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/matches', methods=['POST'])
+async def wardrobe_matches():
+    """
+    Matches each image in {"images": [urls]} against every stored item of the complementary categories
+    in the same occasion (optionally "season"), returning the "k" best per category.
+    """
+    data = request.get_json(silent=True)
+    if not (isinstance(data, dict) and isinstance(data.get("images"), list) and data["images"]
+            and all(isinstance(url, str) for url in data["images"])):
+        return jsonify({"error": "Input must be a JSON with an 'images' key containing a list of image URLs"}), 400
+    try:
+        image_urls = data["images"]
+        k = int(data.get("k", 5))
+        candidates = max(k, int(data.get("candidates", retrieval_candidates)))
+        season = data.get("season")
+        model, processor = registry.get("clip")
+        model_key = item_model_key(model)
+        retriever = wardrobe_retriever(processor, model)
+
+        downloaded = [(url, image) for url, image in zip(image_urls, await asyncio.gather(*(download_image_async(url) for url in image_urls)))
+                      if image is not None]
+        errors = [f"Failed to download image: {url}" for url in image_urls if url not in dict(downloaded)]
+        results = []
+        if downloaded:
+            urls = [url for url, _ in downloaded]
+            content_hashes = [image_content_hash(url, image) for url, image in downloaded]
+            await inference_executor.run(
+                "classification", classify_with_store,
+                [image for _, image in downloaded], content_hashes, urls, processor, model
+            )
+            stored = item_store.get_many(content_hashes, model_key)
+            for url, content_hash in zip(urls, content_hashes):
+                item = stored.get(content_hash)
+                if item is None or item["embedding"] is None:
+                    errors.append(f"Could not classify image: {url}")
+                    continue
+                with span("retrieval", items=1):
+                    matches = await inference_executor.run(
+                        "retrieval", retriever.matches, item["embedding"], item["category"], item["occasion"], season,
+                        k, candidates, {content_hash}
+                    )
+                matched_items = item_store.get_many([h for found in matches.values() for _, h in found], model_key)
+                results.append({
+                    "image": url,
+                    "category": item["category"],
+                    "occasion": item["occasion"],
+                    "matches": {
+                        category: [
+                            {"image": matched_items[h]["image_name"], "content_hash": h, "score": round(score, 4)}
+                            for score, h in found if h in matched_items
+                        ]
+                        for category, found in matches.items()
+                    }
+                })
+        return jsonify({"results": results, "errors": errors, "index": retriever.index().stats(),
+                        "success": bool(results)})
+    except Exception as e:
+        logger.error(f"Server error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+def remap_urls(value, mapping: Dict[str, str]):
+    """Copy of a result with every string equal to a key of mapping replaced by its value."""
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, list):
+        return [remap_urls(item, mapping) for item in value]
+    if isinstance(value, dict):
+        return {remap_urls(key, mapping): remap_urls(item, mapping) for key, item in value.items()}
+    return value
+
+async def run_wardrobe_job(job: Job) -> Dict:
+    """Runs a background wardrobe job under its own trace, logged and counted like a request's."""
+    image_urls = job.payload["images"]
+    trace = telemetry.start_trace("job")
+    trace.attributes["job_id"] = job.job_id
+    status = "error"
+    try:
+        result = await _run_wardrobe_job(job, image_urls)
+        status = "ok"
+        return result
+    finally:
+        telemetry.finish_trace(trace, status)
+
+async def _run_wardrobe_job(job: Job, image_urls: List[str]) -> Dict:
+    """
+    Body of a background wardrobe job. Images are downloaded first (into the image cache) so the job can
+    reuse the result of an earlier job over the same image content; otherwise the full pipeline runs.
+    """
+    progress = {"stage": "downloading", "total": len(image_urls), "downloaded": 0, "classified": 0, "errors": 0}
+    job_manager.update_progress(job, **progress)
+
+    async def download(url):
+        image = await download_image_async(url) if validate_image_url(url) else None
+        progress["downloaded"] += 1
+        job_manager.update_progress(job, downloaded=progress["downloaded"])
+        return url, image
+
+    content_hashes = {
+        url: image_content_hash(url, image)
+        for url, image in await asyncio.gather(*(download(url) for url in image_urls)) if image is not None
+    }
+    job.payload["content_hashes"] = content_hashes
+    if content_hashes:
+        existing = job_manager.match_content(job, image_set_key(content_hashes.values()))
+        if existing is not None:
+            logger.info(f"Job {job.job_id} reuses the result of job {existing.job_id} for the same images")
+            job.deduplicated_from = existing.job_id
+            job_manager.update_progress(job, stage="done", classified=existing.progress.get("classified", 0))
+            # The earlier job may have used different URLs for the same images
+            url_by_hash = {}
+            for url, content_hash in content_hashes.items():
+                url_by_hash.setdefault(content_hash, url)
+            return remap_urls(existing.result, {
+                url: url_by_hash[content_hash]
+                for url, content_hash in existing.payload.get("content_hashes", {}).items() if content_hash in url_by_hash
+            })
+
+    def on_event(event):
+        if event["type"] == "classification":
+            progress["classified"] += 1
+            job_manager.update_progress(job, stage="classifying", classified=progress["classified"])
+        elif event["type"] == "error":
+            progress["errors"] += 1
+            job_manager.update_progress(job, errors=progress["errors"])
+        elif event["type"] == "outfits":
+            job_manager.update_progress(job, stage="analyzing")
+
+    model, processor = registry.get("clip")
+    result = await classify_and_analyze_url_async(
+        image_urls,
+        processor=processor,
+        model=model,
+        clothing_types=clothing_types,
+        occasions=occasions,
+        seasons=seasons,
+        materials=materials,
+        device=device,
+        compatibility_prompts=compatibility_prompts,
+        on_event=on_event,
+        budget=request_budget(job.payload.get("budget"), deadline=False)
+    )
+    job_manager.update_progress(job, stage="done")
+    return result
+
+# Background wardrobe jobs; JOB_STORE_PATH="" keeps them in memory only
+job_store_path = os.environ.get("JOB_STORE_PATH", os.path.join(csv_file, "jobs.sqlite3"))
+job_manager = JobManager(
+    run_wardrobe_job,
+    workers=int(os.environ.get("JOB_WORKERS", "2")),
+    store=JobStore(job_store_path) if job_store_path else None
+)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queues a wardrobe ({"images": [urls]}, optionally with a "budget") for background processing and returns
+    its job id at once. Jobs get no scoring deadline unless their budget sets one.
+    """
+    data = request.get_json(silent=True)
+    if not (isinstance(data, dict) and isinstance(data.get("images"), list) and data["images"]
+            and all(isinstance(url, str) for url in data["images"])):
+        return jsonify({"error": "Input must be a JSON with an 'images' key containing a list of image URLs"}), 400
+    image_urls = data["images"]
+    payload = {"images": image_urls}
+    if data.get("budget") is not None:
+        try:
+            request_budget(data["budget"])
+        except (TypeError, ValueError):
+            return jsonify({"error": budget_error}), 400
+        payload["budget"] = data["budget"]
+    request_key = image_set_key(normalize_url(normalize_firebase_url(url)) for url in image_urls)
+    job, deduplicated = job_manager.submit(payload, request_key=request_key)
+    logger.info(f"Job {job.job_id} for {len(image_urls)} images ({'existing' if deduplicated else 'queued'})")
+    response = jsonify({**job.to_dict(), "deduplicated": deduplicated})
+    response.status_code = 202
+    response.headers['Location'] = f"/jobs/{job.job_id}"
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and progress (downloaded / classified / total) of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """The job's /process_images-style result once finished; 202 with its status while it is still running."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if not job.finished:
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.to_dict(include_result=True))
+
+@app.route('/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(job_manager.stats())
+
+@app.route('/models', methods=['GET'])
+def model_status():
+    """Reports which models are loaded, with their load time and memory."""
+    return jsonify(registry.report())
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """200 once the models are loaded and warmed up, 503 before; includes this worker's shared/private memory."""
+    body = {**readiness, "pid": os.getpid(), "memory": memory_breakdown()}
+    return jsonify(body), 200 if readiness["ready"] else 503
+
+@app.route('/inference_stats', methods=['GET'])
+def inference_stats():
+    """Reports queued/running/completed counts per inference stage."""
+    return jsonify(inference_executor.stats())
+
+def collect_component_metrics():
+    """Scrape-time gauges and counters from the stats the executor, caches, downloader, batchers and jobs keep."""
+    executor_stats = inference_executor.stats()["stages"]
+    cache_stats = image_cache.stats()
+    download_stats = image_downloader.stats()
+    job_stats_ = job_manager.stats()
+    batching = {name: report["batching"] for name, report in registry.report().items() if "batching" in report}
+    return [
+        ("stylish_ready", "gauge", "1 once the models are warmed up.", [({}, int(readiness["ready"]))]),
+        ("stylish_inference_jobs", "gauge", "Inference executor jobs by stage and state.",
+         [({"stage": stage, "state": state}, counters[state])
+          for stage, counters in executor_stats.items() for state in ("queued", "running")]),
+        ("stylish_inference_jobs_total", "counter", "Finished inference executor jobs by stage and outcome.",
+         [({"stage": stage, "outcome": outcome}, counters[outcome])
+          for stage, counters in executor_stats.items() for outcome in ("completed", "failed")]),
+        ("stylish_microbatch_queued_rows", "gauge", "Rows waiting in a model's micro-batching queue.",
+         [({"model": name, "tower": tower}, stats["queued_rows"]) for name, towers in batching.items() for tower, stats in towers.items()]),
+        ("stylish_microbatch_batches_total", "counter", "Batches dispatched by a model's micro-batcher.",
+         [({"model": name, "tower": tower}, stats["batches"]) for name, towers in batching.items() for tower, stats in towers.items()]),
+        ("stylish_image_cache_bytes", "gauge", "Bytes held by the decoded image cache.", [({}, cache_stats["bytes"])]),
+        ("stylish_image_cache_entries", "gauge", "Entries in the decoded image cache.", [({}, cache_stats["entries"])]),
+        ("stylish_downloads_total", "counter", "Image download client outcomes.",
+         [({"outcome": outcome}, download_stats.get(outcome, 0))
+          for outcome in ("requests", "downloaded", "not_modified", "retries", "failures")]),
+        ("stylish_job_queue_depth", "gauge", "Background jobs waiting for a worker.", [({}, job_stats_["queue_depth"])]),
+    ]
+
+telemetry.metrics.add_collector(collect_component_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this worker's latency histograms, forward-pass and cache counters."""
+    return Response(telemetry.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces', methods=['GET'])
+def recent_traces():
+    """The most recent finished request and job traces of this worker, newest first."""
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify(list(reversed(telemetry.recent_traces))[:max(0, limit)])
+
 if __name__ == '__main__':
-    os.makedirs(image_folder, exist_ok=True)
-    os.makedirs(csv_file, exist_ok=True)
-    if not os.path.exists(os.path.join(csv_file, "Classified.csv")):
-        pd.DataFrame(columns=['image_name', 'Clothing_Type', 'Category', 'Occasion', 'Season', 'Material', 'Dominant Color']).to_csv(os.path.join(csv_file, "Classified.csv"), index=False)
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # One-time bulk import of the legacy CSV (produced by the FashionCLIP local path) into the item store
+    legacy_csv = os.path.join(csv_file, "Classified.csv")
+    if os.path.exists(legacy_csv) and item_store.count() == 0:
+        item_store.import_csv(legacy_csv, image_folder, item_model_key(registry.get("fashion_clip")[0]))
+    # Resume jobs a previous run left unfinished
+    job_manager.start()
+    if not readiness["ready"]:
+        # /ready turns true once the models are warm; requests before that load them lazily
+        threading.Thread(target=warm_up_models, args=(preload_model_names(preload_models or "clip,fashion_clip"),),
+                         name="warm-up", daemon=True).start()
+    # The reloader restarts the process (and reloads every model) on each file change; use serve.py in production
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,221 @@
+# batching.py
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+
+from inference import inference_context
+from telemetry import observe_forward
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ("inputs", "rows", "future", "enqueued")
+
+    def __init__(self, inputs, rows):
+        self.inputs = inputs
+        self.rows = rows
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Collects jobs submitted from many threads and runs them through run_batch(list_of_inputs) together.
+    A batch is dispatched once it holds max_batch rows or its oldest job has waited max_wait_ms.
+    At most max_queue rows wait at once; submitters block until there is room (backpressure). Submitters
+    are inference executor threads, each waiting on one job, so the queue cannot hold more rows than the
+    executor has workers times rows per call; load is shed upstream, on the executor backlog.
+    """
+
+    def __init__(self, name, run_batch, max_batch=32, max_wait_ms=5, max_queue=256):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self._pid = None
+        self._stats = {"jobs": 0, "rows": 0, "batches": 0, "largest_batch": 0, "waits_for_room": 0}
+        self._reset()
+
+    def _reset(self):
+        # Threads do not survive fork, so a forked worker starts with a fresh queue and dispatcher
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued_rows = 0
+        self._thread = None
+        self._stop_event = None
+        self._pid = os.getpid()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._dispatch_loop, args=(self._stop_event,),
+                                            name=f"batcher-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the idle dispatcher thread, e.g. before forking workers; the next submit starts a new one."""
+        with self._cond:
+            thread, stop_event = self._thread, self._stop_event
+            self._thread = None
+            if stop_event is not None:
+                stop_event.set()
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def submit(self, inputs, rows):
+        """Queues one job of `rows` rows and blocks until its slice of the batched result is ready."""
+        if self._pid != os.getpid():
+            self._reset()
+        job = _Job(inputs, rows)
+        with self._cond:
+            self._ensure_thread()
+            # A job larger than the whole queue is still admitted once the queue is empty
+            while self._queue and self._queued_rows + rows > self.max_queue:
+                self._stats["waits_for_room"] += 1
+                self._cond.wait()
+            self._queue.append(job)
+            self._queued_rows += rows
+            self._stats["jobs"] += 1
+            self._cond.notify_all()
+        return job.future.result()
+
+    def _next_batch(self, stop_event):
+        with self._cond:
+            while not self._queue:
+                if stop_event.is_set():
+                    return None
+                self._cond.wait()
+            deadline = self._queue[0].enqueued + self.max_wait
+            while self._queued_rows < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            jobs = [self._queue.popleft()]
+            rows = jobs[0].rows
+            while self._queue and rows + self._queue[0].rows <= self.max_batch:
+                job = self._queue.popleft()
+                jobs.append(job)
+                rows += job.rows
+            self._queued_rows -= rows
+            self._stats["rows"] += rows
+            self._stats["batches"] += 1
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], rows)
+            self._cond.notify_all()
+        return jobs
+
+    def _dispatch_loop(self, stop_event):
+        while True:
+            jobs = self._next_batch(stop_event)
+            if jobs is None:
+                return
+            try:
+                outputs = self.run_batch([job.inputs for job in jobs])
+            except BaseException as e:
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+            for job, output in zip(jobs, outputs):
+                job.future.set_result(output)
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, "queued_rows": self._queued_rows}
+
+
+def _pad_text_inputs(inputs):
+    """Right-pads (input_ids, attention_mask) pairs to a common length and concatenates them."""
+    length = max(input_ids.shape[1] for input_ids, _ in inputs)
+    all_ids, all_masks = [], []
+    for input_ids, attention_mask in inputs:
+        extra = length - input_ids.shape[1]
+        if extra:
+            # Repeating each row's last token keeps the pooled (end-of-text) position unchanged,
+            # and the causal mask keeps the extra positions from affecting earlier tokens
+            input_ids = torch.cat([input_ids, input_ids[:, -1:].expand(-1, extra)], dim=1)
+            attention_mask = torch.cat([attention_mask, attention_mask.new_zeros(attention_mask.shape[0], extra)], dim=1)
+        all_ids.append(input_ids)
+        all_masks.append(attention_mask)
+    return torch.cat(all_ids), torch.cat(all_masks)
+
+
+class _ClipOutput:
+    def __init__(self, logits_per_image, image_embeds, text_embeds):
+        self.logits_per_image = logits_per_image
+        self.logits_per_text = logits_per_image.T
+        self.image_embeds = image_embeds
+        self.text_embeds = text_embeds
+
+
+class BatchedClipModel:
+    """
+    Stands in for a CLIP model (torch or ONNX) shared by all requests. get_image_features and
+    get_text_features calls from concurrent threads are merged into one forward pass per tower and
+    their rows fanned back out; every other attribute is forwarded to the wrapped model. With
+    max_batch <= 1 calls go straight to the model. Either way, forward passes are counted per tower.
+    """
+
+    def __init__(self, model, name, device="cpu", max_batch=32, max_wait_ms=5, max_queue=256):
+        self.model = model
+        self.name = name
+        self.device = device
+        self.batching = max_batch > 1
+        self.image_batcher = MicroBatcher(f"{name}:image", self._encode_images, max_batch, max_wait_ms, max_queue)
+        self.text_batcher = MicroBatcher(f"{name}:text", self._encode_texts, max_batch, max_wait_ms, max_queue)
+
+    def __getattr__(self, attr):
+        return getattr(self.model, attr)
+
+    def _encode_images(self, inputs):
+        observe_forward(self.name, "image", sum(pixel_values.shape[0] for pixel_values in inputs))
+        with inference_context(self.device):
+            features = self.model.get_image_features(pixel_values=torch.cat(inputs))
+        return torch.split(features, [pixel_values.shape[0] for pixel_values in inputs])
+
+    def _encode_texts(self, inputs):
+        input_ids, attention_mask = _pad_text_inputs(inputs)
+        observe_forward(self.name, "text", input_ids.shape[0])
+        with inference_context(self.device):
+            features = self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+        return torch.split(features, [ids.shape[0] for ids, _ in inputs])
+
+    def get_image_features(self, pixel_values, **kwargs):
+        if kwargs or not self.batching:
+            observe_forward(self.name, "image", pixel_values.shape[0])
+            return self.model.get_image_features(pixel_values=pixel_values, **kwargs)
+        return self.image_batcher.submit(pixel_values, pixel_values.shape[0])
+
+    def get_text_features(self, input_ids, attention_mask=None, **kwargs):
+        if kwargs or not self.batching:
+            observe_forward(self.name, "text", input_ids.shape[0])
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask, **kwargs)
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return self.text_batcher.submit((input_ids, attention_mask), input_ids.shape[0])
+
+    def __call__(self, input_ids=None, pixel_values=None, attention_mask=None, **kwargs):
+        if input_ids is None or pixel_values is None or kwargs:
+            observe_forward(self.name, "joint", (pixel_values if pixel_values is not None else input_ids).shape[0])
+            return self.model(input_ids=input_ids, pixel_values=pixel_values, attention_mask=attention_mask, **kwargs)
+        # Same logits as CLIPModel.forward, computed from the two batched towers
+        image_embeds = self.get_image_features(pixel_values)
+        text_embeds = self.get_text_features(input_ids, attention_mask)
+        image_embeds = image_embeds / image_embeds.norm(dim=-1, keepdim=True)
+        text_embeds = text_embeds / text_embeds.norm(dim=-1, keepdim=True)
+        logits_per_image = self.model.logit_scale.exp() * image_embeds @ text_embeds.T
+        return _ClipOutput(logits_per_image, image_embeds, text_embeds)
+
+    def stop(self):
+        self.image_batcher.stop()
+        self.text_batcher.stop()
+
+    def stats(self):
+        return {"image": self.image_batcher.stats(), "text": self.text_batcher.stats()}
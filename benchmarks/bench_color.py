@@ -0,0 +1,70 @@
+"""
+Benchmarks dominant color extraction on the bundled Images/ folder.
+
+    python benchmarks/bench_color.py [--limit N] [--repeat R]
+
+Compares the original list-comprehension + KMeans(n_init=10) extractor with
+get_dominant_color_kmeans for every registered strategy, and reports how often
+each strategy's dominant color lands within a small distance of the original.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from sklearn.cluster import KMeans
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import COLOR_STRATEGIES, get_dominant_color_kmeans  # noqa: E402
+
+
+def legacy_dominant_color(image, resize_size=(300, 300), k=3):
+    """The extractor as it was before vectorization, kept as the benchmark baseline."""
+    img = image.convert("RGBA").resize(resize_size)
+    pixels = np.array(img.getdata())
+    pixels = np.array([rgb[:3] for rgb in pixels if rgb[3] > 0])
+    pixels = np.array([rgb for rgb in pixels if sum(rgb) > 150])
+    if len(pixels) == 0:
+        return (0, 0, 0)
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    kmeans.fit(pixels)
+    return tuple(map(int, kmeans.cluster_centers_[np.argmax(np.bincount(kmeans.labels_))]))
+
+
+def time_per_image(fn, images, repeat):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(image) for image in images]
+    return (time.perf_counter() - start) / (repeat * len(images)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=os.path.join(ROOT, "Images"))
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=30.0, help="max RGB distance counted as agreement")
+    args = parser.parse_args()
+
+    names = sorted(os.listdir(args.images))[:args.limit]
+    images = []
+    for name in names:
+        with Image.open(os.path.join(args.images, name)) as image:
+            images.append(image.convert("RGB"))
+
+    baseline_time, baseline = time_per_image(legacy_dominant_color, images, args.repeat)
+    print(f"{'strategy':<12} {'ms/image':>10} {'speedup':>8} {'agree':>6}")
+    print(f"{'legacy':<12} {baseline_time * 1000:>10.1f} {1.0:>7.1f}x {'-':>6}")
+    for strategy in COLOR_STRATEGIES:
+        elapsed, colors = time_per_image(lambda image: get_dominant_color_kmeans(image, strategy=strategy), images, args.repeat)
+        agree = np.mean([np.linalg.norm(np.subtract(a, b)) <= args.tolerance for a, b in zip(colors, baseline)])
+        print(f"{strategy:<12} {elapsed * 1000:>10.1f} {baseline_time / elapsed:>7.1f}x {agree:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
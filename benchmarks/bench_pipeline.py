@@ -0,0 +1,371 @@
+"""
+Benchmarks the classification and outfit pipeline end to end, offline.
+
+    python benchmarks/bench_pipeline.py [--size 200] [--stages download,classify,...] [--output run.json]
+                                        [--compare baseline.json]
+
+A synthetic wardrobe (benchmarks/wardrobe.py) is generated from the bundled Images/ folder and served by a
+local stub of Firebase Storage (benchmarks/stub_server.py). Each stage reports latency percentiles, throughput
+(images/s or outfits/s), the CLIP forward passes it caused (and the rows they carried) and its RSS growth;
+the run also records peak RSS, the git revision and the tuning environment variables. Results are written
+as JSON; --compare prints the change of every stage's p50 and throughput against an earlier run.
+
+Stages: download, revalidate, remove_background, dominant_color, clip_forward, classify, classify_single,
+find_best_matches, process_images. Models load through the registry exactly as in the app; for a run with
+no network set CLIP_MODEL_PATH / FASHION_CLIP_MODEL_PATH, or HF_HUB_OFFLINE=1 with a populated cache.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import StubStorageServer  # noqa: E402
+from wardrobe import generate_wardrobe, synthetic_items  # noqa: E402
+
+ALL_STAGES = ("download", "revalidate", "remove_background", "dominant_color", "clip_forward", "classify",
+              "classify_single", "find_best_matches", "process_images")
+# Settings recorded with every run, so results are compared like for like
+ENV_PREFIXES = ("CLASSIFY_", "CLIP_", "FASHION_CLIP_", "DOWNLOAD_", "IMAGE_", "INFERENCE_", "MICROBATCH_",
+                "ONNX_", "OUTFIT_", "REMBG_", "TORCH_")
+
+
+def percentiles(samples):
+    samples_ms = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(samples_ms):
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(float(samples_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(samples_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 3),
+        "max_ms": round(float(samples_ms.max()), 3),
+    }
+
+
+class ForwardCounter:
+    """
+    Counts forward passes of the underlying CLIP models (and the rows they carried) by wrapping their
+    get_image_features / get_text_features / forward methods; with micro-batching on, merged calls from
+    several requests count once, which is the point of measuring them.
+    """
+
+    METHODS = {"get_image_features": "pixel_values", "get_text_features": "input_ids", "forward": "pixel_values"}
+
+    def __init__(self):
+        self.counts = {}
+
+    def attach(self, name, model):
+        inner = getattr(model, "model", model)
+        for method, rows_argument in self.METHODS.items():
+            original = getattr(inner, method, None)
+            if original is None:
+                continue
+            setattr(inner, method, self._wrap(f"{name}.{method}", original, rows_argument))
+
+    def _wrap(self, key, original, rows_argument):
+        def counted(*args, **kwargs):
+            tensor = kwargs.get(rows_argument, args[0] if args else None)
+            counts = self.counts.setdefault(key, {"calls": 0, "rows": 0})
+            counts["calls"] += 1
+            counts["rows"] += int(tensor.shape[0]) if hasattr(tensor, "shape") else 0
+            return original(*args, **kwargs)
+        return counted
+
+    def snapshot(self):
+        return {key: dict(counts) for key, counts in self.counts.items()}
+
+    @staticmethod
+    def delta(before, after):
+        return {
+            key: {field: counts[field] - before.get(key, {}).get(field, 0) for field in counts}
+            for key, counts in after.items() if counts["calls"] != before.get(key, {}).get("calls", 0)
+        }
+
+
+class Benchmark:
+    def __init__(self, args, app_module, counter):
+        self.args = args
+        self.app = app_module
+        self.counter = counter
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name, units, unit_name):
+        """Records a stage: yields a list for per-call latencies (seconds); units/wall time gives throughput."""
+        from inference import current_rss_bytes
+        samples = []
+        forwards_before = self.counter.snapshot()
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        extra = {}
+        try:
+            yield samples, extra
+        except Exception as e:
+            self.results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:<18} failed: {e}")
+            return
+        wall = time.perf_counter() - start
+        rss_after = current_rss_bytes()
+        count = units() if callable(units) else units
+        self.results[name] = {
+            **percentiles(samples),
+            "wall_s": round(wall, 3),
+            "throughput": {f"{unit_name}_per_s": round(count / wall, 3) if wall > 0 else None, unit_name: count},
+            "forward_passes": ForwardCounter.delta(forwards_before, self.counter.snapshot()),
+            "rss_delta_mb": round((rss_after - rss_before) / 2 ** 20, 1) if rss_before and rss_after else None,
+            **extra,
+        }
+        summary = self.results[name]
+        print(f"{name:<18} p50 {summary.get('p50_ms', 0):>9.1f} ms  p99 {summary.get('p99_ms', 0):>9.1f} ms  "
+              f"{summary['throughput'][f'{unit_name}_per_s'] or 0:>8.2f} {unit_name}/s")
+
+
+def load_images(paths):
+    images = []
+    for path in paths:
+        with Image.open(path) as image:
+            images.append(image.convert("RGB"))
+    return images
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_stages(bench, args, paths, urls, server):
+    app = bench.app
+    import utils
+    from inputs import clothing_types, occasions, seasons, materials, compatibility_prompts
+    from outfit_analyzer import OutfitCompatibilityAnalyzer
+    from inference import inference_context
+    import pandas as pd
+
+    stages = set(args.stages)
+    images = load_images(paths)
+    model, processor = app.registry.get(args.model)
+    bench.counter.attach(args.model, model)
+
+    if "download" in stages:
+        async def download_all(samples):
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one(url):
+                async with semaphore:
+                    start = time.perf_counter()
+                    image = await app.download_image_async(url)
+                    samples.append(time.perf_counter() - start)
+                    return image is not None
+            return sum(await asyncio.gather(*(one(url) for url in urls)))
+
+        with bench.stage("download", len(urls), "images") as (samples, extra):
+            extra["downloaded"] = asyncio.run(download_all(samples))
+            extra["server"] = server.stats()
+
+    if "revalidate" in stages:
+        # Every cached copy is stale, so each request is a conditional GET answered 304
+        revalidate_after, app.image_cache.revalidate_after = app.image_cache.revalidate_after, 0
+        with bench.stage("revalidate", len(urls), "images") as (samples, extra):
+            async def revalidate_all():
+                for url in urls:
+                    start = time.perf_counter()
+                    await app.download_image_async(url)
+                    samples.append(time.perf_counter() - start)
+            asyncio.run(revalidate_all())
+            extra["server"] = server.stats()
+            extra["downloader"] = app.image_downloader.stats()
+        app.image_cache.revalidate_after = revalidate_after
+
+    background_removed = images
+    if "remove_background" in stages:
+        background_removed = []
+        with bench.stage("remove_background", len(images), "images") as (samples, _):
+            for image in images:
+                start = time.perf_counter()
+                background_removed.append(utils.remove_background(image))
+                samples.append(time.perf_counter() - start)
+
+    if "dominant_color" in stages:
+        if len(background_removed) != len(images):
+            background_removed = images
+        with bench.stage("dominant_color", len(images), "images") as (samples, _):
+            for image, original in zip(background_removed, images):
+                start = time.perf_counter()
+                utils.get_dominant_color_kmeans(image if image is not None else original)
+                samples.append(time.perf_counter() - start)
+
+    if "clip_forward" in stages:
+        with bench.stage("clip_forward", len(images), "images") as (samples, _):
+            for start_index in range(0, len(images), args.batch_size):
+                batch = images[start_index:start_index + args.batch_size]
+                start = time.perf_counter()
+                inputs = processor(images=batch, return_tensors="pt").to(app.device)
+                with inference_context(app.device):
+                    model.get_image_features(**inputs)
+                samples.append(time.perf_counter() - start)
+
+    if "classify" in stages:
+        with bench.stage("classify", len(images), "images") as (samples, _):
+            for start_index in range(0, len(images), args.batch_size):
+                start = time.perf_counter()
+                utils.classify_images_clip(images[start_index:start_index + args.batch_size], processor, model,
+                                           clothing_types, occasions, seasons, materials,
+                                           device=app.device, batch_size=args.batch_size)
+                samples.append(time.perf_counter() - start)
+
+    if "classify_single" in stages:
+        single = paths[:args.single]
+        with bench.stage("classify_single", len(single), "images") as (samples, _):
+            for path in single:
+                start = time.perf_counter()
+                utils.classify_image_clip(path, processor, model, clothing_types, occasions, seasons, materials,
+                                          device=app.device)
+                samples.append(time.perf_counter() - start)
+
+    if "find_best_matches" in stages:
+        items = synthetic_items(paths, seed=args.seed, occasion_count=args.occasions)
+        outfits = []
+        with bench.stage("find_best_matches", lambda: len(outfits), "outfits") as (samples, extra):
+            analyzer = OutfitCompatibilityAnalyzer(
+                pd.DataFrame(items), processor, model, compatibility_prompts, None,
+                scoring_mode=args.scoring_mode, image_cache=app.image_cache,
+                search_beam_width=app.outfit_beam_width, search_seed=app.outfit_search_seed,
+                inference_executor=app.inference_executor
+            )
+
+            async def analyze():
+                for occasion in dict.fromkeys(item["Occasion"] for item in items):
+                    start = time.perf_counter()
+                    recommendations = await analyzer.find_best_matches(occasion)
+                    samples.append(time.perf_counter() - start)
+                    # One outfit per (item, match) combination in the recommendations
+                    outfits.extend(match for _, matches in recommendations for match in (matches or [None]))
+            asyncio.run(analyze())
+            extra["scoring_mode"] = args.scoring_mode
+            extra["score_cache"] = analyzer.score_cache_stats()
+
+    if "process_images" in stages:
+        client = app.app.test_client()
+        for run in ("cold", "warm"):
+            # The second pass finds every item in the item store and every image in the image cache
+            name = f"process_images_{run}"
+            with bench.stage(name, len(urls), "images") as (samples, extra):
+                statuses = {}
+                for start_index in range(0, len(urls), args.request_size):
+                    start = time.perf_counter()
+                    response = client.post("/process_images", json={"images": urls[start_index:start_index + args.request_size]})
+                    samples.append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                extra["responses"] = statuses
+                extra["request_size"] = args.request_size
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["stages"]
+    print(f"\n{'stage':<22} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'throughput':>11}")
+    for name, after in results.items():
+        before = baseline.get(name)
+        if not before or "p50_ms" not in before or "p50_ms" not in after:
+            continue
+        unit = next(key for key in after["throughput"] if key.endswith("_per_s"))
+        ratio = (after["throughput"][unit] or 0) / before["throughput"].get(unit) if before["throughput"].get(unit) else None
+        change = (after["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        print(f"{name:<22} {before['p50_ms']:>9.1f}ms {after['p50_ms']:>8.1f}ms {change:>+8.0%} "
+              f"{f'{ratio:.2f}x' if ratio else '-':>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100, help="synthetic wardrobe size")
+    parser.add_argument("--wardrobe-dir", default=None, help="where the synthetic images go (default: a temp dir)")
+    parser.add_argument("--stages", default=",".join(ALL_STAGES))
+    parser.add_argument("--model", default="clip", help="registry model for the classification stages")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--single", type=int, default=10, help="images for the classify_single stage")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent downloads")
+    parser.add_argument("--request-size", type=int, default=20, help="images per /process_images request")
+    parser.add_argument("--scoring-mode", default=os.environ.get("OUTFIT_SCORING_MODE", "pairwise"))
+    parser.add_argument("--occasions", type=int, default=3, help="occasions in the synthetic wardrobe")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stub server latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub server rate of 503 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON result file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier JSON result to compare against")
+    args = parser.parse_args()
+    args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(args.stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="stylish-bench-")
+    # Fresh stores, label banks and upload folder for this run, so the cold pass really is cold and nothing
+    # is written to the repo's files/ or Images/ (Images/ is only read, as the wardrobe's source)
+    os.environ.setdefault("ITEM_STORE_PATH", os.path.join(work_dir, "items.sqlite3"))
+    os.environ.setdefault("JOB_STORE_PATH", "")
+    os.environ.setdefault("VECTOR_INDEX_DIR", os.path.join(work_dir, "index"))
+    os.environ.setdefault("LABEL_BANK_DIR", os.path.join(work_dir, "embeddings"))
+    os.environ.setdefault("IMAGE_FOLDER", os.path.join(work_dir, "Images"))
+    wardrobe_dir = args.wardrobe_dir or os.path.join(work_dir, "wardrobe")
+    names = generate_wardrobe(wardrobe_dir, args.size, seed=args.seed)
+    paths = [os.path.join(wardrobe_dir, name) for name in names]
+
+    import app as app_module
+    from inference import peak_rss_bytes
+    import torch
+
+    server = StubStorageServer(wardrobe_dir, latency_ms=args.latency_ms, error_rate=args.error_rate,
+                               seed=args.seed).start()
+    urls = [server.url_for(name) for name in names]
+    bench = Benchmark(args, app_module, ForwardCounter())
+    started = time.time()
+    try:
+        run_stages(bench, args, paths, urls, server)
+    finally:
+        server.stop()
+
+    peak = peak_rss_bytes()
+    report = {
+        "meta": {
+            "started_at": started,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": app_module.device,
+            "torch_threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith(ENV_PREFIXES)},
+        },
+        "peak_rss_mb": round(peak / 2 ** 20, 1) if peak else None,
+        "stages": bench.results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nPeak RSS {report['peak_rss_mb']} MB; results written to {output}")
+    if args.compare:
+        compare(bench.results, args.compare)
+    app_module.image_downloader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Local HTTP stub standing in for Firebase Storage in benchmarks.
+
+    python benchmarks/stub_server.py --dir /tmp/wardrobe [--port 8765] [--latency-ms 20] [--error-rate 0.01]
+
+Serves the image files of a directory under /o/<name> with an image Content-Type, ETag and Last-Modified,
+answers If-None-Match / If-Modified-Since with 304, and can add fixed latency and a rate of 503 responses
+(with Retry-After: 0) to exercise the download client's retries. Counts requests by status.
+"""
+import argparse
+import email.utils
+import hashlib
+import http.server
+import mimetypes
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+
+class StubStorageServer:
+    def __init__(self, directory, host="127.0.0.1", port=0, latency_ms=0.0, error_rate=0.0, seed=0):
+        self.directory = os.path.abspath(directory)
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._validators = {}
+        self.counts = {}
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, name):
+        return f"{self.base_url}/o/{urllib.parse.quote(name)}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-storage", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": sum(self.counts.values()), "by_status": dict(self.counts)}
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def _should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+    def _validators_for(self, path):
+        # (etag, last_modified, body) cached per file; bodies are small enough to keep for a benchmark run
+        entry = self._validators.get(path)
+        if entry is None:
+            with open(path, "rb") as f:
+                body = f.read()
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            last_modified = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+            entry = self._validators[path] = (etag, last_modified, body)
+        return entry
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body=b"", headers=None):
+                stub._count(status)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+                if not path.startswith("/o/"):
+                    return self._reply(404)
+                file_path = os.path.abspath(os.path.join(stub.directory, path[len("/o/"):]))
+                if not file_path.startswith(stub.directory + os.sep) or not os.path.isfile(file_path):
+                    return self._reply(404)
+                if stub._should_fail():
+                    return self._reply(503, headers={"Retry-After": "0"})
+                etag, last_modified, body = stub._validators_for(file_path)
+                headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "private, max-age=0"}
+                if self.headers.get("If-None-Match") == etag or (
+                        not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == last_modified):
+                    return self._reply(304, headers=headers)
+                content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+                self._reply(200, body, {**headers, "Content-Type": content_type})
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubStorageServer(args.dir, args.host, args.port, args.latency_ms, args.error_rate).start()
+    print(f"Serving {args.dir} at {server.base_url}/o/<name>")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
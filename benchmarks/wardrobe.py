@@ -0,0 +1,106 @@
+"""
+Synthetic wardrobe generator for the benchmarks.
+
+    python benchmarks/wardrobe.py --size 1000 --out /tmp/wardrobe [--seed 0]
+
+Writes `size` JPEGs derived from the bundled Images/ folder. Each image is a random crop, flip, color and
+brightness jitter and resize of a source image, so every file has distinct content (and content hash) while
+staying garment-like. synthetic_items() produces classified item dicts in the shape /process_images builds,
+so outfit analysis can be benchmarked at any wardrobe size independently of what the classifier predicts.
+"""
+import argparse
+import os
+import random
+import sys
+
+from PIL import Image, ImageEnhance, ImageOps
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inputs import bottoms, clothing_types, dresses, footwear, materials, occasions, seasons, tops  # noqa: E402
+
+DEFAULT_SOURCE_DIR = os.path.join(ROOT, "Images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def source_images(source_dir=DEFAULT_SOURCE_DIR):
+    return sorted(name for name in os.listdir(source_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def jitter_image(image, rng):
+    """A random crop / flip / color / brightness / size variant of image."""
+    image = image.convert("RGB")
+    width, height = image.size
+    scale = rng.uniform(0.8, 1.0)
+    crop_width, crop_height = max(1, int(width * scale)), max(1, int(height * scale))
+    left, top = rng.randint(0, width - crop_width), rng.randint(0, height - crop_height)
+    image = image.crop((left, top, left + crop_width, top + crop_height))
+    if rng.random() < 0.5:
+        image = ImageOps.mirror(image)
+    image = ImageEnhance.Color(image).enhance(rng.uniform(0.7, 1.3))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.85, 1.15))
+    side = rng.randint(256, 768)
+    ratio = crop_height / crop_width
+    return image.resize((side, max(64, int(side * ratio))))
+
+
+def generate_wardrobe(out_dir, size, source_dir=DEFAULT_SOURCE_DIR, seed=0):
+    """Writes size synthetic images to out_dir (reusing ones already there) and returns their file names."""
+    os.makedirs(out_dir, exist_ok=True)
+    sources = source_images(source_dir)
+    if not sources:
+        raise ValueError(f"No images in {source_dir}")
+    names = []
+    for number in range(size):
+        source = sources[number % len(sources)]
+        # One rng draw sequence per image, so an image's content does not depend on which ones exist
+        image_rng = random.Random(f"{seed}:{number}")
+        name = f"item-{number:05d}.jpg"
+        path = os.path.join(out_dir, name)
+        if not os.path.exists(path):
+            with Image.open(os.path.join(source_dir, source)) as image:
+                jitter_image(image, image_rng).save(path, "JPEG", quality=image_rng.randint(80, 95))
+        names.append(name)
+    return names
+
+
+def synthetic_items(image_paths, seed=0, occasion_count=3):
+    """
+    Classified item dicts (image_path, Category, Occasion, ...) for the given paths, with categories drawn
+    so that tops, bottoms, dresses and footwear all occur and occasions limited to occasion_count values.
+    """
+    rng = random.Random(seed)
+    groups = [("Top", tops), ("Bottom", bottoms), ("Dress", dresses), ("Footwear", footwear)]
+    weights = [0.35, 0.3, 0.1, 0.25]
+    used_occasions = occasions[:occasion_count]
+    items = []
+    for path in image_paths:
+        category, types = rng.choices(groups, weights)[0]
+        types = [clothing_type for clothing_type in clothing_types if clothing_type in types] or list(types)
+        items.append({
+            "image_url": path,
+            "image_path": path,
+            "Clothing_Type": rng.choice(types),
+            "Category": category,
+            "Occasion": rng.choice(used_occasions),
+            "Season": rng.choice(seasons),
+            "Material": rng.choice(materials),
+            "Dominant_Color": str((rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))),
+        })
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--source", default=DEFAULT_SOURCE_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    names = generate_wardrobe(args.out, args.size, args.source, args.seed)
+    print(f"{len(names)} images in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
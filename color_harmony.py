@@ -0,0 +1,45 @@
+# color_harmony.py
+import numpy as np
+
+# Score of items whose dominant color is unknown
+UNKNOWN_HARMONY = 0.5
+
+
+def _hsv(colors):
+    """Hue (degrees), saturation and value of an (N, 3) RGB array."""
+    rgb = np.asarray(colors, dtype=np.float64).reshape(-1, 3) / 255.0
+    high, low = rgb.max(axis=1), rgb.min(axis=1)
+    chroma = high - low
+    safe = np.where(chroma > 0, chroma, 1.0)
+    r, g, b = rgb.T
+    hue = np.select(
+        [chroma == 0, high == r, high == g],
+        [0.0, ((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4,
+    ) * 60.0
+    saturation = np.where(high > 0, chroma / np.where(high > 0, high, 1.0), 0.0)
+    return hue, saturation, high
+
+
+def harmony_scores(colors1, colors2):
+    """
+    Color-wheel harmony in [0, 1] of every (colors1[i], colors2[j]) pair of RGB colors, as an (N, M) array.
+    Neutrals (greys, near-black, near-white) go with anything; otherwise analogous, complementary and triadic
+    hue relations score high and clashing ones low. A model-free stand-in for compatibility scores.
+    """
+    hue1, saturation1, value1 = _hsv(colors1)
+    hue2, saturation2, value2 = _hsv(colors2)
+    gap = np.abs(hue1[:, None] - hue2[None, :])
+    gap = np.minimum(gap, 360.0 - gap)
+    scores = np.select([gap <= 30, gap >= 150, np.abs(gap - 120) <= 15], [0.9, 0.8, 0.7], 0.4)
+    neutral1 = (saturation1 < 0.2) | (value1 < 0.2) | ((value1 > 0.9) & (saturation1 < 0.3))
+    neutral2 = (saturation2 < 0.2) | (value2 < 0.2) | ((value2 > 0.9) & (saturation2 < 0.3))
+    return np.where(neutral1[:, None] | neutral2[None, :], 0.85, scores)
+
+
+def item_harmony(items, ids1, ids2):
+    """harmony_scores between the dominant colors of two lists of ItemTable ids; unknown colors score UNKNOWN_HARMONY."""
+    ids1, ids2 = np.asarray(ids1, dtype=np.int64), np.asarray(ids2, dtype=np.int64)
+    scores = harmony_scores(items.colors[ids1], items.colors[ids2])
+    known = items.has_color[ids1][:, None] & items.has_color[ids2][None, :]
+    return np.where(known, scores, UNKNOWN_HARMONY)
@@ -0,0 +1,143 @@
+# compute_budget.py
+import logging
+import math
+import time
+
+import numpy as np
+
+from telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+degraded_scores = metrics.counter(
+    "stylish_degraded_scores_total", "Outfit scores computed from a fallback signal after the compute budget ran out.",
+    ("signal",))
+
+# Scores from a fallback signal are shifted into a band below every model score (combined scores are
+# weighted averages of cosines and probabilities, so they stay above -1), which makes every ranking over a
+# mix of both order by (signal tier, score): model-scored outfits first, fallback-scored ones after them.
+FALLBACK_SCORE_OFFSET = -3.0
+_FALLBACK_THRESHOLD = -1.5
+
+
+def fallback_score(score):
+    """Ranking score of a score computed from a fallback signal."""
+    return score + FALLBACK_SCORE_OFFSET
+
+
+def is_fallback_score(score):
+    return score < _FALLBACK_THRESHOLD
+
+
+def raw_score(score):
+    """The score as computed, with the fallback shift removed."""
+    return score - FALLBACK_SCORE_OFFSET if is_fallback_score(score) else score
+
+
+def _tightened(name, default, override, convert):
+    """
+    The limit a request gets: the server default, lowered by the request's override. An override can only
+    tighten a limit the server set, so 0 or a missing value keeps the default and a larger value is capped.
+    """
+    if override is None:
+        return default
+    if isinstance(override, bool) or not isinstance(override, (int, float, str)):
+        raise TypeError(f"Budget {name} must be a number, got {type(override).__name__}")
+    value = float(override)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"Budget {name} must be a finite number >= 0, got {override!r}")
+    value = convert(value)
+    if not value:
+        return default
+    return min(default, value) if default else value
+
+
+def sample_prompts(prompts, max_prompts):
+    """At most max_prompts of the prompts, spread evenly over the list so every theme in it stays represented."""
+    if not max_prompts or len(prompts) <= max_prompts:
+        return list(prompts)
+    positions = np.linspace(0, len(prompts) - 1, max_prompts).round().astype(int)
+    return [prompts[position] for position in positions]
+
+
+class ComputeBudget:
+    """
+    Per-request limits on outfit scoring: at most max_pair_evaluations model-scored outfits (pairs and
+    three-piece outfits, cache hits are free), at most max_prompts prompts per outfit type, and a deadline
+    of deadline_seconds after the budget was created. None or 0 means unlimited. Once the evaluations or the
+    deadline run out, the analyzer scores the remaining outfits from cheaper signals and records them here,
+    which marks the result as partial.
+    """
+
+    def __init__(self, max_pair_evaluations=None, max_prompts=None, deadline_seconds=None, clock=time.monotonic):
+        self.max_pair_evaluations = max_pair_evaluations or None
+        self.max_prompts = max_prompts or None
+        self.deadline_seconds = deadline_seconds or None
+        self.clock = clock
+        self.started = clock()
+        self.pair_evaluations = 0
+        self.fallback_scores = {}
+        self.outfit_searches = {}
+        self._exhausted = None
+
+    @classmethod
+    def from_request(cls, overrides, max_pair_evaluations=None, max_prompts=None, deadline_seconds=None):
+        """
+        Budget from the server's limits, tightened by a request's "budget" object: a request may lower a
+        configured limit or set one the server leaves unlimited, but never raise or remove one. Raises
+        TypeError or ValueError for limits that are not finite, non-negative numbers.
+        """
+        if overrides is None:
+            overrides = {}
+        elif not isinstance(overrides, dict):
+            raise TypeError(f"Budget overrides must be a dict, got {type(overrides).__name__}")
+        return cls(
+            max_pair_evaluations=_tightened("max_pair_evaluations", max_pair_evaluations,
+                                            overrides.get("max_pair_evaluations"), int),
+            max_prompts=_tightened("max_prompts", max_prompts, overrides.get("max_prompts"), int),
+            deadline_seconds=_tightened("deadline_seconds", deadline_seconds, overrides.get("deadline_seconds"), float),
+        )
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def exhausted(self):
+        """None while model scoring is allowed, else why not: "deadline" or "pair_evaluations"."""
+        if self.deadline_seconds is not None and self.elapsed() >= self.deadline_seconds:
+            reason = "deadline"
+        elif self.max_pair_evaluations is not None and self.pair_evaluations >= self.max_pair_evaluations:
+            reason = "pair_evaluations"
+        else:
+            return None
+        if self._exhausted is None:
+            logger.info(f"Compute budget exhausted ({reason}) after {self.pair_evaluations} evaluations "
+                        f"and {self.elapsed():.2f}s; falling back to cheaper scores")
+        self._exhausted = self._exhausted or reason
+        return reason
+
+    def charge(self, evaluations=1):
+        self.pair_evaluations += evaluations
+
+    def record_fallback(self, signal, count=1):
+        self.fallback_scores[signal] = self.fallback_scores.get(signal, 0) + count
+        degraded_scores.inc(count, signal=signal)
+
+    def record_search(self, label, estimate):
+        """Records the evaluations an outfit search was planned with and whether its result is exact."""
+        self.outfit_searches[label] = estimate
+
+    @property
+    def partial(self):
+        return bool(self.fallback_scores)
+
+    def stats(self):
+        return {
+            "max_pair_evaluations": self.max_pair_evaluations,
+            "max_prompts": self.max_prompts,
+            "deadline_seconds": self.deadline_seconds,
+            "pair_evaluations": self.pair_evaluations,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "exhausted": self._exhausted,
+            "fallback_scores": dict(self.fallback_scores),
+            "outfit_searches": dict(self.outfit_searches),
+        }
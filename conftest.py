@@ -0,0 +1,79 @@
+# conftest.py
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from PIL import Image
+
+# Token ids of the tiny CLIP text tower: every text starts with BOS and ends with EOS, the position CLIP pools
+TINY_CLIP_BOS, TINY_CLIP_EOS = 1, 99
+
+
+class _Inputs(dict):
+    def to(self, device):
+        return _Inputs({key: value.to(device) for key, value in self.items()})
+
+    def __getattr__(self, key):
+        return self[key]
+
+
+class TinyClipProcessor:
+    """Stand-in for CLIPProcessor: hashes words to token ids and resizes images to the tiny model's input."""
+
+    def __call__(self, text=None, images=None, return_tensors="pt", padding=True):
+        inputs = _Inputs()
+        if text is not None:
+            texts = [text] if isinstance(text, str) else text
+            tokens = [[TINY_CLIP_BOS] + [sum(map(ord, word)) % 90 + 3 for word in entry.split()][:14] + [TINY_CLIP_EOS]
+                      for entry in texts]
+            input_ids = torch.zeros(len(tokens), max(map(len, tokens)), dtype=torch.long)
+            for row, ids in enumerate(tokens):
+                input_ids[row, :len(ids)] = torch.tensor(ids)
+            inputs["input_ids"] = input_ids
+            inputs["attention_mask"] = (input_ids != 0).long()
+        if images is not None:
+            images = images if isinstance(images, (list, tuple)) else [images]
+            pixels = [np.asarray(image.convert("RGB").resize((30, 30)), dtype=np.float32) / 255 for image in images]
+            inputs["pixel_values"] = torch.from_numpy(np.stack(pixels)).permute(0, 3, 1, 2)
+        return inputs
+
+
+@pytest.fixture(scope="session")
+def tiny_clip():
+    """A randomly initialised CLIPModel small enough for real forward passes in tests, without downloads."""
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(0)
+    config = transformers.CLIPConfig(
+        text_config=dict(vocab_size=100, hidden_size=32, intermediate_size=37, num_attention_heads=4,
+                         num_hidden_layers=2, max_position_embeddings=32, bos_token_id=TINY_CLIP_BOS,
+                         eos_token_id=TINY_CLIP_EOS, pad_token_id=TINY_CLIP_EOS),
+        vision_config=dict(hidden_size=32, intermediate_size=37, num_attention_heads=4, num_hidden_layers=2,
+                           image_size=30, patch_size=6),
+        projection_dim=16,
+    )
+    return transformers.CLIPModel(config).eval()
+
+
+@pytest.fixture
+def tiny_clip_processor():
+    return TinyClipProcessor()
+
+
+@pytest.fixture
+def wardrobe_frame(tmp_path):
+    """A classified Casual wardrobe of solid-color images: three tops, two bottoms, two shoes and top1 twice."""
+    colors = {"top1": (200, 30, 30), "top2": (30, 200, 30), "top3": (30, 30, 200), "bottom1": (20, 20, 20),
+              "bottom2": (220, 220, 200), "shoe1": (120, 60, 10), "shoe2": (250, 250, 250)}
+    paths = {}
+    for name, color in colors.items():
+        paths[name] = str(tmp_path / f"{name}.png")
+        Image.new("RGB", (40, 40), color).save(paths[name])
+    rows = [(name, "Top" if name.startswith("top") else "Bottom" if name.startswith("bottom") else "Footwear")
+            for name in colors]
+    # top1 appears twice, as when one image is submitted under two URLs
+    rows.append(("top1", "Top"))
+    return pd.DataFrame([
+        {"image_path": paths[name], "image_url": paths[name], "Clothing_Type": "x", "Category": category,
+         "Occasion": "Casual", "Season": "Summer", "Material": "Cotton", "Dominant_Color": str(colors[name])}
+        for name, category in rows
+    ])
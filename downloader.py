@@ -0,0 +1,187 @@
+# downloader.py
+import asyncio
+import logging
+import os
+import random
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying; any other 4xx/5xx fails immediately
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """A failed image download; transient errors (timeouts, resets, 5xx, 429) were retried before raising."""
+
+    def __init__(self, message, status=None, transient=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.transient = transient
+        self.retry_after = retry_after
+
+
+class DownloadResult:
+    """Body and validators of a response; content is None when the server answered 304 Not Modified."""
+
+    def __init__(self, status, content=None, etag=None, last_modified=None):
+        self.status = status
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+
+class ImageDownloader:
+    """
+    Process-wide image download client.
+
+    Flask runs every async view on its own short-lived event loop, so a session opened inside a request
+    cannot be reused by the next one. The downloader instead owns one background event loop with a single
+    aiohttp session, which keeps a keep-alive connection pool per host (Firebase Storage) across requests.
+    Callers on any loop await fetch(); concurrency is bounded by a semaphore, bodies are streamed and
+    cut off at max_bytes, and transient failures are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, max_concurrency=16, limit_per_host=8, max_bytes=20 * 1024 * 1024, timeout=60,
+                 connect_timeout=10, retries=3, backoff=0.5, user_agent="Mozilla/5.0"):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._session = None
+        self._semaphore = None
+        self._stats = {"requests": 0, "downloaded": 0, "not_modified": 0, "retries": 0, "failures": 0,
+                       "bytes": 0, "in_flight": 0}
+
+    def _ensure_loop(self):
+        # The loop thread does not survive fork, so each worker process starts its own
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name="image-downloader", daemon=True).start()
+            ready.wait()
+            self._loop, self._pid = loop, os.getpid()
+            self._session, self._semaphore = None, None
+            return loop
+
+    def _get_session(self):
+        # Only called on the downloader loop, so no locking is needed
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  headers={"User-Agent": self.user_agent})
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def fetch(self, url, etag=None, last_modified=None):
+        """
+        Downloads url, sending If-None-Match / If-Modified-Since when validators of a cached copy are given.
+        Returns a DownloadResult or raises DownloadError. Can be awaited from any event loop.
+        """
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._fetch_with_retries(url, etag, last_modified), loop)
+        return await asyncio.wrap_future(future)
+
+    async def _fetch_with_retries(self, url, etag, last_modified):
+        session = self._get_session()
+        async with self._semaphore:
+            self._stats["in_flight"] += 1
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        return await self._fetch_once(session, url, etag, last_modified)
+                    except DownloadError as e:
+                        if not e.transient or attempt == self.retries:
+                            self._stats["failures"] += 1
+                            raise
+                        delay = e.retry_after or self.backoff * 2 ** attempt * (0.5 + random.random())
+                        self._stats["retries"] += 1
+                        logger.warning(f"Retrying {url} in {delay:.2f}s after: {e}")
+                        await asyncio.sleep(delay)
+            finally:
+                self._stats["in_flight"] -= 1
+
+    async def _fetch_once(self, session, url, etag, last_modified):
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        self._stats["requests"] += 1
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    self._stats["not_modified"] += 1
+                    return DownloadResult(304, etag=etag, last_modified=last_modified)
+                if response.status >= 400:
+                    retry_after = response.headers.get("Retry-After", "")
+                    raise DownloadError(f"HTTP {response.status} for {url}", status=response.status,
+                                        transient=response.status in TRANSIENT_STATUSES,
+                                        retry_after=min(float(retry_after), self.timeout) if retry_after.isdigit() else None)
+                content_type = response.headers.get("Content-Type", "")
+                if not (content_type.startswith("image/") or "octet-stream" in content_type):
+                    raise DownloadError(f"Invalid content type: {content_type}", status=response.status)
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    raise DownloadError(f"Image too large: {response.content_length} bytes", status=response.status)
+                content = await self._read_limited(response)
+                self._stats["downloaded"] += 1
+                self._stats["bytes"] += len(content)
+                return DownloadResult(response.status, content, etag=response.headers.get("ETag"),
+                                      last_modified=response.headers.get("Last-Modified"))
+        except DownloadError:
+            raise
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            raise DownloadError(f"{type(e).__name__} for {url}: {e}", transient=True) from e
+        except aiohttp.ClientError as e:
+            raise DownloadError(f"{type(e).__name__} for {url}: {e}") from e
+
+    async def _read_limited(self, response):
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise DownloadError(f"Image exceeds {self.max_bytes} bytes", status=response.status)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def stats(self):
+        return dict(self._stats)
+
+    def close(self):
+        """Closes the session and stops the background loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            session, self._session = self._session, None
+            if loop is None or self._pid != os.getpid():
+                return
+        if session is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Could not close download session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
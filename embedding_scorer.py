@@ -0,0 +1,140 @@
+# embedding_scorer.py
+import logging
+
+import numpy as np
+import torch
+
+from compute_budget import sample_prompts
+from inference import inference_context, as_float
+
+logger = logging.getLogger(__name__)
+
+# Anchors used by the visual score and the negative used by the text score, as in OutfitCompatibilityAnalyzer
+VISUAL_ANCHORS = ["a fashionable outfit", "an unfashionable outfit"]
+NEGATIVE_PROMPT = "unfashionable combination"
+
+
+def general_prompts(prompts):
+    """Returns the prompts that have no {placeholders}, i.e. the ones that do not depend on item attributes."""
+    return [prompt for prompt in prompts if "{" not in prompt]
+
+
+def _normalize(features):
+    return features / features.norm(dim=-1, keepdim=True)
+
+
+class EmbeddingCompatibilityScorer:
+    """
+    Scores outfit compatibility from CLIP embeddings computed once per item image and once per prompt.
+    An outfit is represented by the normalized sum of its item embeddings instead of a freshly encoded
+    side-by-side image, so every pair or triple score is a dot product rather than a forward pass.
+    """
+
+    def __init__(self, clip_processor, clip_model, compatibility_prompts, batch_size=16, max_prompts=None):
+        self.clip_processor = clip_processor
+        self.clip_model = clip_model
+        self.compatibility_prompts = compatibility_prompts
+        self.batch_size = batch_size
+        self.max_prompts = max_prompts
+        self.item_index = {}
+        self.item_embeddings = None
+        self._prompt_embeddings = {}
+        self._anchor_embeddings = None
+        self._negative_embedding = None
+        self.logit_scale = float(clip_model.logit_scale.exp().item()) if hasattr(clip_model, "logit_scale") else 100.0
+
+    def has_item(self, key):
+        return key in self.item_index
+
+    def add_items(self, images_by_key):
+        """Encodes the given {key: PIL image} mapping through the vision tower in batches."""
+        keys = [key for key in images_by_key if key not in self.item_index and images_by_key[key] is not None]
+        if not keys:
+            return
+        batches = []
+        for start in range(0, len(keys), self.batch_size):
+            batch_keys = keys[start:start + self.batch_size]
+            image_inputs = self.clip_processor(images=[images_by_key[key] for key in batch_keys], return_tensors="pt")
+            with inference_context():
+                image_features = as_float(self.clip_model.get_image_features(**image_inputs))
+            batches.append(_normalize(image_features).cpu())
+        new_embeddings = torch.cat(batches)
+        offset = 0 if self.item_embeddings is None else self.item_embeddings.shape[0]
+        self.item_embeddings = new_embeddings if self.item_embeddings is None else torch.cat([self.item_embeddings, new_embeddings])
+        for position, key in enumerate(keys):
+            self.item_index[key] = offset + position
+
+    def embeddings_for(self, keys):
+        """Returns the (len(keys), D) embedding matrix for the given item keys."""
+        return self.item_embeddings[[self.item_index[key] for key in keys]]
+
+    def _encode_texts(self, texts):
+        text_inputs = self.clip_processor(text=texts, return_tensors="pt", padding=True)
+        with inference_context():
+            text_features = as_float(self.clip_model.get_text_features(**text_inputs))
+        return _normalize(text_features).cpu()
+
+    def anchor_embeddings(self):
+        if self._anchor_embeddings is None:
+            self._anchor_embeddings = self._encode_texts(VISUAL_ANCHORS)
+        return self._anchor_embeddings
+
+    def negative_embedding(self):
+        if self._negative_embedding is None:
+            self._negative_embedding = self._encode_texts([NEGATIVE_PROMPT])[0]
+        return self._negative_embedding
+
+    def prompt_embeddings(self, outfit_type):
+        """Encodes the attribute-free prompts (at most max_prompts) for an outfit type once and caches them."""
+        if outfit_type not in self._prompt_embeddings:
+            prompts = sample_prompts(general_prompts(self.compatibility_prompts.get(outfit_type, [])), self.max_prompts)
+            self._prompt_embeddings[outfit_type] = self._encode_texts(prompts) if prompts else None
+        return self._prompt_embeddings[outfit_type]
+
+    def outfit_scores(self, outfit_embeddings, outfit_type):
+        """
+        Returns (visual, text) score arrays for un-normalized outfit embeddings of shape (..., D).
+        visual is the cosine with "a fashionable outfit"; text is the mean over prompts of the
+        two-way softmax against the negative prompt, matching the per-image scores of the analyzer.
+        """
+        outfits = _normalize(outfit_embeddings)
+        visual = outfits @ self.anchor_embeddings()[0]
+        prompts = self.prompt_embeddings(outfit_type)
+        if prompts is None:
+            text = torch.zeros_like(visual)
+        else:
+            prompt_logits = outfits @ prompts.T
+            negative_logits = (outfits @ self.negative_embedding()).unsqueeze(-1)
+            # softmax([a, b])[0] == sigmoid(a - b)
+            text = torch.sigmoid(self.logit_scale * (prompt_logits - negative_logits)).mean(dim=-1)
+        return visual.numpy(), text.numpy()
+
+    def score_gradient(self, base, candidate, outfit_type, visual_weight, text_weight):
+        """
+        Gradient of visual_weight * visual + text_weight * text for the outfit base + candidate with respect to
+        the candidate embedding. The inner product with it ranks candidates by the first-order expansion of
+        the score around `candidate`, which is what a vector index can search.
+        """
+        outfit = base + candidate
+        norm = outfit.norm()
+        outfit = outfit / norm
+        gradient = visual_weight * self.anchor_embeddings()[0]
+        prompts = self.prompt_embeddings(outfit_type)
+        if prompts is not None:
+            directions = prompts - self.negative_embedding()
+            probabilities = torch.sigmoid(self.logit_scale * (directions @ outfit))
+            slopes = self.logit_scale * probabilities * (1 - probabilities) / len(directions)
+            gradient = gradient + text_weight * (slopes @ directions)
+        # Through the normalization: only the component orthogonal to the outfit changes the score
+        return (gradient - (gradient @ outfit) * outfit) / norm
+
+    def pair_scores(self, keys1, keys2, outfit_type):
+        """Scores every (keys1[i], keys2[j]) pair in one tensor op; returns two (N, M) arrays."""
+        embeddings1 = self.embeddings_for(keys1)
+        embeddings2 = self.embeddings_for(keys2)
+        return self.outfit_scores(embeddings1[:, None, :] + embeddings2[None, :, :], outfit_type)
+
+    def triple_scores(self, key1, key2, keys3, outfit_type="top_bottom_footwear"):
+        """Scores (key1, key2, keys3[k]) outfits for every k; returns two (K,) arrays."""
+        base = self.embeddings_for([key1, key2]).sum(dim=0)
+        return self.outfit_scores(base[None, :] + self.embeddings_for(keys3), outfit_type)
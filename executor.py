@@ -0,0 +1,78 @@
+# executor.py
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model work (CLIP, rembg, color clustering) on a bounded thread pool so async handlers
+    keep downloading while earlier images are inferred. Torch and ONNX Runtime release the GIL inside
+    their kernels, so threads overlap well and share one copy of the weights (a process pool would not).
+    Per-stage queued/running/completed counts are kept for observability.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "busy_seconds": 0.0}
+        return self._stages[stage]
+
+    def _run_tracked(self, stage, fn, args, kwargs):
+        with self._lock:
+            counters = self._stage(stage)
+            counters["queued"] -= 1
+            counters["running"] += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                counters["running"] -= 1
+                counters["failed" if failed else "completed"] += 1
+                counters["busy_seconds"] += time.perf_counter() - start
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool and awaits its result, in a copy of the caller's context."""
+        with self._lock:
+            self._stage(stage)["queued"] += 1
+        if self._pid != os.getpid():
+            # A forked worker inherits the pool object but none of its threads
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+            self._pid = os.getpid()
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry context variables over (unlike asyncio.to_thread), and the
+        # request's trace lives in one
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._pool, context.run, self._run_tracked, stage, fn, args, kwargs)
+
+    def backlog(self):
+        """Number of submitted jobs still waiting for a worker, across all stages."""
+        with self._lock:
+            return sum(counters["queued"] for counters in self._stages.values())
+
+    def stats(self):
+        """Returns {stage: {queued, running, completed, failed, busy_seconds}} plus the pool size."""
+        with self._lock:
+            stages = {stage: {**counters, "busy_seconds": round(counters["busy_seconds"], 3)}
+                      for stage, counters in self._stages.items()}
+        return {"max_workers": self.max_workers, "stages": stages}
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,203 @@
+# image_cache.py
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from urllib.parse import urlsplit, urlunsplit
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (256, 256)
+
+
+def normalize_url(url):
+    """Normalizes a URL for use as a cache key (lower-case scheme and host, default ports dropped)."""
+    parts = urlsplit(url.strip())
+    if not parts.scheme:
+        return os.path.abspath(url)
+    netloc = parts.netloc.lower()
+    if (parts.scheme == "https" and netloc.endswith(":443")) or (parts.scheme == "http" and netloc.endswith(":80")):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path, parts.query, ""))
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class CachedImage:
+    """A decoded image plus its pre-resized thumbnail, keyed by the hash of the encoded bytes."""
+
+    def __init__(self, content_hash, image, thumbnail, etag=None, last_modified=None, validated_at=None):
+        self.content_hash = content_hash
+        self.image = image
+        self.thumbnail = thumbnail
+        self.etag = etag
+        self.last_modified = last_modified
+        # When the origin last confirmed these bytes (None for entries restored from disk)
+        self.validated_at = validated_at
+        self.nbytes = _image_nbytes(image) + _image_nbytes(thumbnail)
+
+
+def _image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageCache:
+    """
+    Bounded LRU cache of decoded images keyed by normalized URL and content hash.
+    The memory tier is limited to max_bytes of decoded pixels; if disk_dir is set, the encoded
+    bytes are also kept on disk so later requests can skip the download.
+    Entries with an ETag or Last-Modified become stale revalidate_after seconds after the origin last
+    confirmed them, and are then revalidated with a conditional request instead of being downloaded again.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, thumbnail_size=THUMBNAIL_SIZE, revalidate_after=3600):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.thumbnail_size = thumbnail_size
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()
+        self._url_index = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, url):
+        """Returns the CachedImage for a URL or None, checking memory first and then the disk tier."""
+        key = normalize_url(url)
+        with self._lock:
+            digest = self._url_index.get(key)
+            entry = self._entries.get(digest) if digest else None
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+
+        entry = self._load_from_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, url, content, etag=None, last_modified=None):
+        """Decodes content, caches it under the URL and its content hash, and returns the CachedImage."""
+        key = normalize_url(url)
+        digest = content_hash(content)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                # Same bytes behind a different URL (or re-downloaded): share the decoded image
+                self._url_index[key] = digest
+                self._entries.move_to_end(digest)
+                entry.etag = etag or entry.etag
+                entry.last_modified = last_modified or entry.last_modified
+                entry.validated_at = time.time()
+        if entry is not None:
+            self._save_to_disk(key, entry, content)
+            return entry
+
+        entry = self._decode(digest, content, etag, last_modified)
+        entry.validated_at = time.time()
+        with self._lock:
+            self._insert(key, entry)
+        self._save_to_disk(key, entry, content)
+        return entry
+
+    def is_fresh(self, entry):
+        """True if the entry can be served without asking the origin; entries without validators always are."""
+        if self.revalidate_after is None or not (entry.etag or entry.last_modified):
+            return True
+        return entry.validated_at is not None and time.time() - entry.validated_at < self.revalidate_after
+
+    def mark_validated(self, entry):
+        """Records that the origin answered 304 Not Modified for this entry."""
+        entry.validated_at = time.time()
+
+    def image(self, url):
+        entry = self.get(url)
+        return entry.image if entry else None
+
+    def thumbnail(self, url):
+        entry = self.get(url)
+        return entry.thumbnail if entry else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._url_index.clear()
+            self.current_bytes = 0
+
+    def _decode(self, digest, content, etag, last_modified):
+        image = Image.open(BytesIO(content))
+        image.load()
+        thumbnail = image.convert("RGB").resize(self.thumbnail_size)
+        return CachedImage(digest, image, thumbnail, etag=etag, last_modified=last_modified)
+
+    def _insert(self, key, entry):
+        if entry.content_hash not in self._entries:
+            self._entries[entry.content_hash] = entry
+            self.current_bytes += entry.nbytes
+        self._entries.move_to_end(entry.content_hash)
+        self._url_index[key] = entry.content_hash
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            digest, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            for url_key in [k for k, v in self._url_index.items() if v == digest]:
+                del self._url_index[url_key]
+
+    def _url_file(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".url")
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._url_file(key), "r", encoding="utf-8") as f:
+                digest, etag, last_modified = (f.read().split("\n") + ["", ""])[:3]
+            with open(os.path.join(self.disk_dir, digest + ".img"), "rb") as f:
+                content = f.read()
+            return self._decode(digest, content, etag or None, last_modified or None)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable disk cache entry for {key}: {e}")
+            return None
+
+    def _save_to_disk(self, key, entry, content):
+        if not self.disk_dir:
+            return
+        try:
+            image_path = os.path.join(self.disk_dir, entry.content_hash + ".img")
+            if not os.path.exists(image_path):
+                tmp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, image_path)
+            with open(self._url_file(key), "w", encoding="utf-8") as f:
+                f.write("\n".join([entry.content_hash, entry.etag or "", entry.last_modified or ""]))
+        except OSError as e:
+            logger.warning(f"Could not write disk cache entry for {key}: {e}")
@@ -0,0 +1,113 @@
+# inference.py
+import logging
+import os
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Torch intra-op threads (0 keeps torch's default) and optional CPU autocast ("bf16" or empty)
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", "0"))
+INFERENCE_AUTOCAST = os.environ.get("INFERENCE_AUTOCAST", "").lower()
+
+_threads_configured = False
+
+
+def configure_torch_threads(num_threads=TORCH_NUM_THREADS, interop_threads=TORCH_INTEROP_THREADS):
+    """Applies the configured torch thread counts once per process."""
+    global _threads_configured
+    if _threads_configured:
+        return
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Only allowed before the first parallel op runs
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+    _threads_configured = True
+
+
+@contextmanager
+def inference_context(device="cpu", autocast=INFERENCE_AUTOCAST):
+    """Runs model calls without autograd, optionally under bf16 autocast on CPU."""
+    use_bf16 = autocast == "bf16" and str(device).startswith("cpu")
+    autocast_context = torch.autocast("cpu", dtype=torch.bfloat16) if use_bf16 else nullcontext()
+    with torch.inference_mode(), autocast_context:
+        yield
+
+
+def as_float(tensor):
+    """Casts autocast (bf16) outputs back to float32; float32 tensors are returned as is."""
+    return tensor.float() if tensor.dtype != torch.float32 else tensor
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None where unavailable."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss_bytes():
+    """Current resident set size from /proc, or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def memory_breakdown():
+    """
+    RSS split into pages shared with other processes (e.g. model weights inherited copy-on-write from a
+    preloading parent) and private pages, from /proc/self/smaps_rollup; None where unavailable.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 2**20, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 2**20, 1),
+        "shared_mb": round(shared / 2**20, 1),
+        "private_mb": round(private / 2**20, 1),
+    }
+
+
+class RequestMemoryTracker:
+    """
+    Memory figures around a request, to size worker counts per host. ru_maxrss is the process's lifetime
+    peak, so the peak figures are reported as process_* values; rss_delta_mb, the change in current RSS
+    over the request, is the per-request figure (other requests running concurrently still add to it).
+    """
+
+    def __init__(self):
+        self.peak_before = peak_rss_bytes()
+        self.rss_before = current_rss_bytes()
+
+    def report(self):
+        peak_after = peak_rss_bytes()
+        rss_after = current_rss_bytes()
+        return {
+            "process_peak_rss_mb": round(peak_after / 2**20, 1) if peak_after is not None else None,
+            "process_peak_rss_growth_mb": round((peak_after - self.peak_before) / 2**20, 1) if peak_after is not None else None,
+            "rss_mb": round(rss_after / 2**20, 1) if rss_after is not None else None,
+            "rss_delta_mb": round((rss_after - self.rss_before) / 2**20, 1) if rss_after is not None and self.rss_before is not None else None,
+        }
@@ -0,0 +1,216 @@
+# item_store.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join(os.getcwd(), "files", "items.sqlite3")
+
+# Columns of files/Classified.csv and the store column each one maps to
+CSV_COLUMNS = {
+    "image_name": "image_name",
+    "Clothing_Type": "clothing_type",
+    "Category": "category",
+    "Occasion": "occasion",
+    "Season": "season",
+    "Material": "material",
+    "Dominant Color": "dominant_color",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    content_hash TEXT NOT NULL,
+    model_key TEXT NOT NULL,
+    image_name TEXT,
+    clothing_type TEXT,
+    category TEXT,
+    occasion TEXT,
+    season TEXT,
+    material TEXT,
+    dominant_color TEXT,
+    embedding BLOB,
+    embedding_dim INTEGER,
+    updated_at REAL,
+    PRIMARY KEY (content_hash, model_key)
+)
+"""
+
+
+def file_content_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ItemStore:
+    """
+    SQLite store of classified wardrobe items keyed by image content hash and model key
+    (model name plus label hash), so resubmitted images skip classification entirely.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers proceed while another worker writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # SQLite connections must not be used across fork, so a forked worker opens its own
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, content_hashes, model_key):
+        """Returns {content_hash: item dict} for the hashes already classified under model_key."""
+        content_hashes = list(dict.fromkeys(content_hashes))
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(content_hashes), 500):
+            chunk = content_hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT content_hash, image_name, clothing_type, category, occasion, season, material, "
+                f"dominant_color, embedding, embedding_dim FROM items "
+                f"WHERE model_key = ? AND content_hash IN ({placeholders})",
+                [model_key, *chunk],
+            ).fetchall()
+            for row in rows:
+                found[row[0]] = self._row_to_item(row)
+        return found
+
+    def put_many(self, items, model_key):
+        """
+        Upserts items, each a dict with content_hash, the classification columns
+        and an optional float32 embedding.
+        """
+        now = time.time()
+        records = []
+        for item in items:
+            embedding = item.get("embedding")
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype=np.float32)
+            records.append((
+                item["content_hash"], model_key, item.get("image_name"),
+                item.get("clothing_type"), item.get("category"), item.get("occasion"),
+                item.get("season"), item.get("material"), item.get("dominant_color"),
+                embedding.tobytes() if embedding is not None else None,
+                int(embedding.shape[-1]) if embedding is not None else None,
+                now,
+            ))
+        if not records:
+            return 0
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO items (content_hash, model_key, image_name, clothing_type, category, occasion, "
+                "season, material, dominant_color, embedding, embedding_dim, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(content_hash, model_key) DO UPDATE SET "
+                "image_name = excluded.image_name, clothing_type = excluded.clothing_type, "
+                "category = excluded.category, occasion = excluded.occasion, season = excluded.season, "
+                "material = excluded.material, dominant_color = excluded.dominant_color, "
+                "embedding = COALESCE(excluded.embedding, items.embedding), "
+                "embedding_dim = COALESCE(excluded.embedding_dim, items.embedding_dim), "
+                "updated_at = excluded.updated_at",
+                records,
+            )
+        return len(records)
+
+    def count(self, model_key=None):
+        conn = self._connect()
+        if model_key is None:
+            return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        return conn.execute("SELECT COUNT(*) FROM items WHERE model_key = ?", (model_key,)).fetchone()[0]
+
+    def embedding_version(self, model_key):
+        """
+        (count, latest updated_at) of the items stored with an embedding under model_key. Every upsert
+        advances updated_at, so this changes whenever an item is added or reclassified.
+        """
+        count, updated_at = self._connect().execute(
+            "SELECT COUNT(*), MAX(updated_at) FROM items WHERE model_key = ? AND embedding IS NOT NULL", (model_key,)
+        ).fetchone()
+        return count, updated_at or 0.0
+
+    def iter_embeddings(self, model_key, batch_size=1000, updated_after=None):
+        """
+        Yields (content_hash, image_name, category, occasion, season, embedding) for items stored with an
+        embedding, optionally only those upserted after the updated_after timestamp.
+        """
+        conn = self._connect()
+        cursor = conn.execute(
+            "SELECT content_hash, image_name, category, occasion, season, embedding, embedding_dim FROM items "
+            "WHERE model_key = ? AND embedding IS NOT NULL AND (? IS NULL OR updated_at > ?) ORDER BY content_hash",
+            (model_key, updated_after, updated_after),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for content_hash, image_name, category, occasion, season, blob, dim in rows:
+                yield content_hash, image_name, category, occasion, season, np.frombuffer(blob, dtype=np.float32).reshape(dim)
+
+    def import_csv(self, csv_path, image_dir, model_key):
+        """
+        Bulk-imports a Classified.csv file. Rows are keyed by the content hash of
+        image_dir/image_name, so rows whose image file is missing are skipped. Categories are re-derived
+        from the clothing type, since older files used a mapping without footwear. Imported rows have no
+        embedding, and lookups that need one (classification, retrieval) treat them as not yet classified.
+        """
+        from utils import map_category
+
+        df = pd.read_csv(csv_path)
+        items = []
+        skipped = 0
+        for row in df.to_dict("records"):
+            image_path = os.path.join(image_dir, str(row.get("image_name", "")))
+            if not os.path.isfile(image_path):
+                skipped += 1
+                continue
+            item = {column: row.get(csv_column) for csv_column, column in CSV_COLUMNS.items()}
+            item = {key: (None if pd.isna(value) else value) for key, value in item.items()}
+            if item["clothing_type"] is not None:
+                item["category"] = map_category(item["clothing_type"])
+            item["content_hash"] = file_content_hash(image_path)
+            items.append(item)
+        imported = self.put_many(items, model_key)
+        logger.info(f"Imported {imported} items from {csv_path} ({skipped} rows without an image file)")
+        return imported
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row_to_item(row):
+        content_hash, image_name, clothing_type, category, occasion, season, material, dominant_color, blob, dim = row
+        embedding = np.frombuffer(blob, dtype=np.float32).reshape(dim) if blob is not None and dim else None
+        return {
+            "content_hash": content_hash,
+            "image_name": image_name,
+            "clothing_type": clothing_type,
+            "category": category,
+            "occasion": occasion,
+            "season": season,
+            "material": material,
+            "dominant_color": dominant_color,
+            "embedding": embedding,
+        }
@@ -0,0 +1,99 @@
+# item_table.py
+import logging
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Label columns stored as integer codes into a per-column list of values
+LABEL_COLUMNS = ("Clothing_Type", "Category", "Occasion", "Season", "Material")
+_RGB_PATTERN = re.compile(r"\b\d+\b")
+
+
+def parse_rgb(value):
+    """Parses an "(r, g, b)" color string (as stored in Dominant_Color) into three ints; None if it has none."""
+    if isinstance(value, (tuple, list, np.ndarray)) and len(value) >= 3:
+        return tuple(int(channel) for channel in value[:3])
+    numbers = _RGB_PATTERN.findall(str(value)) if value is not None else []
+    if len(numbers) < 3:
+        return None
+    return tuple(min(255, int(number)) for number in numbers[:3])
+
+
+class ItemTable:
+    """
+    Columnar view of a request's classified items, built once. Items are addressed by integer id
+    (their row), label columns are categorical codes (-1 for missing values), Dominant_Color is a uint8 RGB
+    array and embeddings, once set, an (n, D) float32 matrix, so filters and scores are array operations
+    instead of DataFrame copies and per-row dict conversions. record(i) returns the original item dict.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self.ids = np.arange(len(self.records))
+        self.image_paths = [record.get("image_path") for record in self.records]
+        # Id of the first item with the same image path, so duplicate rows of one image share cached scores
+        first = {}
+        self.canonical = np.array([first.setdefault(path, i) if path is not None else i
+                                   for i, path in enumerate(self.image_paths)], dtype=np.int64)
+        self.values = {}
+        self.codes = {}
+        for column in LABEL_COLUMNS:
+            values, codes = [], np.full(len(self.records), -1, dtype=np.int32)
+            positions = {}
+            for i, record in enumerate(self.records):
+                value = record.get(column)
+                if value is None or value != value:  # None or NaN
+                    continue
+                if value not in positions:
+                    positions[value] = len(values)
+                    values.append(value)
+                codes[i] = positions[value]
+            self.values[column] = values
+            self.codes[column] = codes
+        self.colors = np.zeros((len(self.records), 3), dtype=np.uint8)
+        self.has_color = np.zeros(len(self.records), dtype=bool)
+        for i, record in enumerate(self.records):
+            rgb = parse_rgb(record.get("Dominant_Color"))
+            if rgb is not None:
+                self.colors[i] = rgb
+                self.has_color[i] = True
+        self.embeddings = None
+        self.has_embedding = np.zeros(len(self.records), dtype=bool)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df.to_dict("records"))
+
+    def __len__(self):
+        return len(self.records)
+
+    def code(self, column, value):
+        """Code of value in column; values no item has (including None) get -2, which matches no item."""
+        try:
+            return self.values[column].index(value)
+        except ValueError:
+            return -2
+
+    def value(self, column, item_id, default=None):
+        code = self.codes[column][item_id]
+        return self.values[column][code] if code >= 0 else default
+
+    def select(self, **filters):
+        """Ids of the items whose label columns equal the given values, e.g. select(Category="Top", Occasion=occasion)."""
+        mask = np.ones(len(self.records), dtype=bool)
+        for column, value in filters.items():
+            mask &= self.codes[column] == self.code(column, value)
+        return self.ids[mask]
+
+    def set_embeddings(self, item_ids, embeddings):
+        """Stores embedding rows for the given ids; other rows stay zero and marked missing."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.embeddings is None:
+            self.embeddings = np.zeros((len(self.records), embeddings.shape[-1]), dtype=np.float32)
+        self.embeddings[item_ids] = embeddings
+        self.has_embedding[item_ids] = True
+
+    def record(self, item_id):
+        return self.records[item_id]
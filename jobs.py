@@ -0,0 +1,375 @@
+# jobs.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_STORE_PATH = os.path.join(os.getcwd(), "files", "jobs.sqlite3")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    request_key TEXT,
+    content_key TEXT,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    deduplicated_from TEXT,
+    owner TEXT,
+    created_at REAL,
+    updated_at REAL
+)
+"""
+JOB_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS jobs_request_key ON jobs (request_key)",
+    "CREATE INDEX IF NOT EXISTS jobs_content_key ON jobs (content_key)",
+)
+JOB_COLUMNS = ("job_id", "request_key", "content_key", "status", "payload", "progress", "result", "error",
+               "deduplicated_from", "owner", "created_at", "updated_at")
+
+
+def process_owner():
+    """Identifies this process as the owner of the jobs it queued or runs."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_is_local(owner):
+    return (owner or "").rpartition(":")[0] == socket.gethostname()
+
+
+def _owner_alive(owner):
+    # Jobs can only be taken over from dead processes on this host; other hosts' jobs are left alone
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return bool(owner)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def image_set_key(keys):
+    """Order-independent hash of an image set, from content hashes or normalized URLs."""
+    digest = hashlib.sha256()
+    for key in sorted(set(keys)):
+        digest.update(key.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _successful(job):
+    # Runners report failures they handled as a result with success False; those are not worth reusing
+    return not (isinstance(job.result, dict) and job.result.get("success") is False)
+
+
+class Job:
+    """A queued wardrobe run: its request payload, progress counters and, once finished, result or error."""
+
+    def __init__(self, job_id, payload, request_key=None, content_key=None, status=QUEUED, progress=None,
+                 result=None, error=None, deduplicated_from=None, owner=None, created_at=None, updated_at=None):
+        self.job_id = job_id
+        self.payload = payload
+        self.request_key = request_key
+        self.content_key = content_key
+        self.status = status
+        self.progress = progress or {}
+        self.result = result
+        self.error = error
+        self.deduplicated_from = deduplicated_from
+        self.owner = owner
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self, include_result=False):
+        job = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "deduplicated_from": self.deduplicated_from,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if include_result:
+            job["result"] = self.result
+        return job
+
+
+class JobStore:
+    """SQLite persistence for jobs, so queued and finished jobs survive a restart."""
+
+    def __init__(self, path=DEFAULT_JOB_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(JOB_SCHEMA)
+            for statement in JOB_INDEXES:
+                conn.execute(statement)
+
+    def _connect(self):
+        # One connection per thread, as in ItemStore
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # SQLite connections must not be used across fork, so a forked worker opens its own
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(self, job):
+        record = (
+            job.job_id, job.request_key, job.content_key, job.status, json.dumps(job.payload),
+            json.dumps(job.progress), json.dumps(job.result) if job.result is not None else None,
+            job.error, job.deduplicated_from, job.owner, job.created_at, job.updated_at,
+        )
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                record,
+            )
+
+    def load(self, job_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def find(self, column, key, statuses, limit=1):
+        """Most recent jobs (newest first) whose request_key or content_key equals key and whose status is in statuses."""
+        if column not in ("request_key", "content_key"):
+            raise ValueError(f"Unknown key column: {column}")
+        placeholders = ",".join("?" * len(statuses))
+        rows = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE {column} = ? AND status IN ({placeholders}) "
+            f"ORDER BY updated_at DESC LIMIT ?",
+            (key, *statuses, limit),
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, job, owner):
+        """Takes over a job from its current owner and requeues it; False if another process claimed it first."""
+        conn = self._connect()
+        with conn:
+            # Compare-and-set, so two processes never both take the same job
+            cursor = conn.execute(
+                "UPDATE jobs SET owner = ?, status = ? WHERE job_id = ? AND owner IS ?",
+                (owner, QUEUED, job.job_id, job.owner),
+            )
+        if cursor.rowcount != 1:
+            return False
+        job.owner, job.status = owner, QUEUED
+        return True
+
+    def claim_orphans(self, owner):
+        """Takes over queued or running jobs whose owning process is gone; returns them owned by owner."""
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (QUEUED, RUNNING),
+        ).fetchall()
+        return [job for job in map(self._row_to_job, rows) if not _owner_alive(job.owner) and self.claim(job, owner)]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row_to_job(row):
+        values = dict(zip(JOB_COLUMNS, row))
+        return Job(
+            values["job_id"], json.loads(values["payload"]),
+            request_key=values["request_key"], content_key=values["content_key"], status=values["status"],
+            progress=json.loads(values["progress"]) if values["progress"] else {},
+            result=json.loads(values["result"]) if values["result"] else None,
+            error=values["error"], deduplicated_from=values["deduplicated_from"], owner=values["owner"],
+            created_at=values["created_at"], updated_at=values["updated_at"],
+        )
+
+
+class JobManager:
+    """
+    Runs jobs on a pool of background threads fed by a local queue. Each worker thread runs
+    `await runner(job)` on its own event loop; the runner reports progress through update_progress.
+    A job with the same request key as a queued or running job is deduplicated at submit time; once that
+    job has finished, runners can still reuse its result for the same image content through match_content.
+    With a JobStore, jobs left unfinished by a process that has exited are requeued by the next start(), or
+    claimed by the first process that receives a duplicate of them.
+    """
+
+    def __init__(self, runner, workers=2, store=None, max_finished=1000, stale_after=600):
+        self.runner = runner
+        self.workers = workers
+        self.store = store
+        self.max_finished = max_finished
+        # Another host's in-flight job not updated for this many seconds is not deduplicated onto
+        self.stale_after = stale_after
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._pid = None
+        self._owner = None
+
+    def start(self):
+        """Starts the worker threads and requeues jobs a previous process left unfinished."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Worker threads do not survive fork, so each process starts its own
+            self._pid = os.getpid()
+            self._owner = process_owner()
+            self._queue = queue.Queue()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                for index in range(self.workers)
+            ]
+            recovered = self.store.claim_orphans(self._owner) if self.store is not None else []
+            for job in recovered:
+                self._jobs[job.job_id] = job
+                self._queue.put(job.job_id)
+        if recovered:
+            logger.info(f"Requeued {len(recovered)} unfinished jobs")
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, payload, request_key=None):
+        """Queues a job and returns (job, deduplicated); an in-flight job with the same request key is returned instead."""
+        self.start()
+        with self._lock:
+            if request_key is not None:
+                existing = self._find_in_flight(request_key)
+                if existing is not None:
+                    return existing, True
+            job = Job(uuid.uuid4().hex, payload, request_key=request_key, owner=self._owner)
+            self._jobs[job.job_id] = job
+            self._save(job)
+        self._queue.put(job.job_id)
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def update_progress(self, job, **progress):
+        with self._lock:
+            job.progress.update(progress)
+            job.updated_at = time.time()
+            self._save(job)
+
+    def match_content(self, job, content_key):
+        """Records the job's image-content key; returns an earlier successful job over the same content, if any."""
+        with self._lock:
+            existing = self._find("content_key", content_key, (DONE,),
+                                  lambda found: found.job_id != job.job_id and _successful(found))
+            job.content_key = content_key
+            self._save(job)
+        return existing
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queue_depth": self._queue.qsize(), "jobs": counts}
+
+    def _find(self, column, key, statuses, accept=lambda job: True):
+        for job in reversed(self._jobs.values()):
+            if getattr(job, column) == key and job.status in statuses and accept(job):
+                return job
+        if self.store is not None:
+            return next((job for job in self.store.find(column, key, statuses, limit=20) if accept(job)), None)
+        return None
+
+    def _find_in_flight(self, request_key):
+        """
+        A queued or running job with the request key that is still making progress: one of ours, one owned by
+        a live process on this host or recently updated by another host. A job whose owner on this host has
+        exited is claimed and requeued here instead of being waited on until the next restart.
+        """
+        for job in reversed(self._jobs.values()):
+            if job.request_key == request_key and job.status in (QUEUED, RUNNING):
+                return job
+        if self.store is None:
+            return None
+        for job in self.store.find("request_key", request_key, (QUEUED, RUNNING), limit=20):
+            if not _owner_is_local(job.owner):
+                if time.time() - job.updated_at < self.stale_after:
+                    return job
+            elif _owner_alive(job.owner):
+                return job
+            elif self.store.claim(job, self._owner):
+                logger.info(f"Claimed job {job.job_id} of exited process {job.owner}")
+                self._jobs[job.job_id] = job
+                self._queue.put(job.job_id)
+                return job
+        return None
+
+    def _save(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except Exception as e:
+            logger.warning(f"Could not persist job {job.job_id}: {e}")
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.updated_at = time.time()
+            self._save(job)
+            # Finished jobs stay readable from the store; only the most recent are kept in memory
+            finished = [job_id for job_id, known in self._jobs.items() if known.finished]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self.get(self._queue.get())
+            if job is None or job.finished:
+                continue
+            with self._lock:
+                job.status = RUNNING
+                job.updated_at = time.time()
+                self._save(job)
+            try:
+                result = asyncio.run(self.runner(job))
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+                self._finish(job, FAILED, error=str(e))
+            else:
+                self._finish(job, DONE, result=result)
@@ -0,0 +1,111 @@
+# label_bank.py
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import torch
+
+from inference import inference_context, as_float
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BANK_DIR = os.environ.get("LABEL_BANK_DIR") or os.path.join(os.getcwd(), "files", "embeddings")
+
+
+def encode_label_sets(processor, model, label_sets, device="cpu"):
+    """Encodes all label lists in one text-tower pass; returns L2-normalized features and per-list slices."""
+    all_labels = [label for labels in label_sets for label in labels]
+    text_inputs = processor(text=all_labels, return_tensors="pt", padding=True).to(device)
+    with inference_context(device):
+        text_features = as_float(model.get_text_features(**text_inputs))
+    text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+    return text_features, label_slices(label_sets)
+
+
+def label_slices(label_sets):
+    """Returns the row slice of each label list inside the concatenated embedding matrix."""
+    slices = []
+    start = 0
+    for labels in label_sets:
+        slices.append(slice(start, start + len(labels)))
+        start += len(labels)
+    return slices
+
+
+def model_name(model):
+    """Returns the hub id or local path a model was loaded from."""
+    name = getattr(getattr(model, "config", None), "_name_or_path", None)
+    return name or model.__class__.__name__
+
+
+def labels_hash(label_sets):
+    """Stable hash of the label lists, so edits to inputs.py produce a new bank."""
+    payload = json.dumps([list(labels) for labels in label_sets], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class LabelEmbeddingBank:
+    """Text embeddings for fixed label vocabularies, built once per model and persisted as .npy files."""
+
+    def __init__(self, bank_dir=DEFAULT_BANK_DIR):
+        self.bank_dir = bank_dir
+        self._banks = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, model, label_sets):
+        safe_name = model_name(model).replace("/", "__").replace("\\", "__")
+        return os.path.join(self.bank_dir, f"{safe_name}-{labels_hash(label_sets)}.npy")
+
+    def get(self, processor, model, label_sets, device="cpu"):
+        """Returns (text_features, slices) for the label sets, loading or building the bank as needed."""
+        path = self.path_for(model, label_sets)
+        key = (path, str(device))
+        bank = self._banks.get(key)
+        if bank is not None:
+            return bank
+
+        with self._lock:
+            bank = self._banks.get(key)
+            if bank is None:
+                features = self._load(path)
+                if features is None:
+                    features = self._build(processor, model, label_sets, device, path)
+                bank = (features.to(device), label_slices(label_sets))
+                self._banks[key] = bank
+        return bank
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            # Copy-on-write mapping keeps the pages shared between worker processes
+            array = np.load(path, mmap_mode="c")
+            return torch.from_numpy(array)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable label bank {path}: {e}")
+            return None
+
+    def _build(self, processor, model, label_sets, device, path):
+        logger.info(f"Building label embedding bank for {model_name(model)} at {path}")
+        text_features, _ = encode_label_sets(processor, model, label_sets, device=device)
+        array = text_features.cpu().numpy()
+        try:
+            os.makedirs(self.bank_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist label bank {path}: {e}")
+        return torch.from_numpy(array)
+
+    def clear(self):
+        with self._lock:
+            self._banks.clear()
+
+
+# Shared bank used by the classification helpers in utils.py
+label_bank = LabelEmbeddingBank()
@@ -1,9 +1,177 @@
+import logging
+import os
+import threading
+import time
+
+import torch
 from transformers import CLIPProcessor, CLIPModel, AutoProcessor, AutoModelForZeroShotImageClassification
 
-# Load CLIP model
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+from batching import BatchedClipModel
+from inference import configure_torch_threads, current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+configure_torch_threads()
+
+# Hub ids of the bundled models; *_MODEL_PATH points at a local snapshot directory instead
+CLIP_MODEL_ID = "openai/clip-vit-base-patch32"
+FASHION_CLIP_MODEL_ID = "patrickjohncyh/fashion-clip"
+
+# Cross-request micro-batching of CLIP forwards; MICROBATCH_MAX_BATCH <= 1 disables it
+MICROBATCH_MAX_BATCH = int(os.environ.get("MICROBATCH_MAX_BATCH", "32"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5"))
+# Backpressure bound only: callers are the INFERENCE_WORKERS executor threads, so at most that many jobs wait here
+MICROBATCH_MAX_QUEUE = int(os.environ.get("MICROBATCH_MAX_QUEUE", "256"))
+
+
+def _model_bytes(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _pretrained_source(model_id, path_env):
+    """Returns (source, kwargs) for from_pretrained, preferring a local safetensors snapshot with no hub lookup."""
+    local_path = os.environ.get(path_env)
+    if local_path:
+        return local_path, {"local_files_only": True, "use_safetensors": True}
+    if os.environ.get("HF_HUB_OFFLINE") == "1":
+        return model_id, {"local_files_only": True}
+    return model_id, {}
+
+
+def _clip_loader(model_id, path_env, backend_env, model_class, processor_class):
+    """Builds a registry loader; backend_env selects "torch" (default), "onnx" or "onnx-int8"."""
+    def load_processor():
+        source, kwargs = _pretrained_source(model_id, path_env)
+        return processor_class.from_pretrained(source, local_files_only=kwargs.get("local_files_only", False))
+
+    def load_model():
+        source, kwargs = _pretrained_source(model_id, path_env)
+        return model_class.from_pretrained(source, **kwargs)
+
+    def load():
+        backend = os.environ.get(backend_env, "torch")
+        if backend == "torch":
+            return load_model(), load_processor()
+        from onnx_backend import load_onnx_clip
+        source, _ = _pretrained_source(model_id, path_env)
+        return load_onnx_clip(load_model, load_processor, source, backend)
+
+    return load
+
+
+def _batched(name, model):
+    """
+    Puts a micro-batching scheduler in front of a loaded CLIP model. The wrapper stays in place with
+    batching disabled, since it is also what counts the model's forward passes for /metrics.
+    """
+    return BatchedClipModel(model, name, device=device, max_batch=MICROBATCH_MAX_BATCH,
+                            max_wait_ms=MICROBATCH_MAX_WAIT_MS, max_queue=MICROBATCH_MAX_QUEUE)
+
+
+def _load_rembg():
+    from utils import get_rembg_session
+    return get_rembg_session(), None
+
+
+class ModelRegistry:
+    """Loads each registered model on first use and records per-model load time and memory."""
+
+    def __init__(self, device="cpu"):
+        self.device = device
+        self._loaders = {}
+        self._wrappers = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, loader, wrap=None):
+        """Registers loader() -> (model, processor) under name; wrap(name, model) is applied after loading."""
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._wrappers[name] = wrap
+            self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        """Returns (model, processor), loading the model if this is its first use."""
+        loaded = self._models.get(name)
+        if loaded is not None:
+            return loaded
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+        with self._locks[name]:
+            loaded = self._models.get(name)
+            if loaded is None:
+                loaded = self._load(name)
+        return loaded
+
+    def _load(self, name):
+        # Current RSS, not ru_maxrss: models load lazily, often after requests already raised the process peak
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        model, processor = self._loaders[name]()
+        if isinstance(model, torch.nn.Module):
+            model.to(self.device)
+            model.eval()
+        elapsed = time.perf_counter() - start
+        rss_after = current_rss_bytes()
+        self._stats[name] = {
+            "load_seconds": round(elapsed, 3),
+            "weights_bytes": _model_bytes(model) if isinstance(model, torch.nn.Module) else None,
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+        logger.info(f"Loaded model {name} in {elapsed:.2f}s")
+        if self._wrappers.get(name) is not None:
+            model = self._wrappers[name](name, model)
+        self._models[name] = (model, processor)
+        return self._models[name]
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def preload(self, names=None):
+        """Loads the given models (all registered models by default), e.g. for warm worker pools."""
+        for name in names or list(self._loaders):
+            self.get(name)
+
+    def report(self):
+        """Returns {name: {loaded, load_seconds, weights_bytes, rss_delta_bytes[, batching]}} for every registered model."""
+        report = {}
+        for name in self._loaders:
+            report[name] = {"loaded": name in self._models, **self._stats.get(name, {})}
+            model = self._models.get(name, (None, None))[0]
+            if isinstance(model, BatchedClipModel):
+                report[name]["batching"] = model.stats()
+        return report
+
+    def stop_batchers(self):
+        """Stops the micro-batcher threads of loaded models so a process can fork without live threads."""
+        for model, _ in list(self._models.values()):
+            if isinstance(model, BatchedClipModel):
+                model.stop()
+
+
+registry = ModelRegistry(device=device)
+registry.register("clip", _clip_loader(CLIP_MODEL_ID, "CLIP_MODEL_PATH", "CLIP_BACKEND", CLIPModel, CLIPProcessor),
+                  wrap=_batched)
+registry.register("fashion_clip", _clip_loader(
+    FASHION_CLIP_MODEL_ID, "FASHION_CLIP_MODEL_PATH", "FASHION_CLIP_BACKEND",
+    AutoModelForZeroShotImageClassification, AutoProcessor
+), wrap=_batched)
+registry.register("rembg", _load_rembg)
+
 
-# Load model directly fashion clip
-processor_fc = AutoProcessor.from_pretrained("patrickjohncyh/fashion-clip")
-model_fc = AutoModelForZeroShotImageClassification.from_pretrained("patrickjohncyh/fashion-clip")
+def __getattr__(name):
+    # Backwards compatible module attributes (models.model, models.processor_fc, ...), loaded on first access
+    aliases = {
+        "model": ("clip", 0),
+        "processor": ("clip", 1),
+        "model_fc": ("fashion_clip", 0),
+        "processor_fc": ("fashion_clip", 1),
+    }
+    if name in aliases:
+        registry_name, position = aliases[name]
+        return registry.get(registry_name)[position]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,257 @@
+# onnx_backend.py
+"""
+Optional ONNX Runtime backend for the CLIP models.
+
+The vision and text towers are exported separately (with projection) so the rest of the code can keep
+calling get_image_features / get_text_features. Int8 dynamic quantization trades a small accuracy margin
+for CPU throughput; use parity_check (or `python onnx_backend.py --model clip`) before enabling it.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_DIR = os.path.join(os.getcwd(), "files", "onnx")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class _VisionTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+def onnx_paths(onnx_dir, quantized=False):
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return os.path.join(onnx_dir, "vision" + suffix), os.path.join(onnx_dir, "text" + suffix)
+
+
+def export_clip_to_onnx(model, processor, onnx_dir, opset=17):
+    """Exports the vision and text towers of a CLIP model with dynamic batch (and sequence) axes."""
+    os.makedirs(onnx_dir, exist_ok=True)
+    vision_path, text_path = onnx_paths(onnx_dir)
+    model = model.to("cpu").eval()
+    size = processor.image_processor.crop_size
+    height, width = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+    pixel_values = torch.zeros(1, 3, height, width)
+    text_inputs = processor(text=["a photo", "a fashionable outfit"], return_tensors="pt", padding=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _VisionTower(model), (pixel_values,), vision_path,
+            input_names=["pixel_values"], output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+        torch.onnx.export(
+            _TextTower(model), (text_inputs["input_ids"], text_inputs["attention_mask"]), text_path,
+            input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                          "text_embeds": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+    with open(os.path.join(onnx_dir, "logit_scale.json"), "w") as f:
+        json.dump({"logit_scale": float(model.logit_scale.item())}, f)
+    logger.info(f"Exported ONNX towers to {onnx_dir}")
+    return vision_path, text_path
+
+
+def quantize_onnx(onnx_dir):
+    """Writes dynamic int8 (weight-only) quantized copies of both towers next to the fp32 files."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for source, target in zip(onnx_paths(onnx_dir), onnx_paths(onnx_dir, quantized=True)):
+        quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    return onnx_paths(onnx_dir, quantized=True)
+
+
+class _OnnxConfig:
+    def __init__(self, name_or_path):
+        self._name_or_path = name_or_path
+
+
+class _OnnxClipOutput:
+    def __init__(self, logits_per_image, image_embeds, text_embeds):
+        self.logits_per_image = logits_per_image
+        self.logits_per_text = logits_per_image.T
+        self.image_embeds = image_embeds
+        self.text_embeds = text_embeds
+
+
+class OnnxClipModel:
+    """
+    Stand-in for CLIPModel backed by two ONNX Runtime sessions. Supports get_image_features,
+    get_text_features and the full forward pass (logits_per_image), returning torch tensors.
+    """
+
+    def __init__(self, onnx_dir, name_or_path, quantized=False, intra_op_threads=0, inter_op_threads=0):
+        self.vision_path, self.text_path = onnx_paths(onnx_dir, quantized)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self._sessions = None
+        self._sessions_pid = None
+        self._sessions_lock = threading.Lock()
+        self._get_sessions()
+        with open(os.path.join(onnx_dir, "logit_scale.json")) as f:
+            self.logit_scale = torch.tensor(json.load(f)["logit_scale"])
+        backend = "onnx-int8" if quantized else "onnx"
+        # Distinct name so label banks and stored items are never mixed with the torch backend's
+        self.config = _OnnxConfig(f"{name_or_path}+{backend}")
+        self.backend = backend
+
+    def _get_sessions(self):
+        # ONNX Runtime thread pools do not survive fork, so each worker process builds its own sessions
+        if self._sessions is not None and self._sessions_pid == os.getpid():
+            return self._sessions
+        with self._sessions_lock:
+            if self._sessions is None or self._sessions_pid != os.getpid():
+                sess_opts = ort.SessionOptions()
+                sess_opts.intra_op_num_threads = self.intra_op_threads
+                sess_opts.inter_op_num_threads = self.inter_op_threads
+                providers = ["CPUExecutionProvider"]
+                self._sessions = (
+                    ort.InferenceSession(self.vision_path, sess_options=sess_opts, providers=providers),
+                    ort.InferenceSession(self.text_path, sess_options=sess_opts, providers=providers),
+                )
+                self._sessions_pid = os.getpid()
+        return self._sessions
+
+    @property
+    def vision_session(self):
+        return self._get_sessions()[0]
+
+    @property
+    def text_session(self):
+        return self._get_sessions()[1]
+
+    def get_image_features(self, pixel_values, **kwargs):
+        outputs = self.vision_session.run(None, {"pixel_values": pixel_values.detach().cpu().numpy().astype(np.float32)})
+        return torch.from_numpy(outputs[0])
+
+    def get_text_features(self, input_ids, attention_mask=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        outputs = self.text_session.run(None, {
+            "input_ids": input_ids.detach().cpu().numpy().astype(np.int64),
+            "attention_mask": attention_mask.detach().cpu().numpy().astype(np.int64),
+        })
+        return torch.from_numpy(outputs[0])
+
+    def __call__(self, pixel_values=None, input_ids=None, attention_mask=None, **kwargs):
+        image_embeds = self.get_image_features(pixel_values)
+        text_embeds = self.get_text_features(input_ids, attention_mask)
+        image_embeds = image_embeds / image_embeds.norm(dim=-1, keepdim=True)
+        text_embeds = text_embeds / text_embeds.norm(dim=-1, keepdim=True)
+        logits_per_image = self.logit_scale.exp() * image_embeds @ text_embeds.T
+        return _OnnxClipOutput(logits_per_image, image_embeds, text_embeds)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+_export_lock = threading.Lock()
+
+
+def load_onnx_clip(model_loader, processor_loader, name_or_path, backend, onnx_root=DEFAULT_ONNX_DIR):
+    """
+    Returns (OnnxClipModel, processor) for backend "onnx" or "onnx-int8", exporting (and quantizing)
+    the torch model from model_loader() on first use.
+    """
+    if backend not in BACKENDS[1:]:
+        raise ValueError(f"Unknown ONNX backend: {backend}")
+    safe_name = name_or_path.replace("/", "__").replace("\\", "__")
+    onnx_dir = os.path.join(onnx_root, safe_name)
+    quantized = backend == "onnx-int8"
+    processor = processor_loader()
+    with _export_lock:
+        if not all(os.path.exists(path) for path in onnx_paths(onnx_dir)):
+            export_clip_to_onnx(model_loader(), processor, onnx_dir)
+        if quantized and not all(os.path.exists(path) for path in onnx_paths(onnx_dir, quantized=True)):
+            quantize_onnx(onnx_dir)
+    threads = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+    return OnnxClipModel(onnx_dir, name_or_path, quantized=quantized, intra_op_threads=threads), processor
+
+
+def parity_check(reference_model, candidate_model, processor, images, label_sets, batch_size=16):
+    """
+    Compares zero-shot classification of a candidate backend against the reference model.
+    Returns per-head label agreement and the mean/max absolute difference of the cosine scores.
+    """
+    from inference import inference_context, as_float
+    from label_bank import encode_label_sets
+
+    reference_text, slices = encode_label_sets(processor, reference_model, label_sets)
+    candidate_text, _ = encode_label_sets(processor, candidate_model, label_sets)
+    reference_scores, candidate_scores = [], []
+    for start in range(0, len(images), batch_size):
+        image_inputs = processor(images=images[start:start + batch_size], return_tensors="pt")
+        for model, text, scores in ((reference_model, reference_text, reference_scores),
+                                    (candidate_model, candidate_text, candidate_scores)):
+            with inference_context():
+                features = as_float(model.get_image_features(pixel_values=image_inputs["pixel_values"]))
+            features = features / features.norm(dim=-1, keepdim=True)
+            scores.append((features @ text.T).cpu().numpy())
+    reference_scores = np.concatenate(reference_scores)
+    candidate_scores = np.concatenate(candidate_scores)
+
+    heads = {}
+    for head, s in zip(("clothing_type", "occasion", "season", "material"), slices):
+        heads[head] = float(np.mean(reference_scores[:, s].argmax(axis=1) == candidate_scores[:, s].argmax(axis=1)))
+    deltas = np.abs(reference_scores - candidate_scores)
+    return {
+        "images": len(images),
+        "label_agreement": heads,
+        "mean_score_delta": float(deltas.mean()),
+        "max_score_delta": float(deltas.max()),
+    }
+
+
+def main():
+    from PIL import Image
+    from inputs import clothing_types, occasions, seasons, materials
+    from models import registry
+
+    parser = argparse.ArgumentParser(description="Export a registry model to ONNX and check parity with PyTorch.")
+    parser.add_argument("--model", default="clip", choices=["clip", "fashion_clip"])
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    parser.add_argument("--images", default=os.path.join(os.getcwd(), "Images"))
+    parser.add_argument("--limit", type=int, default=32)
+    args = parser.parse_args()
+
+    # The registry serves the torch backend unless *_BACKEND is set, so it is the reference here
+    reference_model, processor = registry.get(args.model)
+    name = reference_model.config._name_or_path
+    candidate_model, _ = load_onnx_clip(lambda: reference_model, lambda: processor, name, args.backend)
+    images = []
+    for filename in sorted(os.listdir(args.images))[:args.limit]:
+        with Image.open(os.path.join(args.images, filename)) as image:
+            images.append(image.convert("RGB"))
+    report = parity_check(reference_model.to("cpu"), candidate_model, processor, images,
+                          (clothing_types, occasions, seasons, materials))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
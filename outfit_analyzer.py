@@ -1,121 +1,267 @@
-import random
 import numpy as np
+import torch
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 import requests
 from io import BytesIO
 import logging
+import os
+from color_harmony import item_harmony
+from compute_budget import ComputeBudget, fallback_score, is_fallback_score, raw_score, sample_prompts
+from embedding_scorer import EmbeddingCompatibilityScorer
+from item_table import ItemTable
+from inference import inference_context, as_float
+from outfit_search import OutfitSearch
+from telemetry import observe_cache, span
 
 logger = logging.getLogger(__name__)
 
+# Item categories scored against each other for every two-piece outfit type
+PAIR_CATEGORIES = {
+    "top_bottom": ("Top", "Bottom"),
+    "dress_footwear": ("Dress", "Footwear"),
+    "bottom_footwear": ("Bottom", "Footwear"),
+    "top_footwear": ("Top", "Footwear"),
+}
+
+# Model forward passes behind a pairwise-mode score: image + text features for the visual score and one
+# batched forward for the prompt score
+VISUAL_FORWARD_PASSES = 2
+TEXT_FORWARD_PASSES = 1
+
+def combine_scores(image_score, text_score, outfit_type):
+    """Weighted compatibility score from the visual and prompt scores of an outfit."""
+    if outfit_type == "dress_footwear":
+        return 0.7 * image_score + 0.3 * text_score
+    else:
+        return 0.6 * image_score + 0.4 * text_score
+
 class OutfitCompatibilityAnalyzer:
-    def __init__(self, classified_df, clip_processor, clip_model, compatibility_prompts, image_download_function):
-        self.df = classified_df.copy()
-        self.tops = self.df[self.df['Category'] == 'Top'].copy()
-        self.bottoms = self.df[self.df['Category'] == 'Bottom'].copy()
-        self.dresses = self.df[self.df['Category'] == 'Dress'].copy()  # Add dresses
-        self.footwears = self.df[self.df['Category'] == 'Footwear'].copy()  # Add footwear
+    # scoring_mode="pairwise" encodes a combined image per candidate pair and per prompt.
+    # scoring_mode="embedding" encodes every item and prompt once and scores pairs from similarity matrices.
+    # Once the ComputeBudget runs out, new scores come from item embeddings (or, past the deadline, from
+    # dominant-color harmony), ranked below the scores of the mode's own signal (see fallback_score), and
+    # budget.partial flags the result.
+    def __init__(self, classified_df, clip_processor, clip_model, compatibility_prompts, image_download_function,
+                 scoring_mode="pairwise", embedding_batch_size=16, image_cache=None,
+                 search_beam_width=4, search_top_k=5, search_seed=0, inference_executor=None, budget=None):
+        # Items are addressed by their integer id in this table; item dicts are only looked up for the result
+        self.items = ItemTable.from_frame(classified_df)
         self.clip_processor = clip_processor
         self.clip_model = clip_model
         self.compatibility_prompts = compatibility_prompts
         self.download_image = image_download_function
+        self.image_cache = image_cache
+        self.inference_executor = inference_executor
+        self.scoring_mode = scoring_mode
+        self.search_beam_width = search_beam_width
+        self.search_top_k = search_top_k
+        self.search_seed = search_seed
+        self.budget = budget or ComputeBudget()
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_scorer = None
+        self._embeddings_ready = False
+        # The signal this scoring mode normally scores with; anything cheaper is a fallback
+        self._own_signal = "model" if scoring_mode == "pairwise" else "embedding"
+        self._pair_matrices = {}
+        # Scores keyed by item identity and outfit type; the analyzer is shared by every occasion pass of a request
+        # Each entry is (score, model forward passes computing it took, not counting nested cached scores)
+        self._score_cache = {}
+        self.score_cache_hits = 0
+        self.score_cache_misses = 0
+        self.forward_passes = 0
+        self.forward_passes_saved = 0
+        self._cached_passes = 0
+        if scoring_mode == "embedding":
+            self.embedding_scorer = self._create_embedding_scorer()
+        elif scoring_mode != "pairwise":
+            raise ValueError(f"Unknown scoring mode: {scoring_mode}")
+
+    def _create_embedding_scorer(self):
+        return EmbeddingCompatibilityScorer(
+            self.clip_processor, self.clip_model, self.compatibility_prompts,
+            batch_size=self.embedding_batch_size, max_prompts=self.budget.max_prompts
+        )
+
+    async def prepare_embeddings(self):
+        """Loads and encodes every top, bottom, dress and footwear image once (embedding mode only)."""
+        if self.embedding_scorer is None:
+            return
+        relevant = np.concatenate([self.items.select(Category=category) for category in ('Top', 'Bottom', 'Dress', 'Footwear')])
+        paths = [self.items.image_paths[i] for i in relevant]
+        missing = [path for path in dict.fromkeys(paths) if not self.embedding_scorer.has_item(path)]
+        with span("item_embedding", items=len(missing)):
+            images = {}
+            for path in missing:
+                images[path] = await self._load_image_from_url(path)
+            await self._run_model(self.embedding_scorer.add_items, images)
+        encoded = [(i, path) for i, path in zip(relevant, paths) if self.embedding_scorer.has_item(path)]
+        if encoded:
+            self.items.set_embeddings(
+                [i for i, _ in encoded],
+                self.embedding_scorer.embeddings_for([path for _, path in encoded]).numpy()
+            )
+        self._embeddings_ready = True
+
+    async def _scoring_signal(self, count=1):
+        """
+        Where the next count scores come from: "model" (pairwise forwards) while the budget lasts, then item
+        embeddings, which are still computed if needed unless the deadline has passed, then color harmony.
+        Scores from a cheaper signal than the scoring mode's own are recorded on the budget.
+        """
+        reason = self.budget.exhausted()
+        if self.scoring_mode == "pairwise" and reason is None:
+            return "model"
+        if not self._embeddings_ready and reason != "deadline":
+            if self.embedding_scorer is None:
+                self.embedding_scorer = self._create_embedding_scorer()
+            await self.prepare_embeddings()
+        signal = "embedding" if self._embeddings_ready else "color"
+        if signal != self._own_signal:
+            self.budget.record_fallback(signal, count)
+        return signal
+
+    async def _run_model(self, fn, *args):
+        """Runs blocking model work on the inference executor when one is configured, keeping the event loop free."""
+        if self.inference_executor is None:
+            return fn(*args)
+        return await self.inference_executor.run("compatibility", fn, *args)
+
+    def _pair_matrix(self, outfit_type):
+        """
+        Returns (row of each item id, column of each item id, N x M score matrix) over all embedded items of
+        the outfit type's categories; ids outside a category or without an embedding map to -1.
+        """
+        if outfit_type not in self._pair_matrices:
+            category1, category2 = PAIR_CATEGORIES[outfit_type]
+            ids1 = self.items.select(Category=category1)
+            ids2 = self.items.select(Category=category2)
+            ids1 = ids1[self.items.has_embedding[ids1]]
+            ids2 = ids2[self.items.has_embedding[ids2]]
+            if len(ids1) and len(ids2):
+                embeddings = torch.from_numpy(self.items.embeddings)
+                visual, text = self.embedding_scorer.outfit_scores(
+                    embeddings[ids1][:, None, :] + embeddings[ids2][None, :, :], outfit_type
+                )
+                scores = self._combine_scores(visual, text, outfit_type)
+            else:
+                scores = np.zeros((len(ids1), len(ids2)))
+            rows = np.full(len(self.items), -1)
+            columns = np.full(len(self.items), -1)
+            rows[ids1] = np.arange(len(ids1))
+            columns[ids2] = np.arange(len(ids2))
+            self._pair_matrices[outfit_type] = (rows, columns, scores)
+        return self._pair_matrices[outfit_type]
+
+    def _embedding_pair_score(self, item1, item2, outfit_type):
+        rows, columns, scores = self._pair_matrix(outfit_type)
+        i, j = rows[item1], columns[item2]
+        if i < 0 or j < 0:
+            return 0.0
+        return float(scores[i, j])
+
+    async def _compatibility_matrix(self, items1, items2, outfit_type):
+        """Scores of every (items1[i], items2[j]) pair as an array; one matrix lookup in embedding mode."""
+        items1, items2 = np.asarray(items1, dtype=np.int64), np.asarray(items2, dtype=np.int64)
+        with span("pair_scoring", items=len(items1) * len(items2)):
+            if self.scoring_mode == "embedding":
+                if await self._scoring_signal(len(items1) * len(items2)) == "color":
+                    return fallback_score(item_harmony(self.items, items1, items2))
+                rows, columns, scores = self._pair_matrix(outfit_type)
+                i, j = rows[items1], columns[items2]
+                matrix = np.zeros((len(items1), len(items2)))
+                if scores.size:
+                    matrix = np.where((i[:, None] >= 0) & (j[None, :] >= 0), scores[i[:, None], j[None, :]], 0.0)
+                return matrix
+            # Pair by pair, so cached model scores are kept once the budget forces cheaper ones
+            matrix = np.zeros((len(items1), len(items2)))
+            for a, item1 in enumerate(items1):
+                for b, item2 in enumerate(items2):
+                    matrix[a, b] = await self._calculate_compatibility(int(item1), int(item2), outfit_type)
+            return matrix
 
     async def find_best_matches(self, occasion):
         # Filter items based on occasion
-        filtered_tops = self.tops[self.tops['Occasion'] == occasion].copy()
-        filtered_bottoms = self.bottoms[self.bottoms['Occasion'] == occasion].copy()
-        filtered_dresses = self.dresses[self.dresses['Occasion'] == occasion].copy()  # Filter dresses
-        filtered_footwear = self.footwears[self.footwears['Occasion'] == occasion].copy() # Filter footwear
+        filtered_tops = self.items.select(Category='Top', Occasion=occasion)
+        filtered_bottoms = self.items.select(Category='Bottom', Occasion=occasion)
+        filtered_dresses = self.items.select(Category='Dress', Occasion=occasion)
+        filtered_footwear = self.items.select(Category='Footwear', Occasion=occasion)
+        record = self.items.record
 
         # Check if there are any relevant items for the selected occasion
-        if filtered_tops.empty and filtered_bottoms.empty and filtered_dresses.empty and filtered_footwear.empty:
+        if not (len(filtered_tops) or len(filtered_bottoms) or len(filtered_dresses) or len(filtered_footwear)):
             logger.info(f"No tops, bottoms, dresses, or footwear found for the occasion: {occasion}")
             return []
 
+        if self.scoring_mode == "embedding" and self.budget.exhausted() != "deadline":
+            await self.prepare_embeddings()
+
         recommendations = []
 
         # 1. Dresses + Footwear
-        if not filtered_dresses.empty and not filtered_footwear.empty:
-            for _, dress in filtered_dresses.iterrows():
-                scores = []
-                for _, shoe in filtered_footwear.iterrows():
-                    score = await self._calculate_compatibility(dress.to_dict(), shoe.to_dict(), outfit_type="dress_footwear")
-                    scores.append((shoe.to_dict(), score))
-                sorted_scores = sorted(scores, key=lambda x: x[1], reverse=True)[:2]
-                recommendations.append((dress.to_dict(), sorted_scores))
+        if len(filtered_dresses) and len(filtered_footwear):
+            scores = await self._compatibility_matrix(filtered_dresses, filtered_footwear, "dress_footwear")
+            for row, dress in enumerate(filtered_dresses):
+                # Stable sort keeps the first of equally scored shoes, as sorting the (shoe, score) list did
+                best = np.argsort(-scores[row], kind="stable")[:2]
+                recommendations.append((record(dress), [(record(filtered_footwear[j]), float(scores[row, j])) for j in best]))
 
         # 2. Standalone Dresses (if no footwear to pair)
-        elif not filtered_dresses.empty:
-            for _, dress in filtered_dresses.iterrows():
-                recommendations.append((dress.to_dict(), None))
+        elif len(filtered_dresses):
+            for dress in filtered_dresses:
+                recommendations.append((record(dress), None))
+
+        search = OutfitSearch(
+            self._calculate_compatibility,
+            self._calculate_three_piece_compatibility,
+            beam_width=self.search_beam_width,
+            top_k=self.search_top_k,
+            seed=self.search_seed,
+            pair_scores=self._compatibility_matrix
+        )
+        top_items = filtered_tops.tolist()
+        bottom_items = filtered_bottoms.tolist()
+        footwear_items = filtered_footwear.tolist()
 
         # 3. Top + Bottom + Footwear
-        if not filtered_tops.empty and not filtered_bottoms.empty and not filtered_footwear.empty:
+        if top_items and bottom_items and footwear_items:
             try:
-                # Get sample tops - up to 3 if available, but work with whatever we have (even just 1)
-                top_count = len(filtered_tops)
-                if top_count > 0:
-                    # If we have more than 3 tops, randomly sample 3
-                    if top_count > 3:
-                        random_top_indices = random.sample(range(len(filtered_tops)), min(3, len(filtered_tops)))
-                        selected_tops = [filtered_tops.iloc[i].to_dict() for i in random_top_indices]
-                    # Otherwise use all available tops
-                    else:
-                        selected_tops = [filtered_tops.iloc[i].to_dict() for i in range(top_count)]
-
-                    for top in selected_tops:
-                        # First find compatible bottoms
-                        bottom_scores = []
-                        for _, bottom in filtered_bottoms.iterrows():
-                            bottom_dict = bottom.to_dict()
-                            score = await self._calculate_compatibility(top, bottom_dict, outfit_type="top_bottom")
-                            bottom_scores.append((bottom_dict, score))
-
-                        # Get the top 2 most compatible bottoms
-                        top_bottoms = sorted(bottom_scores, key=lambda x: x[1], reverse=True)[:2]
-
-                        # For each top-bottom pair, find compatible footwear
-                        for bottom_item, bottom_score in top_bottoms:
-                            footwear_scores = []
-                            for _, shoe in filtered_footwear.iterrows():
-                                shoe_dict = shoe.to_dict()
-                                # Calculate compatibility score for the three-piece outfit
-                                three_piece_score = await self._calculate_three_piece_compatibility(
-                                    top, bottom_item, shoe_dict
-                                )
-                                footwear_scores.append((shoe_dict, three_piece_score))
-
-                            # Get the top 2 most compatible footwear options for best matched "top+bottom" pair
-                            top_footwear = sorted(footwear_scores, key=lambda x: x[1], reverse=True)[:2]
-
-                            # Create the three-piece recommendation
-                            # Store as a tuple: (top, [(bottom, footwear1, score1), (bottom, footwear2, score2), ...])
-                            three_piece_recs = []
-                            for shoe_item, three_piece_score in top_footwear:
-                                three_piece_recs.append((bottom_item, shoe_item, three_piece_score))
-
-                            if three_piece_recs:
-                                recommendations.append((top, three_piece_recs))
+                estimate = OutfitSearch.estimate_evaluations(len(top_items), len(bottom_items), len(footwear_items),
+                                                             self.search_beam_width)
+                # Stated in the response's budget stats, keyed by occasion
+                self.budget.record_search(occasion or "any", estimate)
+                logger.info(f"Outfit search for occasion {occasion}: {estimate}")
+                with span("outfit_search", items=len(top_items) * len(bottom_items) * len(footwear_items)):
+                    outfits = await search.search(top_items, bottom_items, footwear_items)
+
+                # Group the best outfits by top: (top, [(bottom, footwear1, score1), (bottom, footwear2, score2), ...])
+                grouped = {}
+                for three_piece_score, top, bottom_item, shoe_item in outfits:
+                    key = self.items.image_paths[top]
+                    if key not in grouped:
+                        grouped[key] = (record(top), [])
+                    grouped[key][1].append((record(bottom_item), record(shoe_item), three_piece_score))
+                recommendations.extend(grouped.values())
 
             except Exception as e:
                 logger.error(f"Error generating top-bottom-footwear recommendations for occasion {occasion}: {e}", exc_info=True)
 
         # 3. Top + Bottom (Also generate Top + Bottom outfits (even if footwear exists))
-        if not filtered_tops.empty and not filtered_bottoms.empty:
-            if len(filtered_tops) < 3:
-                logger.info(f"Not enough tops found for the occasion: {occasion}. Need at least 3, found {len(filtered_tops)}")
+        if top_items and bottom_items:
+            if len(top_items) < 3:
+                logger.info(f"Not enough tops found for the occasion: {occasion}. Need at least 3, found {len(top_items)}")
             else:
                 try:
-                    random_top_indices = random.sample(range(len(filtered_tops)), min(3, len(filtered_tops)))
-                    selected_tops = [filtered_tops.iloc[i].to_dict() for i in random_top_indices]
-
-                    for top in selected_tops:
-                        scores = []
-                        for _, bottom in filtered_bottoms.iterrows():
-                            score = await self._calculate_compatibility(top, bottom.to_dict())
-                            scores.append((bottom.to_dict(), score))
-                        sorted_scores = sorted(scores, key=lambda x: x[1], reverse=True)[:3]
-                        recommendations.append((top, sorted_scores))
+                    # Pair scores are memoized by the search, so this re-ranks without new model calls
+                    with span("pair_ranking", items=len(top_items) * len(bottom_items)):
+                        ranked_pairs = await search.rank_pairs(top_items, bottom_items, "top_bottom")
+                    bottoms_by_top = {}
+                    for score, _, i, j in ranked_pairs:
+                        bottoms_by_top.setdefault(i, []).append((record(bottom_items[j]), score))
+
+                    # The 3 tops whose best bottom scores highest, in score order
+                    for i in list(bottoms_by_top)[:3]:
+                        recommendations.append((record(top_items[i]), bottoms_by_top[i][:3]))
                 except Exception as e:
                     logger.error(f"Error generating top-bottom recommendations for occasion {occasion}: {e}", exc_info=True)
 
@@ -133,39 +279,117 @@ class OutfitCompatibilityAnalyzer:
         recommendations.sort(key=get_recommendation_score, reverse=True)
         return recommendations[:5]
 
+    def _combine_scores(self, image_score, text_score, outfit_type):
+        return combine_scores(image_score, text_score, outfit_type)
+
+    def _cached_score(self, key):
+        entry = self._score_cache.get(key)
+        if entry is not None:
+            self.score_cache_hits += 1
+            self.forward_passes_saved += entry[1]
+            observe_cache("score", "hit")
+            return entry[0]
+        self.score_cache_misses += 1
+        observe_cache("score", "miss")
+        return None
+
+    async def _memoized_score(self, key, compute):
+        """
+        The cached score for key, else compute()'s, stored with the forward passes it cost itself: scores it
+        looked up on the way (a three-piece outfit's pairs) carry their own cost in their own entries, and
+        fallback-signal scores cost none.
+        """
+        score = self._cached_score(key)
+        if score is None:
+            passes, nested_passes = self.forward_passes, self._cached_passes
+            score = await compute()
+            cost = (self.forward_passes - passes) - (self._cached_passes - nested_passes)
+            self._cached_passes += cost
+            self._score_cache[key] = (score, cost)
+        return score
+
+    def score_cache_stats(self):
+        """Hit/miss counters of the score cache, the model forward passes scoring made and those the hits avoided."""
+        lookups = self.score_cache_hits + self.score_cache_misses
+        return {
+            "hits": self.score_cache_hits,
+            "misses": self.score_cache_misses,
+            "hit_rate": round(self.score_cache_hits / lookups, 3) if lookups else 0.0,
+            "forward_passes": self.forward_passes,
+            "forward_passes_saved": self.forward_passes_saved,
+        }
+
+    # Items passed to the scoring methods below are integer ids into self.items
     async def _calculate_compatibility(self, item1, item2, outfit_type="top_bottom"):
-        image_score = await self._get_visual_compatibility_score(item1['image_path'], item2['image_path'])
-        text_score = await self._get_text_compatibility_score(item1, item2, outfit_type)
+        canonical = self.items.canonical
+        key = (int(canonical[item1]), int(canonical[item2]), outfit_type)
+        return await self._memoized_score(key, lambda: self._score_pair(item1, item2, outfit_type))
+
+    def _color_pair_score(self, item1, item2):
+        return float(item_harmony(self.items, [item1], [item2])[0, 0])
+
+    async def _score_pair(self, item1, item2, outfit_type="top_bottom"):
+        signal = await self._scoring_signal()
+        if signal != "model":
+            if signal == "embedding":
+                score = self._embedding_pair_score(item1, item2, outfit_type)
+            else:
+                score = self._color_pair_score(item1, item2)
+            return score if signal == self._own_signal else fallback_score(score)
 
-        if outfit_type == "dress_footwear":
-            return 0.7 * image_score + 0.3 * text_score
-        else:
-            return 0.6 * image_score + 0.4 * text_score
+        self.budget.charge()
+        image_score = await self._get_visual_compatibility_score(self.items.image_paths[item1], self.items.image_paths[item2])
+        text_score = await self._get_text_compatibility_score(item1, item2, outfit_type)
+        return self._combine_scores(image_score, text_score, outfit_type)
 
     #new function for top+bottom+footwear compatibility check
     #determine how well three pieces of clothing (top, bottom, and footwear) work together as a complete outfit.
-    async def _calculate_three_piece_compatibility(self, top, bottom, footwear):
+    async def _calculate_three_piece_compatibility(self, top, bottom, footwear, top_bottom_score=None):
         """Calculate compatibility for a three-piece outfit (top + bottom + footwear)"""
+        canonical = self.items.canonical
+        key = (int(canonical[top]), int(canonical[bottom]), int(canonical[footwear]), "top_bottom_footwear")
+        return await self._memoized_score(key, lambda: self._score_three_piece(top, bottom, footwear, top_bottom_score))
+
+    async def _score_three_piece(self, top, bottom, footwear, top_bottom_score=None):
         try:
-            # Calculate pairwise compatibility scores
-            top_bottom_score = await self._calculate_compatibility(top, bottom, "top_bottom")
+            # Calculate pairwise compatibility scores (the search passes in the top-bottom score it already has)
+            if top_bottom_score is None:
+                top_bottom_score = await self._calculate_compatibility(top, bottom, "top_bottom")
             bottom_footwear_score = await self._calculate_compatibility(bottom, footwear, "bottom_footwear")
             top_footwear_score = await self._calculate_compatibility(top, footwear, "top_footwear")
+            pair_scores = (top_bottom_score, bottom_footwear_score, top_footwear_score)
+            # An outfit with any fallback-scored part ranks as fallback-scored as a whole
+            degraded = any(is_fallback_score(score) for score in pair_scores)
+            top_bottom_score, bottom_footwear_score, top_footwear_score = (raw_score(score) for score in pair_scores)
+
+            signal = await self._scoring_signal()
+            degraded = degraded or signal != self._own_signal
+            if signal == "color":
+                harmony = item_harmony(self.items, [top, top, bottom], [bottom, footwear, footwear])
+                visual_score = text_score = float(harmony.mean())
+            elif signal == "embedding":
+                if not self.items.has_embedding[[top, bottom, footwear]].all():
+                    return fallback_score(0.0) if degraded else 0.0
+                embeddings = self.items.embeddings
+                outfit = torch.from_numpy(embeddings[top] + embeddings[bottom] + embeddings[footwear])
+                visual_scores, text_scores = self.embedding_scorer.outfit_scores(outfit[None, :], "top_bottom_footwear")
+                visual_score, text_score = float(visual_scores[0]), float(text_scores[0])
+            else:
+                self.budget.charge()
+                # Calculate visual compatibility score for all three pieces together
+                visual_score = await self._get_visual_compatibility_score(
+                    self.items.image_paths[top],
+                    self.items.image_paths[bottom],
+                    self.items.image_paths[footwear]
+                )
 
-            # Calculate visual compatibility score for all three pieces together
-            visual_score = await self._get_visual_compatibility_score(
-                top['image_path'],
-                bottom['image_path'],
-                footwear['image_path']
-            )
-
-            # Get text compatibility score for the three-piece outfit
-            text_score = await self._get_text_compatibility_score(
-                top,
-                bottom,
-                "top_bottom_footwear",
-                item3=footwear
-            )
+                # Get text compatibility score for the three-piece outfit
+                text_score = await self._get_text_compatibility_score(
+                    top,
+                    bottom,
+                    "top_bottom_footwear",
+                    item3=footwear
+                )
 
             # Calculate final score - weighted average of all compatibility metrics
             final_score = (
@@ -175,7 +399,7 @@ class OutfitCompatibilityAnalyzer:
                 0.3 * visual_score +
                 0.3 * text_score
             )
-            return final_score
+            return fallback_score(final_score) if degraded else final_score
 
         except Exception as e:
             logger.error(f"Error calculating three-piece compatibility: {e}", exc_info=True)
@@ -198,22 +422,43 @@ class OutfitCompatibilityAnalyzer:
                     return 0.0
 
             combined_image = self._create_combined_image(img1, img2, img3)
-            image_inputs = self.clip_processor(images=combined_image, return_tensors="pt", padding=True)
-            image_features = self.clip_model.get_image_features(**image_inputs)
-            text_inputs = self.clip_processor(text=["a fashionable outfit", "an unfashionable outfit"], return_tensors="pt", padding=True)
-            text_features = self.clip_model.get_text_features(**text_inputs)
-
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            similarity = image_features @ text_features.T
-            return similarity[0][0].item()
+            score = await self._run_model(self._visual_score_for_image, combined_image)
+            self.forward_passes += VISUAL_FORWARD_PASSES
+            return score
         except Exception as e:
             logger.error(f"Error calculating visual compatibility for: {e}", exc_info=True)
             return 0.0
 
+    def _visual_score_for_image(self, combined_image):
+        image_inputs = self.clip_processor(images=combined_image, return_tensors="pt", padding=True)
+        text_inputs = self.clip_processor(text=["a fashionable outfit", "an unfashionable outfit"], return_tensors="pt", padding=True)
+        with inference_context():
+            image_features = as_float(self.clip_model.get_image_features(**image_inputs))
+            text_features = as_float(self.clip_model.get_text_features(**text_inputs))
+
+        image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        similarity = image_features @ text_features.T
+        return similarity[0][0].item()
+
     async def _load_image_from_url(self, image_url):
         try:
-            image = await self.download_image(None, image_url) # Pass None for session here, assuming download_image handles it
+            if self.image_cache is not None:
+                thumbnail = self.image_cache.thumbnail(image_url)
+                if thumbnail is not None:
+                    return thumbnail
+            if self.download_image is None or os.path.exists(image_url):
+                # Local uploads are scored straight from disk
+                if self.image_cache is not None:
+                    with open(image_url, "rb") as f:
+                        return self.image_cache.put(image_url, f.read()).thumbnail
+                with Image.open(image_url) as image:
+                    return image.convert("RGB").resize((256, 256))
+            image = await self.download_image(image_url)
+            if image is not None and self.image_cache is not None:
+                thumbnail = self.image_cache.thumbnail(image_url)
+                if thumbnail is not None:
+                    return thumbnail
             return image.resize((256, 256)) if image else None
         except Exception as e:
             logger.error(f"Error loading image from {image_url}: {e}", exc_info=True)
@@ -235,74 +480,91 @@ class OutfitCompatibilityAnalyzer:
             combined.paste(img3, (512, 0))
         return combined
 
+    def _format_prompts(self, item1, item2, outfit_type="top_bottom", item3=None):
+        """Fills the outfit type's prompt templates with the items' materials and colors."""
+        prompts = []
+        relevant_prompts = self.compatibility_prompts.get(outfit_type, [])
+        for prompt_template in relevant_prompts:
+            if outfit_type == "dress_footwear":
+                prompt = prompt_template.format(
+                    dress_material=self.items.record(item1).get('Material', 'unknown'),
+                    dress_color=self.items.record(item1).get('Dominant_Color', 'unknown'),
+                    footwear_material=self.items.record(item2).get('Material', 'unknown'),
+                    footwear_color=self.items.record(item2).get('Dominant_Color', 'unknown')
+                )
+            elif outfit_type == "bottom_footwear": #new
+                prompt = prompt_template.format(
+                    bottom_material=self.items.record(item1).get('Material', 'unknown'),
+                    bottom_color=self.items.record(item1).get('Dominant_Color', 'unknown'),
+                    footwear_material=self.items.record(item2).get('Material', 'unknown'),
+                    footwear_color=self.items.record(item2).get('Dominant_Color', 'unknown')
+                )
+            elif outfit_type == "top_footwear": #new
+                prompt = prompt_template.format(
+                    top_material=self.items.record(item1).get('Material', 'unknown'),
+                    top_color=self.items.record(item1).get('Dominant_Color', 'unknown'),
+                    footwear_material=self.items.record(item2).get('Material', 'unknown'),
+                    footwear_color=self.items.record(item2).get('Dominant_Color', 'unknown')
+                )
+            elif outfit_type == "top_bottom_footwear" and item3 is not None: #new (review logic)
+                prompt = prompt_template.format(
+                    top_material=self.items.record(item1).get('Material', 'unknown'),
+                    top_color=self.items.record(item1).get('Dominant_Color', 'unknown'),
+                    bottom_material=self.items.record(item2).get('Material', 'unknown'),
+                    bottom_color=self.items.record(item2).get('Dominant_Color', 'unknown'),
+                    footwear_material=self.items.record(item3).get('Material', 'unknown'),
+                    footwear_color=self.items.record(item3).get('Dominant_Color', 'unknown')
+                )
+            else:  # Default: Top + Bottom
+                prompt = prompt_template.format(
+                    top_material=self.items.record(item1).get('Material', 'unknown'),
+                    bottom_material=self.items.record(item2).get('Material', 'unknown'),
+                    top_color=self.items.record(item1).get('Dominant_Color', 'unknown'),
+                    bottom_color=self.items.record(item2).get('Dominant_Color', 'unknown')
+                )
+            prompts.append(prompt)
+        return sample_prompts(prompts, self.budget.max_prompts)
+
     #defaults to top_bottom outfit type
     async def _get_text_compatibility_score(self, item1, item2, outfit_type="top_bottom", item3=None):
-        scores = []
         try:
             # Load images
-            img1 = await self._load_image_from_url(item1['image_path'])
-            img2 = await self._load_image_from_url(item2['image_path'])
+            img1 = await self._load_image_from_url(self.items.image_paths[item1])
+            img2 = await self._load_image_from_url(self.items.image_paths[item2])
             if img1 is None or img2 is None:
                 return 0.0
 
             img3 = None
-            if item3:
-                img3 = await self._load_image_from_url(item3['image_path'])
+            if item3 is not None:
+                img3 = await self._load_image_from_url(self.items.image_paths[item3])
                 if img3 is None:
                     return 0.0
 
             # Create combined image based on number of items
             combined_image = self._create_combined_image(img1, img2, img3)
-            relevant_prompts = self.compatibility_prompts.get(outfit_type, [])
-
-            for prompt_template in relevant_prompts:
-                if outfit_type == "dress_footwear":
-                    prompt = prompt_template.format(
-                        dress_material=item1.get('Material', 'unknown'),
-                        dress_color=item1.get('Dominant_Color', 'unknown'),
-                        footwear_material=item2.get('Material', 'unknown'),
-                        footwear_color=item2.get('Dominant_Color', 'unknown')
-                    )
-                elif outfit_type == "bottom_footwear": #new
-                    prompt = prompt_template.format(
-                        bottom_material=item1.get('Material', 'unknown'),
-                        bottom_color=item1.get('Dominant_Color', 'unknown'),
-                        footwear_material=item2.get('Material', 'unknown'),
-                        footwear_color=item2.get('Dominant_Color', 'unknown')
-                    )
-                elif outfit_type == "top_footwear": #new
-                    prompt = prompt_template.format(
-                        top_material=item1.get('Material', 'unknown'),
-                        top_color=item1.get('Dominant_Color', 'unknown'),
-                        footwear_material=item2.get('Material', 'unknown'),
-                        footwear_color=item2.get('Dominant_Color', 'unknown')
-                    )
-                elif outfit_type == "top_bottom_footwear" and item3: #new (review logic)
-                    prompt = prompt_template.format(
-                        top_material=item1.get('Material', 'unknown'),
-                        top_color=item1.get('Dominant_Color', 'unknown'),
-                        bottom_material=item2.get('Material', 'unknown'),
-                        bottom_color=item2.get('Dominant_Color', 'unknown'),
-                        footwear_material=item3.get('Material', 'unknown'),
-                        footwear_color=item3.get('Dominant_Color', 'unknown')
-                    )
-                else:  # Default: Top + Bottom
-                    prompt = prompt_template.format(
-                        top_material=item1.get('Material', 'unknown'),
-                        bottom_material=item2.get('Material', 'unknown'),
-                        top_color=item1.get('Dominant_Color', 'unknown'),
-                        bottom_color=item2.get('Dominant_Color', 'unknown')
-                    )
-
-                inputs = self.clip_processor(
-                    text=[prompt, "unfashionable combination"],
-                    images=combined_image,
-                    return_tensors="pt",
-                    padding=True
-                )
-                outputs = self.clip_model(**inputs)
-                scores.append(outputs.logits_per_image.softmax(dim=1)[0][0].item())
-            return np.mean(scores) if scores else 0.0
+            prompts = self._format_prompts(item1, item2, outfit_type, item3)
+            if not prompts:
+                return 0.0
+
+            score = await self._run_model(self._text_score_for_image, combined_image, prompts)
+            self.forward_passes += TEXT_FORWARD_PASSES
+            return score
         except Exception as e:
             logger.error(f"Error calculating text compatibility for items: {e}", exc_info=True)
-            return 0.0
\ No newline at end of file
+            return 0.0
+
+    def _text_score_for_image(self, combined_image, prompts):
+        # Score every prompt and the shared negative against one image encoding in a single pass
+        inputs = self.clip_processor(
+            text=prompts + ["unfashionable combination"],
+            images=combined_image,
+            return_tensors="pt",
+            padding=True
+        )
+        with inference_context():
+            outputs = self.clip_model(**inputs)
+        logits = as_float(outputs.logits_per_image[0])
+        # Same two-way softmax as scoring [prompt, negative] one prompt at a time
+        pairwise_logits = torch.stack([logits[:-1], logits[-1].expand(len(prompts))], dim=1)
+        scores = pairwise_logits.softmax(dim=1)[:, 0]
+        return scores.mean().item()
@@ -0,0 +1,90 @@
+# outfit_search.py
+import heapq
+import logging
+import random
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OutfitSearch:
+    """
+    Deterministic beam search for the best top + bottom + footwear outfits.
+
+    Stage 1 scores every top x bottom pair and keeps the beam_width best pairs overall.
+    Stage 2 scores every footwear item against each kept pair and keeps the top_k outfits in a heap.
+    Cost: len(tops) * len(bottoms) pair scores plus min(beam_width, pairs) * len(footwear) three-piece scores.
+    The result is exact, the global top_k outfits, when beam_width >= len(tops) * len(bottoms), since every
+    pair then stays in the beam; with a narrower beam it is the top_k among outfits built on the best pairs.
+    Equal scores are broken by seeded per-item ranks, so a given seed always returns the same outfits.
+    """
+
+    def __init__(self, pair_score, three_piece_score, beam_width=4, top_k=5, seed=0, pair_scores=None):
+        # pair_score(item1, item2, outfit_type) and three_piece_score(top, bottom, footwear, top_bottom_score)
+        # are coroutines, e.g. the analyzer's _calculate_compatibility / _calculate_three_piece_compatibility,
+        # which memoize their scores so repeated rankings cost no model calls
+        # Optional pair_scores(items1, items2, outfit_type) coroutine returning the whole (N, M) score array,
+        # used instead of one pair_score call per pair when given
+        self.pair_score = pair_score
+        self.pair_scores = pair_scores
+        self.three_piece_score = three_piece_score
+        self.beam_width = beam_width
+        self.top_k = top_k
+        self.seed = seed
+
+    @staticmethod
+    def estimate_evaluations(n_tops, n_bottoms, n_footwear, beam_width):
+        """
+        The score evaluations a search over these item counts makes (memoized scores cost no model call) and
+        whether its result is exact or beam-approximate.
+        """
+        pairs = n_tops * n_bottoms
+        return {
+            "pair_evaluations": pairs,
+            "three_piece_evaluations": min(beam_width, pairs) * n_footwear,
+            "beam_width": beam_width,
+            "exact": beam_width >= pairs,
+        }
+
+    def _tie_ranks(self, count, salt):
+        rng = random.Random(f"{self.seed}:{salt}")
+        return [rng.random() for _ in range(count)]
+
+    async def rank_pairs(self, items1, items2, outfit_type="top_bottom"):
+        """Scores every (items1[i], items2[j]) pair and returns [(score, tie, i, j)] sorted best first."""
+        ranks1 = self._tie_ranks(len(items1), f"{outfit_type}:1")
+        ranks2 = self._tie_ranks(len(items2), f"{outfit_type}:2")
+        if self.pair_scores is not None:
+            scores = np.asarray(await self.pair_scores(items1, items2, outfit_type), dtype=np.float64)
+            ties = np.add.outer(ranks1, ranks2)
+            rows, columns = np.indices(scores.shape)
+            # Same order as sorting the (score, tie, i, j) tuples in reverse
+            order = np.lexsort((-columns.ravel(), -rows.ravel(), -ties.ravel(), -scores.ravel()))
+            return [(float(scores.flat[n]), float(ties.flat[n]), int(rows.flat[n]), int(columns.flat[n])) for n in order]
+        ranked = []
+        for i, item1 in enumerate(items1):
+            for j, item2 in enumerate(items2):
+                score = await self.pair_score(item1, item2, outfit_type)
+                ranked.append((score, ranks1[i] + ranks2[j], i, j))
+        ranked.sort(reverse=True)
+        return ranked
+
+    async def search(self, tops, bottoms, footwear):
+        """Returns up to top_k (score, top, bottom, footwear) outfits, best first."""
+        if not tops or not bottoms or not footwear:
+            return []
+        beam = (await self.rank_pairs(tops, bottoms, "top_bottom"))[:self.beam_width]
+        footwear_ranks = self._tie_ranks(len(footwear), "footwear")
+
+        best = []  # min-heap of (score, tie, i, j, k) holding the current top_k outfits
+        for pair_score, pair_tie, i, j in beam:
+            for k, shoe in enumerate(footwear):
+                score = await self.three_piece_score(tops[i], bottoms[j], shoe, top_bottom_score=pair_score)
+                entry = (score, pair_tie + footwear_ranks[k], i, j, k)
+                if len(best) < self.top_k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        return [(score, tops[i], bottoms[j], footwear[k]) for score, _, i, j, k in sorted(best, reverse=True)]
@@ -0,0 +1,159 @@
+# retrieval.py
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+
+from embedding_scorer import EmbeddingCompatibilityScorer
+from outfit_analyzer import PAIR_CATEGORIES, combine_scores
+from vector_index import DEFAULT_INDEX_DIR, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# For each item category: (outfit type, complementary category) pairs it can be matched with
+COMPLEMENTARY_CATEGORIES = {}
+for _outfit_type, (_category1, _category2) in PAIR_CATEGORIES.items():
+    COMPLEMENTARY_CATEGORIES.setdefault(_category1, []).append((_outfit_type, _category2))
+    COMPLEMENTARY_CATEGORIES.setdefault(_category2, []).append((_outfit_type, _category1))
+
+
+class WardrobeRetriever:
+    """
+    Finds compatible items for an item across every stored item embedding of one model.
+
+    Candidate generation searches a VectorIndex (built from the item store and persisted under index_dir)
+    with the gradient of the embedding compatibility score at the mean of the filtered items, i.e. ranks
+    items by the first-order approximation of their score. Only the best `candidates` of those are then
+    scored exactly with EmbeddingCompatibilityScorer, so a query costs a few IVF lists plus one small
+    tensor op instead of a score per stored item.
+    The index follows the store's (count, latest updated_at) version, checked at most every
+    refresh_interval seconds: items upserted since the index's version (new or reclassified) are added to it
+    incrementally, and once more than rebuild_fraction of it was added that way, or the counts disagree,
+    a full rebuild runs in a background thread while queries keep using the current index. Only the first
+    build, with no index on disk, happens in the request path.
+    """
+
+    def __init__(self, item_store, model_key, clip_processor, clip_model, compatibility_prompts,
+                 index_dir=DEFAULT_INDEX_DIR, ivf_min_size=2048, nprobe=16, refresh_interval=10, rebuild_fraction=0.25):
+        self.item_store = item_store
+        self.model_key = model_key
+        self.scorer = EmbeddingCompatibilityScorer(clip_processor, clip_model, compatibility_prompts)
+        safe_key = model_key.replace("/", "__").replace("\\", "__").replace(":", "-")
+        self.index_dir = os.path.join(index_dir, safe_key)
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.refresh_interval = refresh_interval
+        self.rebuild_fraction = rebuild_fraction
+        self._index = None
+        self._checked_at = 0.0
+        self._incremental = 0
+        self._rebuild_thread = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        """The current index, loaded from disk or built on first use, brought up to date with the item store."""
+        with self._lock:
+            now = time.monotonic()
+            if self._index is not None and now - self._checked_at < self.refresh_interval:
+                return self._index
+            self._checked_at = now
+            version = self.item_store.embedding_version(self.model_key)
+            if self._index is None:
+                self._index = VectorIndex.load(self.index_dir)
+                if self._index is not None:
+                    self._index.nprobe = self.nprobe
+            if self._index is None or "source_updated_at" not in self._index.metadata:
+                self._index = self._build(version)
+                self._incremental = 0
+            elif self._version(self._index) != version:
+                self._refresh(version)
+            return self._index
+
+    @staticmethod
+    def _version(index):
+        return index.metadata.get("source_count"), index.metadata.get("source_updated_at")
+
+    def _items(self, updated_after=None):
+        return (
+            (content_hash, category, occasion, season, embedding)
+            for content_hash, _, category, occasion, season, embedding
+            in self.item_store.iter_embeddings(self.model_key, updated_after=updated_after)
+        )
+
+    def _refresh(self, version):
+        # Only the rows upserted since the index's version are read; rows written while this runs may be
+        # read again by the next refresh, which upsert() makes harmless
+        added = self._index.upsert(self._items(self._index.metadata["source_updated_at"]))
+        self._index.metadata.update(source_count=version[0], source_updated_at=version[1])
+        self._incremental += added
+        logger.info(f"Added {added} updated items to the vector index ({len(self._index)} items)")
+        if len(self._index) != version[0] or self._incremental > self.rebuild_fraction * max(len(self._index), 1):
+            self._rebuild_in_background()
+
+    def _rebuild_in_background(self):
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_thread = threading.Thread(target=self._rebuild, name="vector-index-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def _rebuild(self):
+        try:
+            index = self._build(self.item_store.embedding_version(self.model_key))
+        except Exception as e:
+            logger.error(f"Vector index rebuild failed: {e}")
+            return
+        with self._lock:
+            self._index = index
+            self._incremental = 0
+            # Items upserted during the build are picked up by the next check
+            self._checked_at = 0.0
+
+    def _build(self, version):
+        start = time.perf_counter()
+        index = VectorIndex.build(self._items(), ivf_min_size=self.ivf_min_size, nprobe=self.nprobe,
+                                  metadata={"model_key": self.model_key, "source_count": version[0],
+                                            "source_updated_at": version[1]})
+        logger.info(f"Built vector index of {len(index)} items in {time.perf_counter() - start:.2f}s: {index.stats()}")
+        try:
+            index.save(self.index_dir)
+        except OSError as e:
+            # Another worker may be replacing the same directory; the in-memory index is still usable
+            logger.warning(f"Could not persist vector index {self.index_dir}: {e}")
+        return index
+
+    def find(self, embedding, outfit_type, category, occasion=None, season=None, k=5, candidates=50, exclude=()):
+        """
+        Returns up to k (score, content_hash) items of `category` that best complete `embedding` as
+        outfit_type, best first. Candidates come from the index; their final scores are exact.
+        """
+        index = self.index()
+        mean = index.mean(category, occasion, season)
+        if mean is None:
+            return []
+        base = torch.from_numpy(np.asarray(embedding, dtype=np.float32))
+        base = base / base.norm()
+        visual_weight = combine_scores(1.0, 0.0, outfit_type)
+        text_weight = combine_scores(0.0, 1.0, outfit_type)
+        query = self.scorer.score_gradient(base, torch.from_numpy(mean), outfit_type, visual_weight, text_weight)
+        found = [
+            (content_hash, vector)
+            for _, content_hash, vector in index.search(query.numpy(), candidates + len(exclude), category, occasion, season)
+            if content_hash not in exclude
+        ][:candidates]
+        if not found:
+            return []
+        vectors = torch.from_numpy(np.stack([vector for _, vector in found]).astype(np.float32))
+        visual, text = self.scorer.outfit_scores(base[None, :] + vectors, outfit_type)
+        scores = combine_scores(visual, text, outfit_type)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(float(scores[i]), found[i][0]) for i in order]
+
+    def matches(self, embedding, category, occasion=None, season=None, k=5, candidates=50, exclude=()):
+        """Best items per complementary category: {category: [(score, content_hash)]}."""
+        return {
+            other: self.find(embedding, outfit_type, other, occasion, season, k, candidates, exclude)
+            for outfit_type, other in COMPLEMENTARY_CATEGORIES.get(category, [])
+        }
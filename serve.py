@@ -0,0 +1,67 @@
+# serve.py
+"""
+Production entry point: gunicorn with the app and its models preloaded in the master process.
+
+    python serve.py            (same as: gunicorn -c serve.py)
+
+The master imports app.py with PRELOAD_MODELS=all, so the models, their label banks and a warm-up
+inference run once before any worker is forked. Workers inherit the weights copy-on-write, and since
+inference never writes to them every worker keeps roughly one shared copy plus its own activations;
+GET /ready reports each worker's shared and private memory.
+"""
+import gc
+import os
+import sys
+
+os.environ.setdefault("PRELOAD_MODELS", "all")
+
+# The master warms the models up single-threaded: once OpenMP has started its thread pool in a process,
+# a forked child hangs on its first parallel op. Workers get their real thread count in post_fork.
+from inference import TORCH_NUM_THREADS, configure_torch_threads  # noqa: E402
+
+configure_torch_threads(num_threads=1)
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_WORKERS", "2"))
+# Threads per worker; long classification requests and streamed responses each hold one
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "8"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master once the preloaded app is imported, right before the first worker is forked
+    from models import registry
+    registry.stop_batchers()
+    # Keep the garbage collector from touching (and so copying) the inherited objects' pages in the workers
+    gc.collect()
+    gc.freeze()
+    server.log.info("Models preloaded and warmed up; forking workers")
+
+
+def post_fork(server, worker):
+    import torch
+    from app import job_manager
+
+    if TORCH_NUM_THREADS > 0:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+    else:
+        # Split the cores between workers instead of every worker using all of them
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        torch.set_num_threads(max(1, cores // workers))
+    # Each worker runs its own job threads and takes over jobs left behind by workers that exited
+    job_manager.start()
+
+
+def main():
+    from gunicorn.app.wsgiapp import run
+    sys.argv = [sys.argv[0], "-c", os.path.abspath(__file__), *sys.argv[1:]]
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# telemetry.py
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms rendered in the Prometheus text exposition format, plus collectors: callables
+    run at scrape time that return (name, type, help, [(labels dict, value)]) tuples for values other
+    components already track (queue depths, cache sizes). Metrics are per process, so under gunicorn each
+    worker reports its own.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def _add(self, name, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "stylish_stage_duration_seconds", "Duration of pipeline stage spans.", ("stage",))
+stage_items = metrics.counter(
+    "stylish_stage_items_total", "Items processed by pipeline stage spans.", ("stage",))
+request_seconds = metrics.histogram(
+    "stylish_request_duration_seconds", "Duration of HTTP requests and background jobs.", ("endpoint", "status"))
+cache_lookups = metrics.counter(
+    "stylish_cache_lookups_total", "Cache lookups by cache and result (hit, miss, revalidated, stale).", ("cache", "result"))
+model_forwards = metrics.counter(
+    "stylish_model_forward_passes_total", "Model forward passes by model and tower.", ("model", "tower"))
+model_forward_rows = metrics.counter(
+    "stylish_model_forward_rows_total", "Rows (images or texts) carried by model forward passes.", ("model", "tower"))
+
+
+def observe_forward(model, tower, rows):
+    model_forwards.inc(model=model, tower=tower)
+    model_forward_rows.inc(rows, model=model, tower=tower)
+
+
+def observe_cache(cache, result, count=1):
+    """Counts cache lookups and adds them to the current trace's cache hit rates."""
+    if count <= 0:
+        return
+    cache_lookups.inc(count, cache=cache, result=result)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_cache(cache, result, count)
+
+
+class Trace:
+    """
+    Spans of one request or job, aggregated per stage name: how often the stage ran, its total and
+    longest duration and the items it covered, plus per-cache lookup results.
+    """
+
+    def __init__(self, name, trace_id=None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.time()
+        self.duration = None
+        self.stages = {}
+        self.caches = {}
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, seconds, items=None, **attributes):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "items": 0})
+            entry["count"] += 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["items"] += items or 0
+            for key, value in attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+                else:
+                    entry[key] = value
+
+    def add_cache(self, cache, result, count=1):
+        with self._lock:
+            results = self.caches.setdefault(cache, {})
+            results[result] = results.get(result, 0) + count
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.time() - self.started
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            stages = {stage: {key: round(value, 3) if isinstance(value, float) else value for key, value in entry.items()}
+                      for stage, entry in self.stages.items()}
+            caches = {}
+            for cache, results in self.caches.items():
+                lookups = sum(results.values())
+                caches[cache] = {**results, "hit_rate": round(results.get("hit", 0) / lookups, 3) if lookups else 0.0}
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "stages": stages,
+            "caches": caches,
+            "attributes": dict(self.attributes),
+        }
+
+    def server_timing(self):
+        """Server-Timing header value with the total milliseconds per stage."""
+        with self._lock:
+            return ", ".join(f"{stage};dur={entry['total_ms']:.1f}" for stage, entry in self.stages.items())
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+# Most recent finished traces, served by GET /traces
+recent_traces = deque(maxlen=100)
+
+
+def start_trace(name):
+    trace = Trace(name)
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace, status="ok"):
+    """Ends a trace: records its duration, logs it as one JSON line and keeps it in recent_traces."""
+    if trace is None or trace.duration is not None:
+        return
+    trace.finish()
+    request_seconds.observe(trace.duration, endpoint=trace.name, status=status)
+    record = trace.to_dict()
+    record["status"] = status
+    recent_traces.append(record)
+    logger.info(f"trace {json.dumps(record, default=str)}")
+
+
+@contextmanager
+def span(stage, items=None, **attributes):
+    """
+    Times a pipeline stage; the duration goes to the stage histogram and, inside a request or job, to its
+    trace. The yielded dict can be updated with attributes known only at the end (e.g. cache hits).
+    """
+    start = time.perf_counter()
+    extra = dict(attributes)
+    try:
+        yield extra
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=stage)
+        count = extra.pop("items", items)
+        if count:
+            stage_items.inc(count, stage=stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(stage, seconds, count, **extra)
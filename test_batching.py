@@ -0,0 +1,79 @@
+# test_batching.py
+import threading
+
+import pytest
+import torch
+
+from batching import BatchedClipModel, MicroBatcher, _pad_text_inputs
+from conftest import TINY_CLIP_BOS, TINY_CLIP_EOS
+
+
+def text_inputs(lengths, seed, pad_id=TINY_CLIP_EOS):
+    """Tokenized like CLIPProcessor(padding=True): bos, words, eos, then padding up to the longest row."""
+    generator = torch.Generator().manual_seed(seed)
+    longest = max(lengths) + 2
+    input_ids = torch.full((len(lengths), longest), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros_like(input_ids)
+    for row, length in enumerate(lengths):
+        words = torch.randint(3, 90, (length,), generator=generator)
+        input_ids[row, :length + 2] = torch.cat([torch.tensor([TINY_CLIP_BOS]), words, torch.tensor([TINY_CLIP_EOS])])
+        attention_mask[row, :length + 2] = 1
+    return input_ids, attention_mask
+
+
+@pytest.mark.parametrize("pad_id", [TINY_CLIP_EOS, 0])
+def test_padded_text_batch_matches_separate_forwards(tiny_clip, pad_id):
+    inputs = [text_inputs([3], 0, pad_id), text_inputs([9, 2, 5], 1, pad_id), text_inputs([1, 12], 2, pad_id)]
+    input_ids, attention_mask = _pad_text_inputs(inputs)
+
+    assert input_ids.shape == (6, 14) and attention_mask.shape == (6, 14)
+    assert attention_mask.sum().item() == sum(mask.sum().item() for _, mask in inputs)
+    with torch.no_grad():
+        batched = tiny_clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+        separate = torch.cat([tiny_clip.get_text_features(input_ids=ids, attention_mask=mask) for ids, mask in inputs])
+    torch.testing.assert_close(batched, separate, rtol=1e-4, atol=1e-5)
+
+
+def test_batched_model_merges_concurrent_calls(tiny_clip):
+    model = BatchedClipModel(tiny_clip, "tiny", max_batch=8, max_wait_ms=200)
+    inputs = [text_inputs([2, 4], seed) for seed in range(3)] + [text_inputs([7], 3)]
+    results = [None] * len(inputs)
+    barrier = threading.Barrier(len(inputs))
+
+    def encode(position):
+        barrier.wait()
+        results[position] = model.get_text_features(*inputs[position])
+
+    threads = [threading.Thread(target=encode, args=(position,)) for position in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    model.stop()
+
+    with torch.no_grad():
+        for (input_ids, attention_mask), result in zip(inputs, results):
+            expected = tiny_clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+            torch.testing.assert_close(result, expected, rtol=1e-4, atol=1e-5)
+    stats = model.stats()["text"]
+    assert stats["rows"] == 7 and stats["batches"] < len(inputs)
+
+
+def test_micro_batcher_fans_results_back_out():
+    batches = []
+
+    def run_batch(inputs):
+        batches.append(len(inputs))
+        return [torch.as_tensor(value) * 10 for value in inputs]
+
+    batcher = MicroBatcher("test", run_batch, max_batch=4, max_wait_ms=50)
+    results = {}
+    threads = [threading.Thread(target=lambda n=n: results.__setitem__(n, batcher.submit([n], 1))) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.stop()
+
+    assert {n: result.tolist() for n, result in results.items()} == {n: [n * 10] for n in range(6)}
+    assert sum(batches) == 6
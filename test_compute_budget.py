@@ -0,0 +1,103 @@
+# test_compute_budget.py
+import pytest
+
+from compute_budget import ComputeBudget, fallback_score, is_fallback_score, raw_score, sample_prompts
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_from_request_overrides_defaults():
+    budget = ComputeBudget.from_request({"max_prompts": "4", "deadline_seconds": 2.5},
+                                        max_pair_evaluations=100, max_prompts=10, deadline_seconds=30)
+    assert (budget.max_pair_evaluations, budget.max_prompts, budget.deadline_seconds) == (100, 4, 2.5)
+
+
+def test_from_request_zero_or_missing_means_unlimited():
+    budget = ComputeBudget.from_request(None)
+    assert (budget.max_pair_evaluations, budget.max_prompts, budget.deadline_seconds) == (None, None, None)
+    budget = ComputeBudget.from_request({"max_pair_evaluations": 0, "deadline_seconds": None})
+    assert (budget.max_pair_evaluations, budget.deadline_seconds) == (None, None)
+
+
+def test_from_request_can_only_tighten_server_limits():
+    defaults = dict(max_pair_evaluations=100, max_prompts=10, deadline_seconds=30)
+    for overrides in (None, {}, {"max_pair_evaluations": 0, "max_prompts": None, "deadline_seconds": 0},
+                      {"max_pair_evaluations": 5000, "max_prompts": 50, "deadline_seconds": 600}):
+        budget = ComputeBudget.from_request(overrides, **defaults)
+        assert (budget.max_pair_evaluations, budget.max_prompts, budget.deadline_seconds) == (100, 10, 30)
+    budget = ComputeBudget.from_request({"max_pair_evaluations": 20, "deadline_seconds": 1.5}, **defaults)
+    assert (budget.max_pair_evaluations, budget.max_prompts, budget.deadline_seconds) == (20, 10, 1.5)
+    # A limit the server leaves unlimited can still be set by the request
+    assert ComputeBudget.from_request({"max_prompts": 3}, max_prompts=0).max_prompts == 3
+
+
+@pytest.mark.parametrize("overrides, error", [
+    (["max_prompts", 4], TypeError),
+    ("fast", TypeError),
+    ({"max_pair_evaluations": "many"}, ValueError),
+    ({"deadline_seconds": "soon"}, ValueError),
+    ({"max_pair_evaluations": -5}, ValueError),
+    ({"deadline_seconds": -0.5}, ValueError),
+    ({"max_prompts": True}, TypeError),
+    ({"max_pair_evaluations": [10]}, TypeError),
+    ({"deadline_seconds": "nan"}, ValueError),
+    ({"deadline_seconds": float("inf")}, ValueError),
+    ({"max_pair_evaluations": float("inf")}, ValueError),
+])
+def test_from_request_rejects_invalid_overrides(overrides, error):
+    with pytest.raises(error):
+        ComputeBudget.from_request(overrides, max_pair_evaluations=100, deadline_seconds=30)
+
+
+def test_exhaustion_by_evaluations_and_deadline():
+    clock = FakeClock()
+    budget = ComputeBudget(max_pair_evaluations=2, deadline_seconds=5, clock=clock)
+    assert budget.exhausted() is None
+    budget.charge(2)
+    assert budget.exhausted() == "pair_evaluations"
+    clock.now += 5
+    assert budget.exhausted() == "deadline"
+    # The first reason is the one reported
+    assert budget.stats()["exhausted"] == "pair_evaluations"
+
+
+def test_fallbacks_mark_the_result_partial():
+    budget = ComputeBudget()
+    assert not budget.partial
+    budget.record_fallback("embedding", 3)
+    budget.record_fallback("color")
+    budget.record_fallback("embedding")
+    assert budget.partial
+    assert budget.stats()["fallback_scores"] == {"embedding": 4, "color": 1}
+
+
+def test_outfit_searches_are_stated_in_the_stats():
+    budget = ComputeBudget()
+    estimate = {"pair_evaluations": 6, "three_piece_evaluations": 8, "beam_width": 4, "exact": False}
+    budget.record_search("Casual", estimate)
+    assert budget.stats()["outfit_searches"] == {"Casual": estimate}
+
+
+def test_fallback_scores_rank_below_model_scores():
+    for score in (-1.0, 0.0, 0.37, 1.0):
+        shifted = fallback_score(score)
+        assert is_fallback_score(shifted) and not is_fallback_score(score)
+        assert shifted < -1.0
+        assert raw_score(shifted) == pytest.approx(score)
+        assert raw_score(score) == score
+
+
+def test_sample_prompts_spreads_over_the_list():
+    prompts = [f"prompt {i}" for i in range(10)]
+    assert sample_prompts(prompts, None) == prompts
+    assert sample_prompts(prompts, 20) == prompts
+    assert sample_prompts(prompts, 1) == ["prompt 0"]
+    sampled = sample_prompts(prompts, 4)
+    assert sampled == ["prompt 0", "prompt 3", "prompt 6", "prompt 9"]
+    assert sample_prompts(prompts, 4) == sampled
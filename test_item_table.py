@@ -0,0 +1,81 @@
+# test_item_table.py
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from item_table import ItemTable, parse_rgb
+
+ROWS = [
+    {"image_path": "a.jpg", "Category": "Top", "Occasion": "Casual", "Material": "Cotton", "Dominant_Color": "(255, 0, 0)"},
+    {"image_path": "b.jpg", "Category": "Bottom", "Occasion": "Casual", "Material": np.nan, "Dominant_Color": "(0, 0, 255)"},
+    {"image_path": "c.jpg", "Category": "Top", "Occasion": "Formal", "Material": None, "Dominant_Color": None},
+    {"image_path": "a.jpg", "Category": "Top", "Occasion": "Casual", "Material": "Cotton", "Dominant_Color": "(255, 0, 0)"},
+    {"image_path": "d.jpg", "Category": "Footwear", "Occasion": None, "Material": "Leather", "Dominant_Color": "red"},
+]
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame(ROWS)
+
+
+def test_select_matches_dataframe_filters(frame):
+    table = ItemTable.from_frame(frame)
+    for category in ["Top", "Bottom", "Footwear", "Dress"]:
+        for occasion in ["Casual", "Formal", "Party"]:
+            expected = frame.index[(frame["Category"] == category) & (frame["Occasion"] == occasion)]
+            assert table.select(Category=category, Occasion=occasion).tolist() == expected.tolist()
+        assert table.select(Category=category).tolist() == frame.index[frame["Category"] == category].tolist()
+
+
+def test_missing_and_unknown_values_match_no_item(frame):
+    table = ItemTable.from_frame(frame)
+    assert table.code("Category", "Dress") == -2
+    assert table.code("Occasion", None) == -2
+    # Like frame["Occasion"] == None, a None filter matches nothing, not the rows with a missing value
+    assert table.select(Occasion=None).tolist() == []
+    assert table.codes["Material"].tolist() == [0, -1, -1, 0, 1]
+    assert table.value("Material", 1, default="unknown") == "unknown"
+    assert table.value("Material", 4) == "Leather"
+
+
+def test_records_colors_and_canonical_ids(frame):
+    table = ItemTable.from_frame(frame)
+    assert len(table) == len(ROWS)
+    assert table.record(2)["image_path"] == "c.jpg"
+    assert table.colors[0].tolist() == [255, 0, 0]
+    assert table.has_color.tolist() == [True, True, False, True, False]
+    assert parse_rgb("[12, 300, 7]") == (12, 255, 7)
+    assert table.canonical.tolist() == [0, 1, 2, 0, 4]
+
+
+def strip(recommendations):
+    def path(value):
+        return value["image_path"] if isinstance(value, dict) else round(float(value), 6)
+    return [(item["image_path"], None if matches is None else [tuple(map(path, match)) for match in matches])
+            for item, matches in recommendations]
+
+
+def test_duplicate_image_rows_share_scores_and_recommendations_are_reproducible(wardrobe_frame, tiny_clip,
+                                                                                tiny_clip_processor):
+    from inputs import compatibility_prompts
+    from outfit_analyzer import OutfitCompatibilityAnalyzer
+
+    model, processor = tiny_clip, tiny_clip_processor
+    frame = wardrobe_frame
+    first, duplicate, bottom = 0, len(frame) - 1, 3
+
+    analyzer = OutfitCompatibilityAnalyzer(frame, processor, model, compatibility_prompts, None)
+    score = asyncio.run(analyzer._calculate_compatibility(first, bottom))
+    hits = analyzer.score_cache_hits
+    assert asyncio.run(analyzer._calculate_compatibility(duplicate, bottom)) == score
+    assert analyzer.score_cache_hits == hits + 1
+
+    runs = [
+        strip(asyncio.run(OutfitCompatibilityAnalyzer(frame, processor, model, compatibility_prompts, None)
+                          .find_best_matches("Casual")))
+        for _ in range(2)
+    ]
+    assert runs[0] and runs[0] == runs[1]
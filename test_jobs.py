@@ -0,0 +1,96 @@
+# test_jobs.py
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from jobs import DONE, QUEUED, RUNNING, Job, JobManager, JobStore, process_owner
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def dead_owner():
+    # The pid of a process that has exited, on this host
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+async def succeed(job):
+    return {"success": True, "job": job.job_id}
+
+
+def test_claim_orphans_takes_only_jobs_of_exited_processes(store, dead_owner):
+    store.save(Job("orphan-running", {}, status=RUNNING, owner=dead_owner))
+    store.save(Job("orphan-queued", {}, status=QUEUED, owner=dead_owner))
+    store.save(Job("live", {}, status=RUNNING, owner=process_owner()))
+    store.save(Job("remote", {}, status=RUNNING, owner="some-other-host:1"))
+    store.save(Job("finished", {}, status=DONE, owner=dead_owner))
+
+    claimed = store.claim_orphans("new-owner:1")
+
+    assert sorted(job.job_id for job in claimed) == ["orphan-queued", "orphan-running"]
+    for job_id in ("orphan-running", "orphan-queued"):
+        assert (store.load(job_id).owner, store.load(job_id).status) == ("new-owner:1", QUEUED)
+    assert store.load("live").owner == process_owner()
+    assert store.load("remote").owner == "some-other-host:1"
+    assert store.load("finished").status == DONE
+    assert store.claim_orphans("third-owner:1") == []
+
+
+def test_claim_is_compare_and_set(store, dead_owner):
+    store.save(Job("orphan", {}, status=RUNNING, owner=dead_owner))
+    first, second = store.load("orphan"), store.load("orphan")
+    assert store.claim(first, "a:1")
+    assert not store.claim(second, "b:1")
+    assert store.load("orphan").owner == "a:1"
+
+
+def test_submit_claims_duplicate_of_an_exited_workers_job(store, dead_owner):
+    store.save(Job("orphan", {"images": []}, request_key="request", status=RUNNING, owner=dead_owner))
+    manager = JobManager(succeed, workers=1, store=store)
+
+    job, deduplicated = manager.submit({"images": []}, request_key="request")
+
+    assert deduplicated and job.job_id == "orphan"
+    wait_for(lambda: store.load("orphan").status == DONE)
+    assert store.load("orphan").owner == process_owner()
+
+
+def test_submit_does_not_wait_on_stale_jobs_of_other_hosts(store):
+    store.save(Job("remote-fresh", {}, request_key="fresh", status=RUNNING, owner="some-other-host:1"))
+    store.save(Job("remote-stale", {}, request_key="stale", status=RUNNING, owner="some-other-host:1",
+                   created_at=time.time() - 3600))
+    manager = JobManager(succeed, workers=1, store=store, stale_after=600)
+
+    job, deduplicated = manager.submit({}, request_key="fresh")
+    assert deduplicated and job.job_id == "remote-fresh"
+    job, deduplicated = manager.submit({}, request_key="stale")
+    assert not deduplicated and job.job_id != "remote-stale"
+    assert store.load("remote-stale").owner == "some-other-host:1"
+
+
+def test_content_dedup_skips_failed_results(store):
+    store.save(Job("failed", {}, content_key="content", status=DONE, result={"success": False}, owner="x:1"))
+    manager = JobManager(succeed, workers=1, store=store)
+    job = Job("new", {})
+    assert manager.match_content(job, "content") is None
+
+    store.save(Job("succeeded", {}, content_key="content", status=DONE, result={"success": True}, owner="x:1",
+                   created_at=time.time() - 60))
+    assert manager.match_content(Job("newer", {}), "content").job_id == "succeeded"
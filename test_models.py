@@ -0,0 +1,22 @@
+# test_models.py
+import numpy as np
+import torch
+
+from models import ModelRegistry
+
+
+def test_load_reports_memory_of_each_model_even_below_the_process_peak():
+    # Raise the process's peak RSS first, as earlier request traffic would, then free it again
+    peak = np.ones(64 * 2**20 // 8)
+    del peak
+    registry = ModelRegistry(device="cpu")
+    registry.register("linear", lambda: (torch.nn.Linear(2048, 2048), None))
+
+    model, processor = registry.get("linear")
+
+    stats = registry.report()["linear"]
+    assert stats["loaded"] and processor is None
+    assert stats["weights_bytes"] == (2048 * 2048 + 2048) * 4
+    # The 16 MB of weights show up, although the load stays below the earlier peak
+    assert stats["rss_delta_bytes"] >= stats["weights_bytes"] // 2
+    assert registry.get("linear")[0] is model
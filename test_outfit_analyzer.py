@@ -0,0 +1,51 @@
+# test_outfit_analyzer.py
+import asyncio
+
+import pytest
+
+from compute_budget import ComputeBudget, is_fallback_score
+from inputs import compatibility_prompts
+from outfit_analyzer import TEXT_FORWARD_PASSES, VISUAL_FORWARD_PASSES, OutfitCompatibilityAnalyzer
+
+PAIR_PASSES = VISUAL_FORWARD_PASSES + TEXT_FORWARD_PASSES
+# Row ids in the wardrobe_frame fixture
+TOP, OTHER_TOP, BOTTOM, SHOE = 0, 1, 3, 5
+
+
+@pytest.fixture
+def analyzer(wardrobe_frame, tiny_clip, tiny_clip_processor):
+    def make(budget=None):
+        return OutfitCompatibilityAnalyzer(wardrobe_frame, tiny_clip_processor, tiny_clip, compatibility_prompts,
+                                           None, budget=budget)
+    return make
+
+
+def test_cache_hits_save_the_passes_their_entry_cost(analyzer):
+    analyzer = analyzer()
+    asyncio.run(analyzer._calculate_compatibility(TOP, BOTTOM))
+    assert analyzer.forward_passes == PAIR_PASSES
+    asyncio.run(analyzer._calculate_compatibility(TOP, BOTTOM))
+    assert analyzer.score_cache_stats()["forward_passes_saved"] == PAIR_PASSES
+
+    # Its top-bottom pair is a hit; the two other pairs and the outfit's own scoring are computed
+    asyncio.run(analyzer._calculate_three_piece_compatibility(TOP, BOTTOM, SHOE))
+    assert analyzer.forward_passes == 4 * PAIR_PASSES
+    assert analyzer.forward_passes_saved == 2 * PAIR_PASSES
+    # A three-piece hit saves only the outfit's own passes; its pairs stay cached in their own entries
+    asyncio.run(analyzer._calculate_three_piece_compatibility(TOP, BOTTOM, SHOE))
+    stats = analyzer.score_cache_stats()
+    assert stats["forward_passes_saved"] == 3 * PAIR_PASSES
+    assert (stats["hits"], stats["misses"], stats["forward_passes"]) == (3, 4, 4 * PAIR_PASSES)
+
+
+def test_fallback_scores_save_no_passes(analyzer):
+    analyzer = analyzer(ComputeBudget(max_pair_evaluations=1))
+    asyncio.run(analyzer._calculate_compatibility(TOP, BOTTOM))
+    fallback = asyncio.run(analyzer._calculate_compatibility(OTHER_TOP, BOTTOM))
+    assert is_fallback_score(fallback)
+    assert analyzer.forward_passes == PAIR_PASSES
+
+    asyncio.run(analyzer._calculate_compatibility(OTHER_TOP, BOTTOM))
+    assert analyzer.forward_passes_saved == 0
+    asyncio.run(analyzer._calculate_compatibility(TOP, BOTTOM))
+    assert analyzer.forward_passes_saved == PAIR_PASSES
@@ -0,0 +1,63 @@
+# test_outfit_search.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from outfit_search import OutfitSearch
+
+# Few distinct values, so many pairs tie and the seeded tie-breaking decides their order
+SCORES = np.random.default_rng(0).choice([0.2, 0.5, 0.5, 0.8], size=(7, 6))
+
+
+async def pair_score(item1, item2, outfit_type):
+    return float(SCORES[item1, item2])
+
+
+async def pair_scores(items1, items2, outfit_type):
+    return SCORES[np.ix_(items1, items2)]
+
+
+async def three_piece_score(top, bottom, footwear, top_bottom_score=None):
+    return top_bottom_score + 0.1 * (footwear % 3)
+
+
+def searches(**kwargs):
+    return (OutfitSearch(pair_score, three_piece_score, **kwargs),
+            OutfitSearch(pair_score, three_piece_score, pair_scores=pair_scores, **kwargs))
+
+
+def test_vectorized_pair_ranking_matches_per_pair_ranking():
+    tops, bottoms = [0, 2, 3, 5, 6], [1, 2, 4, 5]
+    for seed in range(3):
+        looped, vectorized = searches(seed=seed)
+        expected = asyncio.run(looped.rank_pairs(tops, bottoms))
+        assert asyncio.run(vectorized.rank_pairs(tops, bottoms)) == expected
+        assert [score for score, *_ in expected] == sorted((score for score, *_ in expected), reverse=True)
+
+
+def test_search_is_deterministic_and_identical_with_either_pair_scorer():
+    tops, bottoms, footwear = [0, 1, 2, 3], [0, 1, 2, 3, 4], [0, 1, 2, 3, 4, 5]
+    looped, vectorized = searches(beam_width=3, top_k=4, seed=7)
+    outfits = asyncio.run(looped.search(tops, bottoms, footwear))
+    assert len(outfits) == 4
+    assert asyncio.run(vectorized.search(tops, bottoms, footwear)) == outfits
+    assert asyncio.run(searches(beam_width=3, top_k=4, seed=7)[0].search(tops, bottoms, footwear)) == outfits
+    assert asyncio.run(looped.search(tops, [], footwear)) == []
+
+
+def test_estimate_evaluations():
+    assert OutfitSearch.estimate_evaluations(4, 5, 6, 3) == {
+        "pair_evaluations": 20, "three_piece_evaluations": 18, "beam_width": 3, "exact": False}
+    assert OutfitSearch.estimate_evaluations(1, 2, 6, 4) == {
+        "pair_evaluations": 2, "three_piece_evaluations": 12, "beam_width": 4, "exact": True}
+
+
+def test_search_with_a_beam_covering_every_pair_returns_the_global_best():
+    tops, bottoms, footwear = [0, 1, 2], [0, 1, 2, 3], [0, 1, 2, 3, 4]
+    assert OutfitSearch.estimate_evaluations(len(tops), len(bottoms), len(footwear), 12)["exact"]
+    outfits = asyncio.run(OutfitSearch(pair_score, three_piece_score, beam_width=12, top_k=6).search(
+        tops, bottoms, footwear))
+    everything = sorted((SCORES[top, bottom] + 0.1 * (shoe % 3) for top in tops for bottom in bottoms for shoe in footwear),
+                        reverse=True)
+    assert [score for score, *_ in outfits] == pytest.approx(everything[:6])
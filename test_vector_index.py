@@ -0,0 +1,133 @@
+# test_vector_index.py
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from vector_index import VectorIndex
+
+
+def make_items(count, dim=8, seed=0, categories=("Top", "Bottom"), occasions=("Casual", "Formal")):
+    rng = np.random.default_rng(seed)
+    return [
+        (f"item-{i}", categories[i % len(categories)], occasions[(i // len(categories)) % len(occasions)], None,
+         rng.normal(size=dim).astype(np.float32))
+        for i in range(count)
+    ]
+
+
+def exact_search(items, query, k, category=None, occasion=None):
+    scored = [
+        (float(embedding / np.linalg.norm(embedding) @ query), item_id)
+        for item_id, item_category, item_occasion, _, embedding in items
+        if category in (None, item_category) and occasion in (None, item_occasion)
+    ]
+    return [item_id for _, item_id in sorted(scored, reverse=True)[:k]]
+
+
+@pytest.mark.parametrize("ivf_min_size", [10_000, 50])
+def test_save_load_round_trip(tmp_path, ivf_min_size):
+    items = make_items(400)
+    index = VectorIndex.build(items, ivf_min_size=ivf_min_size, nprobe=4, metadata={"source_count": 400})
+    index.save(str(tmp_path / "index"))
+    loaded = VectorIndex.load(str(tmp_path / "index"))
+
+    assert loaded.stats() == index.stats()
+    assert loaded.metadata == {"source_count": 400}
+    assert set(loaded.partitions) == set(index.partitions)
+    for key, partition in index.partitions.items():
+        assert list(loaded.partitions[key].ids) == list(partition.ids)
+        np.testing.assert_array_equal(loaded.partitions[key].vectors, partition.vectors)
+    query = make_items(1, seed=1)[0][-1]
+    assert [result[1] for result in loaded.search(query, 10)] == [result[1] for result in index.search(query, 10)]
+
+
+def test_load_missing_or_unreadable_index_returns_none(tmp_path):
+    assert VectorIndex.load(str(tmp_path / "missing")) is None
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "manifest.json").write_text("{not json")
+    assert VectorIndex.load(str(tmp_path / "broken")) is None
+
+
+def test_save_swaps_versions_and_keeps_only_the_previous_one(tmp_path):
+    directory = str(tmp_path / "index")
+    # An index saved before versioned saves is a plain directory
+    os.mkdir(directory)
+    (tmp_path / "index" / "manifest.json").write_text('{"dim": 8, "nprobe": 8, "partitions": []}')
+    assert len(VectorIndex.load(directory)) == 0
+    for count in (20, 30, 40):
+        VectorIndex.build(make_items(count), metadata={"source_count": count}).save(directory)
+        assert VectorIndex.load(directory).metadata == {"source_count": count}
+    assert os.path.islink(directory)
+    versions = sorted(entry for entry in os.listdir(tmp_path) if entry.startswith("index.v"))
+    assert len(versions) == 2 and os.readlink(directory) == versions[-1]
+
+
+def test_concurrent_saves_never_leave_readers_without_an_index(tmp_path):
+    directory = str(tmp_path / "index")
+    VectorIndex.build(make_items(50)).save(directory)
+    index = VectorIndex.build(make_items(300), ivf_min_size=50)
+    errors, missing = [], []
+
+    def save():
+        try:
+            for _ in range(5):
+                index.save(directory)
+        except OSError as e:
+            errors.append(e)
+
+    savers = [threading.Thread(target=save) for _ in range(2)]
+    for saver in savers:
+        saver.start()
+    while any(saver.is_alive() for saver in savers):
+        if VectorIndex.load(directory) is None:
+            missing.append(True)
+    for saver in savers:
+        saver.join()
+    assert errors == [] and missing == []
+    assert len(VectorIndex.load(directory)) == 300
+
+
+def test_exact_search_respects_filters():
+    items = make_items(200)
+    index = VectorIndex.build(items)
+    query = make_items(1, seed=2)[0][-1]
+    query = query / np.linalg.norm(query)
+
+    for category, occasion in [(None, None), ("Top", None), (None, "Formal"), ("Bottom", "Casual")]:
+        results = index.search(query, 5, category=category, occasion=occasion)
+        assert [item_id for _, item_id, _ in results] == exact_search(items, query, 5, category, occasion)
+    assert index.search(query, 5, category="Dress") == []
+    assert index.mean(category="Dress") is None
+
+
+def test_ivf_search_with_every_list_probed_is_exact():
+    items = make_items(600, categories=("Top",), occasions=("Casual",))
+    index = VectorIndex.build(items, ivf_min_size=100)
+    partition = index.partitions[("Top", "Casual", None)]
+    assert partition.is_ivf
+    query = make_items(1, seed=3)[0][-1]
+    query = query / np.linalg.norm(query)
+
+    results = index.search(query, 10, nprobe=len(partition.centroids))
+    assert [item_id for _, item_id, _ in results] == exact_search(items, query, 10)
+
+
+def test_upsert_moves_reclassified_items_and_keeps_ivf_lists_sorted():
+    items = make_items(600, categories=("Top",), occasions=("Casual",))
+    index = VectorIndex.build(items, ivf_min_size=100)
+    moved = ("item-5", "Bottom", "Casual", None, items[5][-1])
+    added = make_items(1, seed=4, categories=("Top",), occasions=("Casual",))[0]
+    added = ("new-item",) + added[1:]
+
+    assert index.upsert([moved, added]) == 2
+    tops = index.partitions[("Top", "Casual", None)]
+    assert "item-5" not in set(map(str, tops.ids))
+    assert "new-item" in set(map(str, tops.ids))
+    assert list(index.partitions[("Bottom", "Casual", None)].ids) == ["item-5"]
+    assert len(index) == 601
+    assignments = tops.assignments()
+    assert np.all(np.diff(assignments) >= 0)
+    position = list(map(str, tops.ids)).index("new-item")
+    assert assignments[position] == np.argmax(tops.centroids @ tops.vectors[position])
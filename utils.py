@@ -3,99 +3,239 @@ from PIL import Image
 from collections import Counter
 import torch
 from inputs import tops, bottoms, dresses, footwear  # Import tops, bottoms, footwear from inputs.py
+import logging
+import os
+import threading
 import rembg
 from rembg import remove
+from rembg.sessions import sessions_class
+import onnxruntime as ort
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 import io
 from PIL import Image
 import matplotlib.pyplot as plt
-
-
-def remove_background(image_path):
-    """Removes background from the input image using rembg."""
-    try:
-        with open(image_path, "rb") as f:
-            input_image = f.read()
-        output_image = remove(input_image)  # Ensure remove() returns bytes
-
-        # Convert output_image to bytes if it's not already
-        if isinstance(output_image, Image.Image):
-            with io.BytesIO() as output_buffer:
-                output_image.save(output_buffer, format="PNG")
-                output_image = output_buffer.getvalue()
-        image = Image.open(io.BytesIO(output_image))  # Convert to PIL image
+from label_bank import label_bank
+from inference import inference_context, as_float
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+
+# Background removal model and ONNX Runtime threading (0 lets ONNX Runtime decide)
+REMBG_MODEL = os.environ.get("REMBG_MODEL", "u2net")
+REMBG_INTRA_OP_THREADS = int(os.environ.get("REMBG_INTRA_OP_THREADS", "0"))
+REMBG_INTER_OP_THREADS = int(os.environ.get("REMBG_INTER_OP_THREADS", "0"))
+
+_rembg_session = None
+_rembg_session_pid = None
+_rembg_session_lock = threading.Lock()
+
+def get_rembg_session():
+    """Returns the long-lived rembg session of this worker process, creating it on first use."""
+    global _rembg_session, _rembg_session_pid
+    # ONNX Runtime sessions are not fork-safe, so a forked worker builds its own
+    if _rembg_session is not None and _rembg_session_pid == os.getpid():
+        return _rembg_session
+    with _rembg_session_lock:
+        if _rembg_session is None or _rembg_session_pid != os.getpid():
+            sess_opts = ort.SessionOptions()
+            sess_opts.intra_op_num_threads = REMBG_INTRA_OP_THREADS
+            sess_opts.inter_op_num_threads = REMBG_INTER_OP_THREADS
+            session_class = next((sc for sc in sessions_class if sc.name() == REMBG_MODEL), None)
+            if session_class is None:
+                raise ValueError(f"Unknown rembg model: {REMBG_MODEL}")
+            _rembg_session = session_class(REMBG_MODEL, sess_opts)
+            _rembg_session_pid = os.getpid()
+    return _rembg_session
+
+def _to_pil_image(image):
+    if isinstance(image, Image.Image):
         return image
+    if isinstance(image, (bytes, bytearray)):
+        return Image.open(io.BytesIO(image))
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return Image.open(image)
+
+def remove_background(image):
+    """Removes background from the input image (PIL image, array, bytes or file path) using rembg."""
+    try:
+        image = _to_pil_image(image)
+        output_image = remove(image, session=get_rembg_session())
+        if not isinstance(output_image, Image.Image):
+            output_image = _to_pil_image(output_image)
+        return output_image
     except Exception as e:
-        print(f"Error removing background from {image_path}: {e}")
-        return Image.open(image_path).convert("RGB") # Return original image on error
-
-def get_dominant_color_kmeans(image, resize_size=(300, 300), k=3):
-    """Extracts the dominant color using K-Means clustering, ignoring shadows and transparency."""
+        logger.warning(f"Error removing background: {e}")
+        try:
+            return _to_pil_image(image).convert("RGB") # Return original image on error
+        except Exception:
+            return None
+
+def remove_backgrounds(images):
+    """Removes the background from a batch of in-memory images, reusing one rembg session."""
+    with span("remove_background", items=len(images)):
+        return [remove_background(image) for image in images]
+
+def _cluster_kmeans(pixels, k):
+    """Full K-Means with 10 initializations (the original extractor)."""
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_, np.bincount(kmeans.labels_, minlength=k)
+
+def _cluster_minibatch(pixels, k):
+    """Mini-batch K-Means; close to K-Means on color data at a fraction of the cost."""
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=2048)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_, np.bincount(kmeans.labels_, minlength=k)
+
+def _cluster_histogram(pixels, k, bits=3):
+    """Quantizes each channel to 2**bits levels and returns the mean color of the k most populated bins."""
+    shift = 8 - bits
+    quantized = (pixels >> shift).astype(np.int32)
+    bins = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    counts = np.bincount(bins, minlength=1 << (3 * bits))
+    top_bins = np.argsort(counts)[::-1][:k]
+    top_bins = top_bins[counts[top_bins] > 0]
+    sums = np.stack([np.bincount(bins, weights=pixels[:, channel], minlength=counts.size) for channel in range(3)], axis=1)
+    return sums[top_bins] / counts[top_bins, None], counts[top_bins]
+
+# Pluggable clustering strategies: name -> fn(pixels (N, 3) uint8, k) -> (centers (k, 3), counts (k,))
+COLOR_STRATEGIES = {
+    "kmeans": _cluster_kmeans,
+    "minibatch": _cluster_minibatch,
+    "histogram": _cluster_histogram,
+}
+
+def register_color_strategy(name, fn):
+    """Registers a clustering strategy usable by get_color_palette."""
+    COLOR_STRATEGIES[name] = fn
+
+def _valid_color_pixels(image, resize_size=(300, 300), max_pixels=20000):
+    """Returns the non-transparent, non-shadow pixels of the image as an (N, 3) uint8 array."""
+    img = image.convert("RGBA")  # Ensure image has alpha channel
+    img = img.resize(resize_size)
+    rgba = np.asarray(img).reshape(-1, 4)  # view over the decoded buffer, no per-pixel Python objects
+
+    # Keep non-transparent pixels and drop dark/shadow pixels (R+G+B > 150)
+    mask = (rgba[:, 3] > 0) & (rgba[:, :3].sum(axis=1, dtype=np.uint16) > 150)
+    pixels = rgba[mask, :3]
+
+    if max_pixels and len(pixels) > max_pixels:
+        # Fixed seed so the same image always yields the same palette
+        rng = np.random.default_rng(42)
+        pixels = pixels[rng.choice(len(pixels), size=max_pixels, replace=False)]
+    return pixels
+
+def get_color_palette(image, resize_size=(300, 300), k=3, strategy="minibatch", max_pixels=20000):
+    """
+    Extracts up to k palette colors, ignoring shadows and transparency.
+    Returns a list of ((r, g, b), weight) sorted by weight, where weight is the share of valid pixels.
+    """
+    pixels = _valid_color_pixels(image, resize_size, max_pixels)
+    if len(pixels) == 0:
+        return []
+
+    k = min(k, len(np.unique(pixels, axis=0)))
+    centers, counts = COLOR_STRATEGIES[strategy](pixels, k)
+    order = np.argsort(counts)[::-1]
+    total = counts.sum()
+    return [(tuple(int(c) for c in centers[i]), float(counts[i] / total)) for i in order if counts[i] > 0]
+
+def get_dominant_color_kmeans(image, resize_size=(300, 300), k=3, strategy="minibatch", max_pixels=20000):
+    """Extracts the dominant color by clustering, ignoring shadows and transparency."""
     try:
-        img = image.convert("RGBA")  # Ensure image has alpha channel
-        img = img.resize(resize_size)
-        pixels = np.array(img.getdata())
-
-        # Keep only non-transparent pixels
-        pixels = np.array([rgb[:3] for rgb in pixels if rgb[3] > 0])
-
-        # Remove dark/shadow pixels
-        pixels = np.array([rgb for rgb in pixels if sum(rgb) > 150])  # R+G+B > 150
-
-        if len(pixels) == 0:
-            print("No valid color pixels found!")
+        palette = get_color_palette(image, resize_size, k, strategy, max_pixels)
+        if not palette:
+            logger.warning("No valid color pixels found!")
             return (0, 0, 0)
-
-        # Apply K-Means to find dominant colors
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        kmeans.fit(pixels)
-        dominant_color = kmeans.cluster_centers_[np.argmax(np.bincount(kmeans.labels_))]
-        return tuple(map(int, dominant_color))  # Convert to integer RGB
+        return palette[0][0]  # Integer RGB of the most populated cluster
     except Exception as e:
-        print(f"Error processing image: {e}")
+        logger.error(f"Error processing image: {e}")
         return None
 
+def score_label_heads(image_features, text_features, slices, label_sets):
+    """Scores normalized image features against every label head in one matmul and returns the argmax labels per image."""
+    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    # Softmax over logit_scale * cosine is monotonic, so argmax of the raw cosine gives the same labels
+    similarity = (image_features @ text_features.T).cpu()
+    predictions = []
+    for row in similarity:
+        predictions.append(tuple(labels[row[s].argmax().item()] for labels, s in zip(label_sets, slices)))
+    return predictions
+
+def map_category(clothing_type):
+    """Maps a clothing type to its broader category."""
+    return "Top" if clothing_type in tops else "Bottom" if clothing_type in bottoms else "Dress" if clothing_type in dresses else "Footwear" if clothing_type in footwear else "Other"
+
+def to_rgb_image(image):
+    """Converts a PIL image or an HxWxC array to an RGB PIL image."""
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    return Image.fromarray(np.asarray(image, dtype=np.uint8)).convert("RGB")
+
+def classify_images_clip(images, processor, model, clothing_types, occasions, seasons, materials, device="cpu", batch_size=16, return_embeddings=False):
+    """
+    Classifies a list of PIL images or arrays, running the vision tower in batches of batch_size.
+    Returns one (clothing_type, category, occasion, season, material, dominant_color) tuple per input;
+    images that fail get a tuple of Nones. With return_embeddings=True, also returns the list of
+    normalized image embeddings (numpy arrays, None for failures).
+    """
+    results = [(None, None, None, None, None, None)] * len(images)
+    embeddings = [None] * len(images)
+    label_sets = (clothing_types, occasions, seasons, materials)
+    text_features, slices = label_bank.get(processor, model, label_sets, device=device)
+
+    rgb_images = []
+    for index, image in enumerate(images):
+        try:
+            rgb_images.append(to_rgb_image(image))
+        except Exception as e:
+            logger.error(f"Error converting image {index}: {e}")
+            rgb_images.append(None)
+
+    valid_indices = [index for index, image in enumerate(rgb_images) if image is not None]
+    for start in range(0, len(valid_indices), max(1, batch_size)):
+        batch_indices = valid_indices[start:start + max(1, batch_size)]
+        try:
+            with span("preprocess", items=len(batch_indices)):
+                image_inputs = processor(images=[rgb_images[index] for index in batch_indices], return_tensors="pt").to(device)
+            with span("clip_forward", items=len(batch_indices)), inference_context(device):
+                image_features = as_float(model.get_image_features(**image_inputs))
+            # All label heads are scored by one matmul, so they share a span
+            with span("label_heads", items=len(batch_indices), heads=len(label_sets)):
+                predictions = score_label_heads(image_features, text_features, slices, label_sets)
+            if return_embeddings:
+                normalized = (image_features / image_features.norm(dim=-1, keepdim=True)).cpu().numpy()
+                for index, embedding in zip(batch_indices, normalized):
+                    embeddings[index] = embedding
+        except Exception as e:
+            logger.error(f"Error classifying batch of {len(batch_indices)} images: {e}")
+            continue
+
+        background_removed_images = remove_backgrounds([rgb_images[index] for index in batch_indices])
+        for index, (clothing_type, occasion, season, material), background_removed_image in zip(batch_indices, predictions, background_removed_images):
+            try:
+                # Extract dominant color
+                with span("dominant_color", items=1):
+                    dominant_color = get_dominant_color_kmeans(background_removed_image)
+                results[index] = (clothing_type, map_category(clothing_type), occasion, season, material, dominant_color)
+            except Exception as e:
+                logger.error(f"Error extracting color for image {index}: {e}")
+    if return_embeddings:
+        return results, embeddings
+    return results
+
 def classify_image_clip(image_path, processor, model, clothing_types, occasions, seasons, materials, device="cpu"):
     """
     Classifies an image using the FashionCLIP model.
+    The image is encoded once and scored against the cached label embedding bank in a single matrix multiply.
     """
     try:
-        image = Image.open(image_path).convert("RGB")
-
-        # Classify clothing type
-        inputs = processor(text=clothing_types, images=image, return_tensors="pt", padding=True).to(device)
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits_per_image, dim=1).cpu()
-        clothing_type = clothing_types[probs.argmax().item()]
-
-        # Classify occasion
-        inputs = processor(text=occasions, images=image, return_tensors="pt", padding=True).to(device)
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits_per_image, dim=1).cpu()
-        occasion = occasions[probs.argmax().item()]
-
-        # Classify season
-        inputs = processor(text=seasons, images=image, return_tensors="pt", padding=True).to(device)
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits_per_image, dim=1).cpu()
-        season = seasons[probs.argmax().item()]
-
-        # Detect material
-        inputs = processor(text=materials, images=image, return_tensors="pt", padding=True).to(device)
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits_per_image, dim=1).cpu()
-        material = materials[probs.argmax().item()]
-
-        # Map clothing type to broader category
-        category = "Top" if clothing_type in tops else "Bottom" if clothing_type in bottoms else "Dress" if clothing_type in dresses else "Footwear" if clothing_type in footwear else "Other"
-
-        # Extract dominant color
-        background_removed_image = remove_background(image_path)
-        dominant_color = get_dominant_color_kmeans(background_removed_image)
-
-        image.close() # Explicitly close the image
-        return clothing_type, category, occasion, season, material, dominant_color
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+        return classify_images_clip([image], processor, model, clothing_types, occasions, seasons, materials, device=device)[0]
     except Exception as e:
-        print(f"Error processing {image_path}: {e}")
-        return None, None, None, None, None, None
\ No newline at end of file
+        logger.error(f"Error processing {image_path}: {e}")
+        return None, None, None, None, None, None
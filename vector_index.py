@@ -0,0 +1,333 @@
+# vector_index.py
+import contextlib
+import heapq
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.getcwd(), "files", "index")
+# Width of the stored id strings (content hashes are 64 hex characters)
+ID_DTYPE = "<U64"
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=10, seed=0, chunk_size=65536):
+    """Clusters unit vectors by cosine similarity; returns (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].astype(np.float32)
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Reseed empty lists with random members so every list stays in use
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return centroids, assignments
+
+
+@contextlib.contextmanager
+def _save_lock(path):
+    """Serializes the version swap of concurrent saves to one index, across workers and threads."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _version_stamp(name, entry):
+    """Save time of a version directory written by VectorIndex.save() for `name`; None for other entries."""
+    prefix = f"{name}.v"
+    if not entry.startswith(prefix):
+        return None
+    stamp = entry[len(prefix):].partition("-")[0]
+    return int(stamp) if stamp.isdigit() else None
+
+
+class IndexPartition:
+    """
+    Item vectors of one (category, occasion, season) partition. Small partitions are searched exactly;
+    large ones carry an inverted-file (IVF) layout: vectors are grouped by their nearest k-means centroid,
+    stored contiguously per list (offsets[i]:offsets[i + 1]), and a search only scans the nprobe lists
+    whose centroids score highest against the query.
+    """
+
+    def __init__(self, key, ids, vectors, centroids=None, offsets=None):
+        self.key = key
+        self.ids = ids
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.mean = np.asarray(vectors.mean(axis=0), dtype=np.float32) if len(vectors) else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def is_ivf(self):
+        return self.centroids is not None
+
+    @classmethod
+    def build(cls, key, ids, vectors, ivf_min_size=2048, seed=0):
+        ids = np.asarray(ids, dtype=ID_DTYPE)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(ids) < ivf_min_size:
+            return cls(key, ids, vectors)
+        n_lists = min(1024, max(2, int(np.sqrt(len(ids)))))
+        centroids, assignments = spherical_kmeans(vectors, n_lists, seed=seed)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))]).astype(np.int64)
+        return cls(key, ids[order], vectors[order], centroids, offsets)
+
+    def assignments(self):
+        """IVF list of every stored vector."""
+        return np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+
+    def updated(self, ids, vectors, remove=()):
+        """
+        A copy without the ids in remove and with the given vectors added. An IVF partition keeps its
+        centroids and files each new vector under its nearest one, so no k-means runs; the lists drift from
+        optimal as items are added, which a periodic full rebuild corrects.
+        """
+        keep = ~np.isin(self.ids, np.asarray(list(remove), dtype=ID_DTYPE)) if len(remove) else np.ones(len(self), bool)
+        ids = np.concatenate([np.asarray(self.ids)[keep], np.asarray(ids, dtype=ID_DTYPE)])
+        vectors = np.concatenate([np.asarray(self.vectors)[keep], np.asarray(vectors, dtype=np.float32).reshape(-1, self.vectors.shape[1])])
+        if not self.is_ivf:
+            return IndexPartition(self.key, ids, vectors)
+        assignments = np.concatenate([self.assignments()[keep], np.argmax(vectors[keep.sum():] @ self.centroids.T, axis=1)])
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))]).astype(np.int64)
+        return IndexPartition(self.key, ids[order], vectors[order], self.centroids, offsets)
+
+    def candidate_positions(self, query, nprobe):
+        """Positions to scan for a query: all of them, or the members of the nprobe best IVF lists."""
+        if not self.is_ivf or nprobe >= len(self.centroids):
+            return None
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+
+    def search(self, query, k, nprobe):
+        """Returns (scores, positions) of the k vectors with the highest inner product with query."""
+        positions = self.candidate_positions(query, nprobe)
+        vectors = self.vectors if positions is None else self.vectors[positions]
+        scores = vectors @ query
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], (top if positions is None else positions[top])
+
+
+class VectorIndex:
+    """
+    Inner-product index over wardrobe item embeddings, partitioned by (category, occasion, season) so
+    filtered queries only touch matching items. Partitions of at least ivf_min_size items are searched
+    approximately through an IVF layout (about sqrt(n) lists, nprobe of them scanned per query);
+    smaller ones exactly. save() writes plain .npy files that load() memory-maps, so worker processes
+    share one copy of the vectors through the page cache.
+    """
+
+    def __init__(self, partitions=None, dim=None, nprobe=16, metadata=None):
+        self.partitions = partitions or {}
+        self.dim = dim
+        self.nprobe = nprobe
+        self.metadata = metadata or {}
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.partitions.values())
+
+    @classmethod
+    def build(cls, items, ivf_min_size=2048, nprobe=16, seed=0, metadata=None):
+        """Builds an index from (item_id, category, occasion, season, embedding) tuples."""
+        grouped = {}
+        for item_id, category, occasion, season, embedding in items:
+            ids, vectors = grouped.setdefault((category, occasion, season), ([], []))
+            ids.append(item_id)
+            vectors.append(embedding)
+        partitions = {}
+        dim = None
+        for key, (ids, vectors) in grouped.items():
+            vectors = _normalize_rows(np.stack(vectors).astype(np.float32))
+            dim = vectors.shape[1]
+            partitions[key] = IndexPartition.build(key, ids, vectors, ivf_min_size=ivf_min_size, seed=seed)
+        return cls(partitions, dim=dim, nprobe=nprobe, metadata=metadata)
+
+    def upsert(self, items):
+        """
+        Adds (item_id, category, occasion, season, embedding) tuples, replacing earlier entries for the same
+        ids (which may sit in another partition if the item was reclassified). Only the affected partitions
+        are copied, and the partition map is swapped in one assignment, so concurrent searches see either the
+        old or the new index. Returns the number of items upserted.
+        """
+        grouped = {}
+        for item_id, category, occasion, season, embedding in items:
+            ids, vectors = grouped.setdefault((category, occasion, season), ([], []))
+            ids.append(item_id)
+            vectors.append(embedding)
+        if not grouped:
+            return 0
+        upserted = [item_id for ids, _ in grouped.values() for item_id in ids]
+        partitions = dict(self.partitions)
+        for key, partition in self.partitions.items():
+            if key not in grouped and np.isin(partition.ids, np.asarray(upserted, dtype=ID_DTYPE)).any():
+                partitions[key] = partition.updated([], [], remove=upserted)
+        for key, (ids, vectors) in grouped.items():
+            vectors = _normalize_rows(np.stack(vectors).astype(np.float32))
+            self.dim = self.dim or vectors.shape[1]
+            if key in partitions:
+                partitions[key] = partitions[key].updated(ids, vectors, remove=upserted)
+            else:
+                partitions[key] = IndexPartition(key, np.asarray(ids, dtype=ID_DTYPE), vectors)
+        self.partitions = {key: partition for key, partition in partitions.items() if len(partition)}
+        return len(upserted)
+
+    def matching(self, category=None, occasion=None, season=None):
+        """Partitions matching the filters; None matches any value."""
+        return [
+            partition for key, partition in self.partitions.items()
+            if all(wanted is None or wanted == value for wanted, value in zip((category, occasion, season), key))
+        ]
+
+    def mean(self, category=None, occasion=None, season=None):
+        """Mean vector of the matching items, or None when no item matches."""
+        partitions = [partition for partition in self.matching(category, occasion, season) if len(partition)]
+        if not partitions:
+            return None
+        weights = np.array([len(partition) for partition in partitions], dtype=np.float32)
+        return (np.stack([partition.mean for partition in partitions]) * weights[:, None]).sum(axis=0) / weights.sum()
+
+    def search(self, query, k=10, category=None, occasion=None, season=None, nprobe=None):
+        """
+        Returns up to k (score, item_id, vector) results with the highest inner product with query,
+        best first, over the partitions matching the filters.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = nprobe or self.nprobe
+        results = []
+        for partition in self.matching(category, occasion, season):
+            scores, positions = partition.search(query, k, nprobe)
+            results.extend((float(score), str(partition.ids[position]), partition.vectors[position])
+                           for score, position in zip(scores, positions))
+        return heapq.nlargest(k, results, key=lambda result: result[0])
+
+    def stats(self):
+        return {
+            "items": len(self),
+            "partitions": len(self.partitions),
+            "ivf_partitions": sum(partition.is_ivf for partition in self.partitions.values()),
+            "dim": self.dim,
+            "nprobe": self.nprobe,
+        }
+
+    def save(self, directory):
+        """
+        Writes the index as a manifest plus .npy files into a new version directory next to `directory`, then
+        atomically repoints the `directory` symlink at it, so a concurrent load() finds the old index or the
+        new one, never none, and concurrent saves never write into the same files. The version that was
+        current until now is kept for readers still loading it; older ones are removed.
+        """
+        parent, name = os.path.split(os.path.abspath(directory))
+        # Unique per save, so saves from other workers or threads never write into the same files
+        token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = os.path.join(parent, f"{name}.{token}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        manifest = {"dim": self.dim, "nprobe": self.nprobe, "metadata": self.metadata, "partitions": []}
+        for number, partition in enumerate(self.partitions.values()):
+            prefix = f"p{number}"
+            np.save(os.path.join(tmp_dir, f"{prefix}.ids.npy"), np.asarray(partition.ids))
+            np.save(os.path.join(tmp_dir, f"{prefix}.vectors.npy"), np.asarray(partition.vectors))
+            if partition.is_ivf:
+                np.save(os.path.join(tmp_dir, f"{prefix}.centroids.npy"), partition.centroids)
+                np.save(os.path.join(tmp_dir, f"{prefix}.offsets.npy"), partition.offsets)
+            manifest["partitions"].append({"key": list(partition.key), "prefix": prefix, "size": len(partition),
+                                           "ivf": partition.is_ivf})
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        path = os.path.join(parent, name)
+        with _save_lock(path):
+            # Only complete indexes get a version name, so cleanup never removes one that is still being written,
+            # and stamps taken under the lock grow with every swap, so the current version is always the newest
+            version = f"{name}.v{time.time_ns()}-{token}"
+            os.replace(tmp_dir, os.path.join(parent, version))
+
+            previous = os.readlink(path) if os.path.islink(path) else None
+            if os.path.isdir(path) and previous is None:
+                # A plain directory from before versioned saves, which a symlink cannot replace: move it aside first
+                aside = os.path.join(parent, f"{name}.{token}.old")
+                os.replace(path, aside)
+                shutil.rmtree(aside, ignore_errors=True)
+            link = os.path.join(parent, f"{name}.{token}.link")
+            os.symlink(version, link)
+            os.replace(link, path)
+
+            # Readers that still map the removed files keep them alive until they let go
+            previous_stamp = _version_stamp(name, previous) if previous is not None else None
+            if previous_stamp is not None:
+                for entry in os.listdir(parent):
+                    stamp = _version_stamp(name, entry)
+                    if stamp is not None and stamp < previous_stamp:
+                        shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """Loads an index written by save(), memory-mapping its vectors; returns None if there is none."""
+        while True:
+            # Resolved once per attempt, so every file comes from the same version even if a save repoints the link
+            version = os.path.realpath(directory)
+            manifest_path = os.path.join(version, "manifest.json")
+            try:
+                if not os.path.exists(manifest_path):
+                    raise FileNotFoundError(manifest_path)
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                partitions = {}
+                for entry in manifest["partitions"]:
+                    path = os.path.join(version, entry["prefix"])
+                    key = tuple(entry["key"])
+                    partitions[key] = IndexPartition(
+                        key,
+                        np.load(f"{path}.ids.npy", mmap_mode="r"),
+                        np.load(f"{path}.vectors.npy", mmap_mode="r"),
+                        np.load(f"{path}.centroids.npy") if entry["ivf"] else None,
+                        np.load(f"{path}.offsets.npy") if entry["ivf"] else None,
+                    )
+            except Exception as e:
+                if os.path.realpath(directory) != version:
+                    # Newer saves replaced (and cleaned up) this version while it was being read
+                    continue
+                if not isinstance(e, FileNotFoundError) or os.path.exists(version):
+                    logger.warning(f"Discarding unreadable vector index {version}: {e}")
+                return None
+            break
+        return cls(partitions, dim=manifest["dim"], nprobe=manifest["nprobe"], metadata=manifest.get("metadata"))